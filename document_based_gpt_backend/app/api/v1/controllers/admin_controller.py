@@ -0,0 +1,118 @@
+# Import asyncio to run blocking work off the event loop
+import asyncio
+
+# Import necessary modules from FastAPI for error handling
+from fastapi import HTTPException, status
+
+# Import PlainTextResponse to return profiles as downloadable collapsed-stack files
+from fastapi.responses import PlainTextResponse
+
+# Import the moderation matchers, which can be reloaded at runtime
+from app.utils.moderation_util import moderation_matchers
+
+# Import the sampling profiler of the process
+from app.utils.profiler_util import profiler
+
+# Import the ring buffer holding the traces of the slow requests
+from app.utils.trace_util import slow_requests
+
+
+class AdminController:
+    """
+    AdminController handles administrative operations on the running service,
+    such as reloading the moderation wordlists or profiling it.
+    """
+
+    @staticmethod
+    async def reload_moderation_wordlists():
+        """
+        Recompiles the profanity and negative-phrase matchers from their configured wordlists.
+
+        Returns:
+            dict: The number of profane words and negative phrases loaded.
+
+        Raises:
+            HTTPException: Raises a 500 Internal Server Error if a wordlist cannot be loaded;
+                the previous matchers then stay in use.
+        """
+        try:
+            # Compiling the automaton is CPU-bound, so it runs in a worker thread
+            return await asyncio.to_thread(moderation_matchers.reload)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    @staticmethod
+    async def start_profiler(seconds: float, interval_ms: float, idle: bool):
+        """
+        Starts the sampling profiler for `seconds`.
+
+        Returns:
+            dict: The state of the profiler.
+
+        Raises:
+            HTTPException: Raises a 400 error for an invalid duration or interval, and a 409 Conflict error
+                if a profile is already running.
+        """
+        try:
+            return profiler.start(seconds, interval_ms, idle)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    @staticmethod
+    async def stop_profiler():
+        """
+        Stops the running profile, if any, and returns it (see `get_profile`).
+        """
+        # Waiting for the profiler thread's last sample blocks, so it runs in a worker thread
+        await asyncio.to_thread(profiler.stop)
+        return await AdminController.get_profile()
+
+    @staticmethod
+    async def get_profiler_status():
+        """
+        Returns the state of the profiler and the summary of the current or last profile.
+        """
+        return profiler.status()
+
+    @staticmethod
+    async def get_profile():
+        """
+        Returns the current (partial) or last profile as a collapsed-stack file.
+
+        Returns:
+            PlainTextResponse: One `frame;frame;frame count` line per distinct stack.
+
+        Raises:
+            HTTPException: Raises a 404 Not Found error if no profile was recorded yet.
+        """
+        profile_status = profiler.status()
+        if profile_status["started_at"] is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No profile was recorded yet")
+        return PlainTextResponse(
+            profiler.collapsed(),
+            headers={
+                "Content-Disposition": 'attachment; filename="profile.folded"',
+                "X-Profile-Samples": str(profile_status["samples"]),
+                "X-Profile-Running": str(profile_status["running"]).lower(),
+            },
+        )
+
+    @staticmethod
+    async def get_slow_requests(limit: int = None, endpoint: str = None):
+        """
+        Returns the traces of the recent requests slower than `SLOW_REQUEST_THRESHOLD_MS`, most recent first.
+
+        Args:
+            limit (int, optional): Maximum number of requests returned.
+            endpoint (str, optional): Only return the requests of this endpoint (e.g. "/v1/query/ask/").
+
+        Returns:
+            dict: The threshold, the buffer capacity and the slow requests.
+        """
+        return {
+            "threshold_ms": slow_requests.threshold_ms,
+            "capacity": slow_requests.capacity,
+            "requests": slow_requests.list(limit, endpoint),
+        }
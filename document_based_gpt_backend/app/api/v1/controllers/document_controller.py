@@ -2,8 +2,17 @@
 
 # Importing HTTPException for error handling, UploadFile for file upload handling, and status for HTTP status codes
 from fastapi import HTTPException, UploadFile, status
-# Importing the service function responsible for document upload and processing
-from app.services.document_service import add_document
+# Importing Response for the bodiless 304 Not Modified responses
+from fastapi import Response
+# Importing configuration values such as the cache lifetime of chunks
+from app.core import config
+# Importing the service functions responsible for document upload and processing
+from app.services.document_service import (
+    add_document, create_upload_session, get_upload_session, append_upload_chunk,
+    complete_upload_session, abort_upload_session, list_collections, get_chunk
+)
+# Importing the orjson response class and the entity tag helpers for cacheable chunk responses
+from app.utils.response_util import FastJSONResponse, content_etag, etag_matches
 
 
 class DocumentController:
@@ -13,23 +22,171 @@ class DocumentController:
     """
 
     @staticmethod
-    async def upload_document(file: UploadFile):
+    async def upload_document(file: UploadFile, current_user: dict = None, tags: str = None, collection: str = None):
         """
         Uploads a document to the vector store and updates the stored index for querying.
 
         Args:
             file (UploadFile): The file to be uploaded, expected to be a text document.
+            current_user (dict, optional): The uploading user, recorded in the document's metadata.
+            tags (str, optional): Comma-separated tags recorded in the document's metadata.
+            collection (str, optional): The collection the document is added to, or the default one.
 
         Returns:
             dict: A response message indicating that the document was uploaded and indexed successfully.
 
         Raises:
-            HTTPException: Raises a 500 Internal Server Error if there's an issue while uploading or processing the document.
+            HTTPException: Raises a 400 or 413 error for an invalid filename or collection name or an oversized file,
+                and a 500 Internal Server Error if there's an issue while uploading or processing the document.
         """
         try:
             # Call the add_document service function to handle document upload and processing
-            response = await add_document(file)
+            response = await add_document(file, current_user, tags, collection)
             return response
+        except HTTPException:
+            raise
         except Exception as e:
             # Raise HTTP 500 Internal Server Error if an issue occurs while processing the file upload
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    @staticmethod
+    async def create_upload_session(filename: str, current_user: dict = None, collection: str = None):
+        """
+        Starts a resumable upload session.
+
+        Args:
+            filename (str): Name of the document to be uploaded.
+            current_user (dict, optional): The uploading user.
+            collection (str, optional): The collection the document is added to, or the default one.
+
+        Returns:
+            dict: The upload id, the current offset and the upload limits.
+
+        Raises:
+            HTTPException: Raises a 400 error for an invalid filename or collection name, or a 500 Internal Server Error.
+        """
+        try:
+            return create_upload_session(filename, current_user, collection)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    @staticmethod
+    async def get_upload_session(upload_id: str, current_user: dict = None):
+        """
+        Returns the state of a resumable upload session.
+
+        Raises:
+            HTTPException: Raises a 404 error if the session does not exist.
+        """
+        return get_upload_session(upload_id, current_user)
+
+    @staticmethod
+    async def append_upload_chunk(upload_id: str, offset: int, chunks, current_user: dict = None):
+        """
+        Appends a chunk of data to a resumable upload session.
+
+        Args:
+            upload_id (str): The upload session id.
+            offset (int): The offset the chunk starts at.
+            chunks (AsyncIterator[bytes]): The request body.
+            current_user (dict, optional): The uploading user.
+
+        Returns:
+            dict: The session state with the new offset.
+
+        Raises:
+            HTTPException: Raises a 404, 409 or 413 error for an unknown session, an offset mismatch or an
+                oversized upload, and a 500 Internal Server Error if the chunk cannot be stored.
+        """
+        try:
+            return await append_upload_chunk(upload_id, offset, chunks, current_user)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    @staticmethod
+    async def complete_upload_session(upload_id: str, current_user: dict = None, tags: str = None):
+        """
+        Completes a resumable upload session and indexes the document.
+
+        Args:
+            upload_id (str): The upload session id.
+            current_user (dict, optional): The uploading user.
+            tags (str, optional): Comma-separated tags recorded in the document's metadata.
+
+        Returns:
+            dict: A response message indicating that the document was uploaded and indexed successfully.
+
+        Raises:
+            HTTPException: Raises a 404 error for an unknown session, or a 500 Internal Server Error
+                if there's an issue while processing the document.
+        """
+        try:
+            return await complete_upload_session(upload_id, current_user, tags)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    @staticmethod
+    async def abort_upload_session(upload_id: str, current_user: dict = None):
+        """
+        Aborts a resumable upload session.
+
+        Raises:
+            HTTPException: Raises a 404 error if the session does not exist.
+        """
+        return await abort_upload_session(upload_id, current_user)
+
+    @staticmethod
+    async def list_collections():
+        """
+        Lists the document collections and the state of their indexes.
+
+        Returns:
+            dict: The collections, with their index size, number of chunks and load time.
+
+        Raises:
+            HTTPException: Raises a 500 Internal Server Error if the collections cannot be listed.
+        """
+        try:
+            return await list_collections()
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    @staticmethod
+    async def get_chunk(chunk_id: str, collection: str = None, if_none_match: str = None):
+        """
+        Returns a chunk with the caching headers letting clients fetch its text once and reuse it.
+
+        The response carries an ETag derived from the chunk's content and a private `Cache-Control` lifetime of
+        `CHUNK_CACHE_MAX_AGE_SECONDS`. A request whose If-None-Match header holds the current ETag gets
+        `304 Not Modified` without a body.
+
+        Args:
+            chunk_id (str): The `chunk_id` of a search result or answer source.
+            collection (str, optional): The collection holding the chunk, or the default one.
+            if_none_match (str, optional): The If-None-Match header of the request.
+
+        Returns:
+            Response: The chunk as JSON, or an empty 304 response.
+
+        Raises:
+            HTTPException: Raises a 400 or 404 error for an invalid collection name or an unknown collection or
+                chunk, and a 500 Internal Server Error if the chunk cannot be read.
+        """
+        try:
+            chunk = await get_chunk(chunk_id, collection)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+        etag = content_etag(chunk)
+        headers = {"ETag": etag, "Cache-Control": f"private, max-age={config.CHUNK_CACHE_MAX_AGE_SECONDS}"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return FastJSONResponse(chunk, headers=headers)
@@ -0,0 +1,19 @@
+# Import the application-wide metrics registry
+from app.utils.metrics_util import metrics
+
+
+class MetricsController:
+    """
+    MetricsController exposes the in-process metrics (counters, gauges and distributions)
+    collected by the service layer, such as prompt token counts.
+    """
+
+    @staticmethod
+    async def get_metrics():
+        """
+        Returns a snapshot of all collected metrics.
+
+        Returns:
+            dict: Counters, gauges and distribution summaries.
+        """
+        return metrics.snapshot()
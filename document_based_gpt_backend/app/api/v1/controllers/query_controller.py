@@ -1,9 +1,11 @@
 # Import necessary modules from FastAPI and the application
 from fastapi import HTTPException, status  # Importing HTTPException for error handling and status for HTTP status codes
+from fastapi.responses import StreamingResponse  # Streamed NDJSON batch results, returned as they are
 
 # Importing the service responsible for processing queries and schema for input validation
-from app.services.query_service import process_query  # The service layer function that handles the main logic for processing a query
-from app.schemas.query import AskQuery  # Pydantic model to validate the structure of the incoming query data
+from app.services.query_service import process_query, process_batch_query, process_search_query  # Service layer functions that handle the main logic for processing queries
+from app.schemas.query import AskQuery, BatchAskQuery, SearchQuery  # Pydantic models to validate the structure of the incoming query data
+from app.utils.response_util import FastJSONResponse  # orjson responses, skipping FastAPI's jsonable_encoder pass
 
 
 class QueryController:
@@ -14,23 +16,74 @@ class QueryController:
     """
 
     @staticmethod
-    async def ask_question(query_data: AskQuery):
+    async def ask_question(query_data: AskQuery, current_user: dict):
         """
         Handles the query processing by sending the query to the vector store for retrieving relevant information.
 
         Args:
             query_data (AskQuery): The validated query data provided by the user, containing the question to be processed.
+            current_user (dict): The authenticated user asking the question.
 
         Returns:
-            dict: A response object containing the answer to the query and relevant source documents.
+            FastJSONResponse: The answer to the query and relevant source documents, serialized with orjson.
 
         Raises:
-            HTTPException: Raises a 500 Internal Server Error if there's an issue while processing the query.
+            HTTPException: Re-raises HTTP errors from the service layer (e.g. 429 when the request is shed), or raises
+                a 500 Internal Server Error if there's an issue while processing the query.
         """
         try:
             # Call the process_query service function to handle query processing and retrieve relevant information
-            response = await process_query(query_data)
-            return response
+            response = await process_query(query_data, current_user)
+            return FastJSONResponse(response)
+        except HTTPException:
+            raise
         except Exception as e:
             # Raise HTTP 500 Internal Server Error if an issue occurs while processing the query
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    @staticmethod
+    async def ask_batch(batch_data: BatchAskQuery, current_user: dict):
+        """
+        Handles a batch of queries with a single batched embedding call and index search.
+
+        Args:
+            batch_data (BatchAskQuery): The validated batch of queries and its options.
+            current_user (dict): The authenticated user sending the batch.
+
+        Returns:
+            FastJSONResponse or StreamingResponse: The results in query order, or an NDJSON stream of results.
+
+        Raises:
+            HTTPException: Re-raises HTTP errors from the service layer, or raises a 500 Internal Server Error
+                if there's an issue while processing the batch.
+        """
+        try:
+            response = await process_batch_query(batch_data, current_user)
+            return response if isinstance(response, StreamingResponse) else FastJSONResponse(response)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    @staticmethod
+    async def search(search_data: SearchQuery, current_user: dict):
+        """
+        Handles a retrieval-only search, returning ranked chunks without running the LLM.
+
+        Args:
+            search_data (SearchQuery): The validated search query and its options.
+            current_user (dict): The authenticated user searching.
+
+        Returns:
+            FastJSONResponse: A page of scored chunks.
+
+        Raises:
+            HTTPException: Re-raises HTTP errors from the service layer, or raises a 500 Internal Server Error
+                if there's an issue while searching.
+        """
+        try:
+            return FastJSONResponse(await process_search_query(search_data, current_user))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -0,0 +1,151 @@
+# Import necessary modules from FastAPI
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+# Import the AdminController to handle administrative actions
+from app.api.v1.controllers.admin_controller import AdminController
+
+# Import schemas for request validation
+from app.schemas.admin import ProfileStart
+
+# Import utility function to verify admin user access
+from app.utils.auth_util import is_admin_user
+
+# Initialize the router for handling admin endpoints
+router = APIRouter()
+
+
+@router.post("/moderation/reload")
+async def reload_moderation_wordlists(current_user: dict = Depends(is_admin_user)):
+    """
+    Reloads the profanity and negative-phrase wordlists without restarting the service.
+
+    Args:
+        current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
+
+    Returns:
+        dict: The number of words and phrases loaded.
+
+    Example:
+        POST /v1/admin/moderation/reload
+
+        Response:
+        { "profanity_words": 916, "negative_phrases": 14 }
+    """
+    return await AdminController.reload_moderation_wordlists()
+
+
+@router.post("/profiler/start")
+async def start_profiler(profile_data: ProfileStart, current_user: dict = Depends(is_admin_user)):
+    """
+    Starts a sampling profiler recording the Python stacks of every thread of the worker for `seconds`.
+
+    Sampling reads the threads' stacks from a background thread without instrumenting them, so it can be enabled
+    on a live worker; with the default 10 ms interval its overhead is a few percent of one core.
+
+    Args:
+        profile_data (ProfileStart): The duration of the profile, the sampling interval and whether to record the
+            threads waiting for work.
+        current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
+
+    Returns:
+        dict: The state of the profiler.
+
+    Example:
+        POST /v1/admin/profiler/start
+        JSON payload: { "seconds": 30, "interval_ms": 10 }
+
+        Response:
+        {
+            "running": true, "started_at": "2024-05-01T10:00:00+00:00", "stopped_at": null,
+            "settings": { "seconds": 30, "interval_ms": 10, "idle": false }, "samples": 1, "stacks": 3
+        }
+    """
+    return await AdminController.start_profiler(profile_data.seconds, profile_data.interval_ms, profile_data.idle)
+
+
+@router.post("/profiler/stop")
+async def stop_profiler(current_user: dict = Depends(is_admin_user)):
+    """
+    Stops the running profile before its end and returns it as a collapsed-stack file (see `/profiler/profile`).
+
+    Args:
+        current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
+    """
+    return await AdminController.stop_profiler()
+
+
+@router.get("/profiler")
+async def get_profiler_status(current_user: dict = Depends(is_admin_user)):
+    """
+    Returns whether a profile is running, and the number of samples and distinct stacks of the current or last one.
+
+    Args:
+        current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
+    """
+    return await AdminController.get_profiler_status()
+
+
+@router.get("/profiler/profile")
+async def get_profile(current_user: dict = Depends(is_admin_user)):
+    """
+    Returns the current (partial) or last profile in the collapsed stacks format read by flame graph tools
+    (flamegraph.pl, speedscope): one line per distinct stack, outermost frame (the thread name) first.
+
+    Args:
+        current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
+
+    Example:
+        GET /v1/admin/profiler/profile
+
+        Response (text/plain, profile.folded):
+        MainThread;run (runners.py:190);...;search_index (quantized_store.py:219) 42
+        asyncio_0;_worker (thread.py:83);...;invoke (base.py:280) 310
+    """
+    return await AdminController.get_profile()
+
+
+@router.get("/slow-requests")
+async def get_slow_requests(
+    limit: int = Query(50, ge=1),
+    endpoint: Optional[str] = None,
+    current_user: dict = Depends(is_admin_user)
+):
+    """
+    Returns the detailed traces of the recent requests slower than `SLOW_REQUEST_THRESHOLD_MS`, most recent first.
+
+    Each trace holds the request, its outcome, the total time of every stage and the timeline of the stage runs
+    (start offset, duration and thread), so the time of a latency spike can be attributed to a stage.
+
+    Args:
+        limit (int): Maximum number of requests returned.
+        endpoint (str, optional): Only return the requests of this endpoint (e.g. "/v1/query/ask/").
+        current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
+
+    Returns:
+        dict: The threshold, the buffer capacity and the slow requests.
+
+    Example:
+        GET /v1/admin/slow-requests?limit=1
+
+        Response:
+        {
+            "threshold_ms": 2000.0,
+            "capacity": 200,
+            "requests": [
+                {
+                    "ts": "2024-05-01T10:00:00+00:00", "query_id": "9b1f...", "endpoint": "/v1/query/ask/",
+                    "status": "ok", "total_ms": 3120.5,
+                    "timings_ms": { "moderation": 0.4, "embed": 180.2, "search": 3.1, "queue": 1450.0, "llm": 1480.3 },
+                    "coalesced": false, "unaccounted_ms": 6.5,
+                    "spans": [ { "stage": "moderation", "start_ms": 0.2, "duration_ms": 0.4, "thread": "MainThread" } ],
+                    "dropped_spans": 0,
+                    "hits": [ { "chunk_id": "4f9c...", "score": 0.31 } ],
+                    "request": { "query": "What is AI?" },
+                    "error": null
+                }
+            ]
+        }
+    """
+    return await AdminController.get_slow_requests(limit, endpoint)
@@ -1,23 +1,39 @@
 # Import necessary modules from FastAPI
-from fastapi import APIRouter, UploadFile, File, Depends
+from typing import Optional
+
+from fastapi import APIRouter, UploadFile, File, Form, Depends, Request, Header
 
 # Import the DocumentController to handle document-related actions
 from app.api.v1.controllers.document_controller import DocumentController
 
-# Import utility function to verify admin user access
-from app.utils.auth_util import is_admin_user
+# Import schemas for request validation
+from app.schemas.document import UploadSessionCreate, UploadSessionComplete
+
+# Import utility functions to verify user and admin user access
+from app.utils.auth_util import get_current_user, is_admin_user
 
 # Initialize the router for handling document endpoints
 router = APIRouter()
 
 
 @router.post("/upload/")
-async def upload_document(file: UploadFile = File(...), current_user: dict = Depends(is_admin_user)):
+async def upload_document(
+    file: UploadFile = File(...),
+    tags: Optional[str] = Form(None),
+    collection: Optional[str] = Form(None),
+    current_user: dict = Depends(is_admin_user)
+):
     """
     Uploads a document to the system and updates the vector store.
 
+    The file is streamed to disk and rejected with 413 once it exceeds `MAX_UPLOAD_BYTES`. A file whose content
+    is identical to an already indexed document is not indexed again.
+
     Args:
         file (UploadFile): The file to be uploaded, validated by FastAPI's UploadFile type.
+        tags (str, optional): Comma-separated tags stored with the document's chunks for filtered searches.
+        collection (str, optional): The collection the document is added to (created on its first upload);
+            the default collection if omitted.
         current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
 
     Returns:
@@ -25,10 +41,183 @@ async def upload_document(file: UploadFile = File(...), current_user: dict = Dep
 
     Example:
         POST /v1/document/upload/
-        Form data: { file: [File] }
+        Form data: { file: [File], tags: "hr,policies", collection: "hr" }
 
         Response:
         { "message": "Document 'filename.txt' added and vector store updated successfully." }
     """
     # Call the DocumentController to handle the file upload
-    return await DocumentController.upload_document(file)
+    return await DocumentController.upload_document(file, current_user, tags, collection)
+
+
+@router.post("/upload/sessions")
+async def create_upload_session(
+    session_data: UploadSessionCreate,
+    current_user: dict = Depends(is_admin_user)
+):
+    """
+    Starts a resumable upload for a large document.
+
+    Args:
+        session_data (UploadSessionCreate): The name of the document to be uploaded, and its collection.
+        current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
+
+    Returns:
+        dict: The upload id, the offset to send the first chunk at, and the upload limits.
+
+    Example:
+        POST /v1/document/upload/sessions
+        Request body: { "filename": "handbook.txt", "collection": "hr" }
+
+        Response:
+        {
+            "upload_id": "3f2c...", "filename": "handbook.txt", "collection": "hr", "offset": 0,
+            "chunk_size": 1048576, "max_size": 52428800
+        }
+    """
+    return await DocumentController.create_upload_session(
+        session_data.filename, current_user, session_data.collection
+    )
+
+
+@router.get("/upload/sessions/{upload_id}")
+async def get_upload_session(upload_id: str, current_user: dict = Depends(is_admin_user)):
+    """
+    Returns the state of a resumable upload, e.g. the offset to resume from after a failed chunk.
+
+    Example:
+        GET /v1/document/upload/sessions/3f2c...
+
+        Response:
+        { "upload_id": "3f2c...", "filename": "handbook.txt", "offset": 1048576, ... }
+    """
+    return await DocumentController.get_upload_session(upload_id, current_user)
+
+
+@router.put("/upload/sessions/{upload_id}")
+async def append_upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: dict = Depends(is_admin_user)
+):
+    """
+    Appends the raw request body to a resumable upload, at the given offset.
+
+    Args:
+        upload_id (str): The upload session id.
+        offset (int): The offset of the chunk; must equal the current offset of the upload (409 otherwise).
+        request (Request): The request, whose body is streamed to disk.
+        current_user (dict): The current authenticated user, automatically injected by the `is_admin_user` dependency.
+
+    Returns:
+        dict: The state of the upload with the new offset.
+
+    Example:
+        PUT /v1/document/upload/sessions/3f2c...?offset=0
+        Request body: [first 1048576 bytes of the file]
+
+        Response:
+        { "upload_id": "3f2c...", "filename": "handbook.txt", "offset": 1048576, ... }
+    """
+    return await DocumentController.append_upload_chunk(upload_id, offset, request.stream(), current_user)
+
+
+@router.post("/upload/sessions/{upload_id}/complete")
+async def complete_upload_session(
+    upload_id: str,
+    completion: UploadSessionComplete,
+    current_user: dict = Depends(is_admin_user)
+):
+    """
+    Completes a resumable upload and indexes the document.
+
+    Example:
+        POST /v1/document/upload/sessions/3f2c.../complete
+        Request body: { "tags": "hr,policies" }
+
+        Response:
+        { "message": "Document 'handbook.txt' added and vector store updated successfully." }
+    """
+    return await DocumentController.complete_upload_session(upload_id, current_user, completion.tags)
+
+
+@router.delete("/upload/sessions/{upload_id}")
+async def abort_upload_session(upload_id: str, current_user: dict = Depends(is_admin_user)):
+    """
+    Aborts a resumable upload and deletes the data received so far.
+
+    Example:
+        DELETE /v1/document/upload/sessions/3f2c...
+
+        Response:
+        { "message": "Upload of 'handbook.txt' aborted." }
+    """
+    return await DocumentController.abort_upload_session(upload_id, current_user)
+
+
+@router.get("/collections")
+async def list_collections(current_user: dict = Depends(get_current_user)):
+    """
+    Lists the document collections, with the size of their index and its load time.
+
+    Indexes are loaded on first use and the least recently used ones are unloaded beyond
+    `COLLECTION_MEMORY_BUDGET_BYTES`, so `load_ms` and `chunks` are only reported for the loaded ones.
+
+    Args:
+        current_user (dict): The current authenticated user, automatically injected by the `get_current_user` dependency.
+
+    Returns:
+        dict: The collections and the memory budget of the loaded indexes.
+
+    Example:
+        GET /v1/document/collections
+
+        Response:
+        {
+            "collections": [
+                { "name": "default", "loaded": true, "size_bytes": 1843210, "chunks": 412, "load_ms": 35.2, "in_use": 0 },
+                { "name": "hr", "loaded": false, "size_bytes": 98012, "chunks": null, "load_ms": null, "in_use": 0 }
+            ],
+            "memory_budget_bytes": 1073741824
+        }
+    """
+    return await DocumentController.list_collections()
+
+
+@router.get("/chunk/{chunk_id}")
+async def get_chunk(
+    chunk_id: str,
+    collection: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Returns the text of a chunk by its id, e.g. the source of an answer asked with `compact_sources`.
+
+    Responses carry an ETag and may be reused for `CHUNK_CACHE_MAX_AGE_SECONDS`; after that, sending the ETag back
+    in If-None-Match returns `304 Not Modified` while the chunk is unchanged.
+
+    Args:
+        chunk_id (str): The `chunk_id` of a search result or answer source.
+        collection (str, optional): The collection holding the chunk; the default collection if omitted.
+        if_none_match (str, optional): The ETag of the copy held by the client.
+        current_user (dict): The current authenticated user, automatically injected by the `get_current_user` dependency.
+
+    Returns:
+        dict: The chunk's id, collection, source, index, text and near-duplicate sources.
+
+    Example:
+        GET /v1/document/chunk/4f9c...?collection=hr
+
+        Response (ETag: "5d41402abc4b2a76b9719d911017c592", Cache-Control: private, max-age=3600):
+        {
+            "chunk_id": "4f9c...",
+            "collection": "hr",
+            "source": "app/Documents/collections/hr/handbook.txt",
+            "chunk_index": 3,
+            "text": "Content of the chunk...",
+            "duplicate_sources": []
+        }
+    """
+    return await DocumentController.get_chunk(chunk_id, collection, if_none_match)
@@ -0,0 +1,32 @@
+# Import necessary modules from FastAPI
+from fastapi import APIRouter
+
+# Import the MetricsController to expose the collected metrics
+from app.api.v1.controllers.metrics_controller import MetricsController
+
+# Initialize the router for handling metrics endpoints
+router = APIRouter()
+
+
+@router.get("/")
+async def get_metrics():
+    """
+    Returns a snapshot of the application's in-process metrics.
+
+    Returns:
+        dict: Counters, gauges and distribution summaries.
+
+    Example:
+        GET /v1/metrics/
+
+        Response:
+        {
+            "counters": {},
+            "gauges": {},
+            "distributions": {
+                "prompt_tokens_before": {"count": 10, "avg": 612.4, "p50": 598, ...},
+                "prompt_tokens_after": {"count": 10, "avg": 401.7, "p50": 388, ...}
+            }
+        }
+    """
+    return await MetricsController.get_metrics()
@@ -1,41 +1,123 @@
 # Import necessary modules from FastAPI
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
 # Import schema and controller for query-related operations
-from app.schemas.query import AskQuery
+from app.schemas.query import AskQuery, BatchAskQuery, SearchQuery
 from app.api.v1.controllers.query_controller import QueryController
 
+# Import utility function to authenticate the user, whose identity is used for rate limiting and fair scheduling
+from app.utils.auth_util import get_current_user
+
 # Initialize the router for handling query endpoints
 router = APIRouter()
 
 
 @router.post("/ask/")
-async def ask_question(query_data: AskQuery):
+async def ask_question(query_data: AskQuery, current_user: dict = Depends(get_current_user)):
     """
     Handles a user query and returns an appropriate response based on document vector search.
 
     Args:
         query_data (AskQuery): The query input data containing the user's question.
+        current_user (dict): The current authenticated user, automatically injected by the `get_current_user` dependency.
 
     Returns:
-        dict: A response containing the answer to the query and its associated sources (if any).
+        dict: A response containing the answer to the query and its associated sources (if any), and whether
+            the answer is an extractive fallback because the LLM did not answer within the latency budget.
 
     Example:
         POST /v1/query/ask/
-        JSON payload: { "query": "What is AI?" }
+        JSON payload: { "query": "What is AI?", "timeout_ms": 5000 }
 
         Response:
         {
             "answer": "Artificial Intelligence (AI) is...",
             "sources": [
                 {
+                    "chunk_id": "4f9c...",
                     "source": "filename.txt",
                     "chunk_index": 1,
                     "text": "Content related to AI...",
-                    "file_path": "Documents/filename.txt"
+                    "file_path": "Documents/filename.txt",
+                    "duplicate_sources": [],
+                    "score": 0.31
                 }
-            ]
+            ],
+            "degraded": false
         }
+
+        With `"compact_sources": true`, sources only hold `{"chunk_id": "4f9c...", "score": 0.31}`; their texts are
+        fetched (and cached) from GET /v1/document/chunk/{chunk_id}.
     """
     # Use the QueryController to process the question and retrieve the response
-    return await QueryController.ask_question(query_data)
+    return await QueryController.ask_question(query_data, current_user)
+
+
+@router.post("/ask/batch")
+async def ask_batch(batch_data: BatchAskQuery, current_user: dict = Depends(get_current_user)):
+    """
+    Handles a batch of user queries: they are embedded in one call, searched with one matrix k-NN search,
+    and answered with bounded LLM concurrency.
+
+    Args:
+        batch_data (BatchAskQuery): The queries, `top_k`, and the `retrieval_only` / `stream` options.
+        current_user (dict): The current authenticated user, automatically injected by the `get_current_user` dependency.
+
+    Returns:
+        dict: The results in query order, or an NDJSON stream (`application/x-ndjson`) of results
+            in completion order when `stream` is true.
+
+    Example:
+        POST /v1/query/ask/batch
+        JSON payload: { "queries": ["What is AI?", "Who founded XYZ?"], "retrieval_only": false }
+
+        Response:
+        {
+            "results": [
+                {"index": 0, "query": "What is AI?", "answer": "Artificial Intelligence (AI) is...", "sources": [...]},
+                {"index": 1, "query": "Who founded XYZ?", "answer": "...", "sources": [...]}
+            ]
+        }
+    """
+    return await QueryController.ask_batch(batch_data, current_user)
+
+
+@router.post("/search")
+async def search(search_data: SearchQuery, current_user: dict = Depends(get_current_user)):
+    """
+    Returns the chunks ranked for a query, without generating an answer with the LLM.
+
+    Args:
+        search_data (SearchQuery): The query, `k`, `offset` / `limit` pagination, and an optional metadata `filter`
+            (e.g. `source_prefix`, `tags_any`, `uploaded_by`).
+        current_user (dict): The current authenticated user, automatically injected by the `get_current_user` dependency.
+
+    Returns:
+        dict: A page of scored chunks (`score` is the L2 distance, lower is closer).
+
+    Example:
+        POST /v1/query/search
+        JSON payload: {
+            "query": "interview rounds", "k": 20, "offset": 0, "limit": 10,
+            "filter": { "source_prefix": "app/Documents/new_docs/" }
+        }
+
+        Response:
+        {
+            "query": "interview rounds",
+            "total": 20,
+            "offset": 0,
+            "limit": 10,
+            "results": [
+                {
+                    "chunk_id": "4f9c...",
+                    "source": "app/Documents/new_docs/xyz.txt",
+                    "chunk_index": 0,
+                    "text": "Our interview process consists of two rounds...",
+                    "duplicate_sources": [],
+                    "score": 0.31
+                }
+            ]
+        }
+    """
+    return await QueryController.search(search_data, current_user)
@@ -11,3 +11,154 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 DOCUMENT_DIRECTORY_PATH = "app/Documents"
 VECTOR_STORE_PATH = "app/vector_store/"
+
+# OpenAI API configuration
+# Base URL of the OpenAI API; point it at a compatible stand-in such as `app.tools.mock_openai` for load tests
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+# Split over-long inputs into tokens before embedding them (needs the tiktoken encoding files)
+EMBEDDING_CHECK_CTX_LENGTH = os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "true").lower() == "true"
+# Timeouts of the OpenAI HTTP requests (in seconds)
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "30"))
+# Connection pool shared by the embedding and completion clients
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "16"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# Maximum number of OpenAI requests in flight at once, across embeddings and completions
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+# Retries of requests failing with 429 / 5xx or a connection error, with jittered exponential backoff (in seconds)
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "20"))
+# Circuit breaker: consecutive failures opening the circuit, and time before a trial request is let through
+OPENAI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("OPENAI_CIRCUIT_FAILURE_THRESHOLD", "5"))
+OPENAI_CIRCUIT_RESET_SECONDS = float(os.getenv("OPENAI_CIRCUIT_RESET_SECONDS", "30"))
+
+# Document chunking configuration (in characters)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# Prompt assembly configuration
+# Maximum number of tokens of document context "stuffed" into the LLM prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+# Local tiktoken encoding used to count prompt tokens
+PROMPT_TOKENIZER_ENCODING = os.getenv("PROMPT_TOKENIZER_ENCODING", "cl100k_base")
+
+# Batch query configuration
+# Maximum number of queries accepted in one batch request
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+# Maximum number of LLM completions running concurrently for one batch request
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Retrieval-only search configuration
+# Maximum number of ranked results a search may consider (`k`)
+SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", "100"))
+# Number of query embeddings kept in memory, so paging through results does not re-embed the query
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+# Content moderation configuration
+# Profanity wordlist (one word or phrase per line); defaults to the list bundled with better_profanity
+PROFANITY_WORDLIST_PATH = os.getenv("PROFANITY_WORDLIST_PATH")
+# Phrases marking an answer as negative (one per line); defaults to the built-in list
+NEGATIVE_PHRASES_PATH = os.getenv("NEGATIVE_PHRASES_PATH")
+
+# Upload configuration
+# Maximum accepted size of an uploaded document (in bytes)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# Size of the chunks uploads are streamed to disk with (in bytes)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Directory holding the partial files of resumable upload sessions
+UPLOAD_SESSION_PATH = os.getenv("UPLOAD_SESSION_PATH", f"{DOCUMENT_DIRECTORY_PATH}/.upload_sessions")
+# Resumable upload sessions not completed within this time are discarded (in seconds)
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 60 * 60)))
+
+# Query log configuration
+# JSON-lines log of the processed queries, which can be replayed as a load-test workload
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "query_logs.log")
+# Size at which the query log is rotated (in bytes), and number of rotated files kept
+QUERY_LOG_MAX_BYTES = int(os.getenv("QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+QUERY_LOG_BACKUP_COUNT = int(os.getenv("QUERY_LOG_BACKUP_COUNT", "5"))
+# Fraction of the log records that include the full response body (answers and source texts)
+QUERY_LOG_BODY_SAMPLE_RATE = float(os.getenv("QUERY_LOG_BODY_SAMPLE_RATE", "0.1"))
+# Maximum number of records waiting to be written; further records are dropped rather than blocking requests
+QUERY_LOG_QUEUE_SIZE = int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000"))
+
+# Query deadline configuration
+# Default latency budget of a question (in milliseconds); clients can override it per request with `timeout_ms`
+QUERY_TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", "20000"))
+# Largest latency budget a client may request (in milliseconds)
+QUERY_MAX_TIMEOUT_MS = int(os.getenv("QUERY_MAX_TIMEOUT_MS", "120000"))
+# Number of sentences of a degraded extractive answer
+EXTRACTIVE_ANSWER_SENTENCES = int(os.getenv("EXTRACTIVE_ANSWER_SENTENCES", "3"))
+
+# Admission control configuration
+# Sustained rate of requests per user (per second, refilled continuously) and burst size of the per-user token buckets
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "1.0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+# Number of per-user token buckets kept; the least recently used ones are forgotten beyond it
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "10000"))
+# Maximum number of questions answered by the LLM at once, and of questions waiting for their turn
+QUERY_MAX_IN_FLIGHT = int(os.getenv("QUERY_MAX_IN_FLIGHT", "8"))
+QUERY_MAX_QUEUED = int(os.getenv("QUERY_MAX_QUEUED", "64"))
+# Maximum number of uploads parsed and embedded at once (their index updates are still applied one at a time),
+# and of uploads waiting to be indexed (admin ingestion lane)
+INGEST_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "1"))
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "16"))
+
+# Collection configuration
+# Collection used when an upload or a query does not name one (stored in VECTOR_STORE_PATH, like before collections)
+DEFAULT_COLLECTION = os.getenv("DEFAULT_COLLECTION", "default")
+# Directory holding the index directory of every other collection
+COLLECTIONS_PATH = os.getenv("COLLECTIONS_PATH", f"{VECTOR_STORE_PATH}collections")
+# Memory budget of the loaded collection indexes (in bytes); the least recently used ones are unloaded beyond it
+COLLECTION_MEMORY_BUDGET_BYTES = int(os.getenv("COLLECTION_MEMORY_BUDGET_BYTES", str(1024 * 1024 * 1024)))
+
+# Sharding configuration
+# Number of shards of the indexes of new collections (1 keeps a single FAISS index); existing indexes keep their layout
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "1"))
+# How chunks are assigned to shards: "source" keeps all the chunks of a document in one shard, "chunk" spreads them
+INDEX_SHARD_ROUTING = os.getenv("INDEX_SHARD_ROUTING", "source")
+# Number of threads searching the shards in parallel (shared by all searches)
+INDEX_SEARCH_THREADS = int(os.getenv("INDEX_SEARCH_THREADS", str(min(32, os.cpu_count() or 1))))
+
+# Quantization configuration
+# How the vectors of new indexes are stored in memory: "none" (float32), "fp16" or "int8" (full-precision copies
+# are kept in a memory-mapped side file to rescore the results exactly); existing indexes keep their storage
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "none")
+# Number of candidates ranked on the quantized vectors and rescored exactly, as a multiple of the requested results
+INDEX_RESCORE_FACTOR = int(os.getenv("INDEX_RESCORE_FACTOR", "4"))
+
+# Index build configuration
+# Whether the server builds the default collection's index at startup when it is missing (otherwise it must be built
+# beforehand with `python -m app.tools.build_index`, and the server only loads it)
+BUILD_INDEX_ON_STARTUP = os.getenv("BUILD_INDEX_ON_STARTUP", "false").lower() == "true"
+# How often (in seconds) a loaded collection used by requests is compared with its index on disk, to reload an index
+# rebuilt by `python -m app.tools.build_index` while the server runs
+INDEX_RELOAD_CHECK_SECONDS = float(os.getenv("INDEX_RELOAD_CHECK_SECONDS", "5"))
+
+# Near-duplicate detection configuration
+# Whether ingested chunks nearly repeating an indexed chunk are mapped to it instead of being embedded and indexed
+NEAR_DUPLICATE_DETECTION = os.getenv("NEAR_DUPLICATE_DETECTION", "true").lower() == "true"
+# Estimated Jaccard similarity of the word shingles of two chunks from which one is a near-duplicate of the other
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.85"))
+# Length of the MinHash signatures, and number of LSH bands they are split into (must divide it): more bands find
+# candidates of lower similarity, at the cost of more comparisons
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "128"))
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "16"))
+
+# Profiling configuration
+# Requests taking at least this long (in milliseconds) are kept with the timeline of their stages, for admins to browse
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "2000"))
+# Number of slow requests kept in memory; the oldest ones are dropped beyond it
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "200"))
+# Longest profile the sampling profiler may record (in seconds), and maximum number of distinct stacks it keeps
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "300"))
+PROFILER_MAX_STACKS = int(os.getenv("PROFILER_MAX_STACKS", "20000"))
+
+# Response configuration
+# Responses of at least this many bytes are gzip-compressed for the clients accepting it, at this compression level
+# (1 is the fastest, 9 the smallest)
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+# How long (in seconds) clients may reuse a fetched chunk before revalidating it with its ETag
+CHUNK_CACHE_MAX_AGE_SECONDS = int(os.getenv("CHUNK_CACHE_MAX_AGE_SECONDS", "3600"))
@@ -1,13 +1,83 @@
-# Placeholder for logging configuration if needed in future
+# Logging configuration
+# Query log records are put on an in-memory queue by the request handlers and written to a size-rotated
+# JSON-lines file by a background listener thread, so no file I/O happens on the event loop.
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+
+# Import configuration values such as the query log path and rotation settings
+from app.core import config
+
+# Import the metrics registry to count dropped log records
+from app.utils.metrics_util import metrics
+
+# Name of the logger receiving the query log records
+QUERY_LOGGER_NAME = "app.query"
+
+# Listener writing the queued query log records, started once by `setup_logging`
+_query_log_listener = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats a log record carrying an `event` dict as one JSON line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = getattr(record, "event", None)
+        if event is None:
+            event = {"message": record.getMessage()}
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler that never blocks nor formats on the caller's thread.
+
+    Records are enqueued as they are (their `event` is serialized by the listener), and dropped
+    when the queue is full rather than slowing requests down.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("query_log_dropped")
 
 
 # Configuring the logging format and level
 def setup_logging():
     logging.basicConfig(
-        filename="query_logs.log",
         level=logging.INFO,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
+    global _query_log_listener
+    if _query_log_listener is not None:
+        return
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        config.QUERY_LOG_PATH,
+        maxBytes=config.QUERY_LOG_MAX_BYTES,
+        backupCount=config.QUERY_LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    log_queue = queue.Queue(maxsize=config.QUERY_LOG_QUEUE_SIZE)
+    query_logger = logging.getLogger(QUERY_LOGGER_NAME)
+    query_logger.setLevel(logging.INFO)
+    query_logger.addHandler(NonBlockingQueueHandler(log_queue))
+    # Query records only go to the query log
+    query_logger.propagate = False
+
+    _query_log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _query_log_listener.start()
+    # Flush the remaining records on shutdown
+    atexit.register(_query_log_listener.stop)
@@ -0,0 +1,244 @@
+# OpenAI provider - The single place where the OpenAI embedding and completion clients are created.
+#
+# Both clients share one pooled keep-alive HTTP client whose transport adds explicit timeouts, a concurrency limit
+# shared by all OpenAI calls, jittered retries on 429 / 5xx responses (honoring Retry-After), a circuit breaker,
+# and per-endpoint latency and retry metrics. The OpenAI SDK's own retries are disabled so that they do not stack.
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+
+# Import httpx, the HTTP client used by the OpenAI SDK
+import httpx
+
+# Import the LangChain OpenAI integrations
+from langchain_openai import OpenAI, OpenAIEmbeddings
+
+# Import configuration values such as the API key, timeouts and retry settings
+from app.core import config
+
+# Import the metrics registry to expose upstream latencies, retries and the circuit state
+from app.utils.metrics_util import metrics
+
+# Response statuses worth retrying
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """
+    Raised instead of sending a request while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling the upstream API after consecutive failures, and lets a single trial request through
+    once `reset_seconds` have passed: it closes the circuit again if it succeeds, or reopens it otherwise.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            # Half-open: let one trial request through
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        metrics.set_gauge("upstream_circuit_open", 0)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                opened = True
+            else:
+                opened = False
+        if opened:
+            metrics.set_gauge("upstream_circuit_open", 1)
+
+
+def _endpoint_label(request: httpx.Request) -> str:
+    """
+    Returns the API endpoint of a request (e.g. "embeddings", "completions", "chat/completions").
+    """
+    path = request.url.path.rstrip("/")
+    return "chat/completions" if path.endswith("/chat/completions") else path.rsplit("/", 1)[-1]
+
+
+def _retry_after_seconds(response: httpx.Response):
+    """
+    Returns the delay requested by the `retry-after-ms` or `Retry-After` response header, if any.
+    """
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = response.headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _backoff_seconds(attempt: int) -> float:
+    """
+    Returns the jittered ("full jitter") exponential backoff before the given retry attempt.
+    """
+    return random.uniform(0, min(config.OPENAI_RETRY_MAX_DELAY, config.OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """
+    An httpx transport adding a shared concurrency limit, retries, a circuit breaker and metrics
+    on top of a pooled keep-alive transport.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, max_concurrency: int, max_retries: int,
+                 circuit_breaker: CircuitBreaker):
+        self._transport = transport
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._max_retries = max_retries
+        self._circuit_breaker = circuit_breaker
+        self._pool_timeout = config.OPENAI_READ_TIMEOUT
+
+    def _send_once(self, request: httpx.Request, endpoint: str) -> httpx.Response:
+        if not self._slots.acquire(timeout=self._pool_timeout):
+            raise httpx.PoolTimeout("Timed out waiting for an OpenAI concurrency slot", request=request)
+        try:
+            if not self._circuit_breaker.allow_request():
+                metrics.increment("upstream_requests", endpoint=endpoint, outcome="circuit_open")
+                raise CircuitOpenError("OpenAI API circuit breaker is open", request=request)
+
+            start = time.perf_counter()
+            try:
+                response = self._transport.handle_request(request)
+                # Read the body while holding the slot, so the latency covers the whole response
+                response.read()
+            except Exception as e:
+                self._circuit_breaker.record_failure()
+                metrics.increment("upstream_requests", endpoint=endpoint, outcome=type(e).__name__)
+                raise
+            finally:
+                metrics.observe("upstream_latency_ms", (time.perf_counter() - start) * 1000, endpoint=endpoint)
+        finally:
+            self._slots.release()
+
+        # Server errors and rate limiting both count as failures: sustained 429s mean the quota is exhausted
+        if response.status_code in RETRYABLE_STATUSES:
+            self._circuit_breaker.record_failure()
+        else:
+            self._circuit_breaker.record_success()
+        metrics.increment("upstream_requests", endpoint=endpoint, outcome=str(response.status_code))
+        return response
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = _endpoint_label(request)
+        attempt = 0
+        while True:
+            try:
+                response = self._send_once(request, endpoint)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout, httpx.RemoteProtocolError):
+                if attempt >= self._max_retries:
+                    raise
+                delay = _backoff_seconds(attempt)
+            else:
+                if response.status_code not in RETRYABLE_STATUSES or attempt >= self._max_retries:
+                    return response
+                retry_after = _retry_after_seconds(response)
+                if retry_after is not None and retry_after > config.OPENAI_RETRY_MAX_DELAY:
+                    # The API asks to wait longer than we are willing to: fail now
+                    return response
+                # Honor Retry-After, with a little jitter so that waiting callers do not retry in lockstep
+                delay = retry_after + random.uniform(0, config.OPENAI_RETRY_BASE_DELAY) \
+                    if retry_after is not None else _backoff_seconds(attempt)
+                response.close()
+
+            attempt += 1
+            metrics.increment("upstream_retries", endpoint=endpoint)
+            time.sleep(delay)
+
+    def close(self):
+        self._transport.close()
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """
+    Returns the HTTP client shared by all OpenAI clients (created once).
+    """
+    limits = httpx.Limits(
+        max_connections=config.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.OPENAI_KEEPALIVE_EXPIRY,
+    )
+    transport = ResilientTransport(
+        httpx.HTTPTransport(limits=limits),
+        max_concurrency=config.OPENAI_MAX_CONCURRENCY,
+        max_retries=config.OPENAI_MAX_RETRIES,
+        circuit_breaker=CircuitBreaker(config.OPENAI_CIRCUIT_FAILURE_THRESHOLD, config.OPENAI_CIRCUIT_RESET_SECONDS),
+    )
+    return httpx.Client(transport=transport, timeout=get_timeout())
+
+
+def get_timeout() -> httpx.Timeout:
+    """
+    Returns the timeouts of the OpenAI requests.
+    """
+    return httpx.Timeout(
+        config.OPENAI_READ_TIMEOUT, connect=config.OPENAI_CONNECT_TIMEOUT, pool=config.OPENAI_READ_TIMEOUT
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings() -> OpenAIEmbeddings:
+    """
+    Returns the shared OpenAI embeddings client.
+    """
+    return OpenAIEmbeddings(
+        openai_api_key=config.OPENAI_API_KEY,
+        base_url=config.OPENAI_BASE_URL,
+        check_embedding_ctx_length=config.EMBEDDING_CHECK_CTX_LENGTH,
+        http_client=get_http_client(),
+        timeout=get_timeout(),
+        max_retries=0,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_llm() -> OpenAI:
+    """
+    Returns the shared OpenAI completion (LLM) client.
+    """
+    return OpenAI(
+        api_key=config.OPENAI_API_KEY,
+        base_url=config.OPENAI_BASE_URL,
+        http_client=get_http_client(),
+        timeout=get_timeout(),
+        max_retries=0,
+    )
@@ -0,0 +1,353 @@
+# Collection manager - This module loads the FAISS index of every named collection on first use, and unloads the
+# least recently used ones when the loaded indexes exceed a memory budget.
+#
+# Each collection has its own directory holding its FAISS index and chunk store (`faiss_index/`) and the content
+# hashes of its documents. The default collection lives directly in VECTOR_STORE_PATH, where the single index was
+# stored before collections existed; the others live in COLLECTIONS_PATH/<name>.
+#
+# Searches lease the vector store they use, and a leased collection is never unloaded. An index replaced by an update
+# is simply dropped from the manager: the searches still using it keep it alive until they complete.
+#
+# An index rebuilt offline (`app.tools.build_index`) is installed with a new manifest file: a loaded collection whose
+# manifest changed on disk is reloaded, checked at most every INDEX_RELOAD_CHECK_SECONDS when it is used.
+
+# Provides functions to interact with the operating system, used here for file paths and sizes.
+import os
+# import re: used to validate collection names, which are used as directory names.
+import re
+# import threading: searches and index updates run in worker threads.
+import threading
+# import time: used to measure the load time of the indexes.
+import time
+# import OrderedDict: the loaded collections, least recently used first.
+from collections import OrderedDict
+# import contextmanager: used to lease a collection for the duration of a search.
+from contextlib import contextmanager
+
+# Imports configuration values like paths and the memory budget from the app's config module.
+from app.core import config
+# Imports the functions loading a FAISS vector store (sharded or not) and its metadata index.
+from app.db.faiss_store import reload_vector_store, index_metadata, vector_count, vector_store_exists
+# Imports the name of the manifest written with the indexes built by the index builder.
+from app.db.index_builder import INDEX_MANIFEST
+# Imports the metrics registry exposing the index sizes, load times and evictions.
+from app.utils.metrics_util import metrics
+
+# Valid collection names: letters, digits, "-" and "_", starting with a letter or digit
+_COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def is_valid_collection_name(name: str) -> bool:
+    """
+    Check that a collection name can safely be used as a directory name.
+    """
+    return bool(name) and _COLLECTION_NAME.match(name) is not None
+
+
+def collection_directory(name: str) -> str:
+    """
+    Return the directory holding a collection's index and content hashes.
+    """
+    if name == config.DEFAULT_COLLECTION:
+        return config.VECTOR_STORE_PATH
+    return os.path.join(config.COLLECTIONS_PATH, name)
+
+
+def collection_index_path(name: str) -> str:
+    """
+    Return the directory of a collection's FAISS index and chunk store.
+    """
+    return os.path.join(collection_directory(name), "faiss_index")
+
+
+def index_version(index_path: str):
+    """
+    Return the identity of the build of an index (its manifest file's inode and modification time), which changes
+    when a rebuilt index is installed but not when documents are added to it; None for indexes never built.
+    """
+    try:
+        stat = os.stat(os.path.join(index_path, INDEX_MANIFEST))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def index_size_bytes(index_path: str) -> int:
+    """
+    Return the size of a saved FAISS index and chunk store (of all shards if sharded), used as an estimate of
+    their size once loaded.
+    """
+    return sum(
+        os.path.getsize(os.path.join(directory, file_name))
+        for directory, _, file_names in os.walk(index_path)
+        for file_name in file_names
+        if file_name in ("index.faiss", "index.pkl")
+    )
+
+
+class LoadedCollection:
+    """
+    A loaded collection index, and the number of searches currently using it.
+    """
+
+    def __init__(self, name: str, vectorstore, size_bytes: int, load_ms: float, version=None):
+        self.name = name
+        self.vectorstore = vectorstore
+        self.size_bytes = size_bytes
+        self.load_ms = load_ms
+        self.version = version  # The `index_version` of the index on disk when loaded
+        self.checked_at = time.monotonic()  # When the index on disk was last compared to the loaded one
+        self.leases = 0
+
+
+class CollectionManager:
+    """
+    Loads collection indexes lazily and keeps the most recently used ones within a memory budget.
+
+    The manager is thread-safe: a collection is loaded once even when several threads need it at the same time.
+    """
+
+    def __init__(self, memory_budget_bytes: int):
+        """
+        Args:
+            memory_budget_bytes (int): Size of the loaded indexes beyond which the least recently used,
+                unleased ones are unloaded.
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()  # name -> LoadedCollection, least recently used first
+        self._loaded_bytes = 0
+        self._load_locks = {}  # name -> lock serializing the loads and updates of the collection
+        self._generations = {}  # name -> number of updates since startup
+
+    def exists(self, name: str) -> bool:
+        """
+        Check whether a collection has an index on disk, or is loaded (while a rebuilt index is being installed, the
+        index directory is briefly missing).
+        """
+        with self._lock:
+            if name in self._loaded:
+                return True
+        return vector_store_exists(collection_index_path(name))
+
+    def list_collections(self) -> list:
+        """
+        Return the names of the collections having an index on disk.
+        """
+        names = [config.DEFAULT_COLLECTION] if self.exists(config.DEFAULT_COLLECTION) else []
+        if os.path.isdir(config.COLLECTIONS_PATH):
+            names += sorted(
+                name for name in os.listdir(config.COLLECTIONS_PATH)
+                if is_valid_collection_name(name) and name != config.DEFAULT_COLLECTION and self.exists(name)
+            )
+        return names
+
+    def generation(self, name: str) -> int:
+        """
+        Return the number of updates of a collection since startup, so results of different index versions
+        can be told apart.
+        """
+        with self._lock:
+            return self._generations.get(name, 0)
+
+    def _load_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _lease_loaded(self, name: str):
+        """
+        Lease a collection if it is loaded (the manager lock must be held).
+        """
+        loaded = self._loaded.get(name)
+        if loaded is not None:
+            self._loaded.move_to_end(name)
+            loaded.leases += 1
+        return loaded
+
+    def _install(self, loaded: LoadedCollection):
+        """
+        Make a loaded index the current one of its collection (the manager lock must be held).
+        """
+        previous = self._loaded.pop(loaded.name, None)
+        if previous is not None:
+            self._loaded_bytes -= previous.size_bytes
+        self._loaded[loaded.name] = loaded
+        self._loaded_bytes += loaded.size_bytes
+        metrics.set_gauge("collection_loaded_bytes", loaded.size_bytes, collection=loaded.name)
+        metrics.set_gauge("collection_chunks", vector_count(loaded.vectorstore), collection=loaded.name)
+
+    def _evict(self):
+        """
+        Unload the least recently used, unleased collections until the loaded ones fit in the memory budget
+        (the manager lock must be held). Leased collections are kept even if the budget is exceeded.
+        """
+        for name in list(self._loaded):
+            if self._loaded_bytes <= self.memory_budget_bytes:
+                break
+            loaded = self._loaded[name]
+            if loaded.leases:
+                continue
+            del self._loaded[name]
+            self._loaded_bytes -= loaded.size_bytes
+            metrics.increment("collection_evictions", collection=name)
+            metrics.set_gauge("collection_loaded_bytes", 0, collection=name)
+        metrics.set_gauge("collections_loaded", len(self._loaded))
+        metrics.set_gauge("collections_loaded_bytes", self._loaded_bytes)
+
+    def _load(self, name: str) -> LoadedCollection:
+        """
+        Load a collection's index from disk (the collection's load lock must be held).
+        """
+        index_path = collection_index_path(name)
+        version = index_version(index_path)
+        start = time.perf_counter()
+        vectorstore = reload_vector_store(index_path)
+        load_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("collection_load_ms", load_ms, collection=name)
+        return LoadedCollection(name, vectorstore, index_size_bytes(index_path), load_ms, version)
+
+    def refresh(self, name: str, force: bool = False) -> bool:
+        """
+        Reload a loaded collection if a rebuilt index was installed on disk since it was loaded.
+
+        Searches still using the previous vector store complete with it. While a rebuilt index is being installed
+        (its manifest is missing), the loaded one is kept.
+
+        Args:
+            name (str): The collection name.
+            force (bool): Compare with the index on disk even if it was compared less than
+                `INDEX_RELOAD_CHECK_SECONDS` ago.
+
+        Returns:
+            bool: Whether the collection was reloaded.
+        """
+        with self._lock:
+            loaded = self._loaded.get(name)
+        now = time.monotonic()
+        if loaded is None or (not force and now - loaded.checked_at < config.INDEX_RELOAD_CHECK_SECONDS):
+            return False
+        loaded.checked_at = now
+        version = index_version(collection_index_path(name))
+        if version == loaded.version:
+            return False
+        if version is None:
+            # A built index has no manifest only while a rebuild is being installed: keep serving the loaded one
+            return False
+
+        with self._load_lock(name):
+            with self._lock:
+                if self._loaded.get(name) is not loaded:
+                    # Reloaded, replaced or unloaded in the meantime
+                    return False
+            reloaded = self._load(name)
+            with self._lock:
+                self._install(reloaded)
+                self._generations[name] = self._generations.get(name, 0) + 1
+                self._evict()
+        metrics.increment("collection_reloads", collection=name)
+        return True
+
+    def _acquire(self, name: str) -> LoadedCollection:
+        """
+        Lease a collection, loading its index first if needed.
+
+        Raises:
+            FileNotFoundError: If the collection has no index.
+        """
+        self.refresh(name)
+        with self._lock:
+            loaded = self._lease_loaded(name)
+        if loaded is not None:
+            return loaded
+
+        with self._load_lock(name):
+            # Another thread may have loaded it in the meantime
+            with self._lock:
+                loaded = self._lease_loaded(name)
+            if loaded is not None:
+                return loaded
+
+            if not self.exists(name):
+                raise FileNotFoundError(f"Collection '{name}' does not exist")
+            loaded = self._load(name)
+            loaded.leases = 1
+            with self._lock:
+                self._install(loaded)
+                self._evict()
+            return loaded
+
+    @contextmanager
+    def use(self, name: str):
+        """
+        Lease a collection's vector store for the duration of the block: it is not unloaded meanwhile.
+
+        Args:
+            name (str): The collection name.
+
+        Yields:
+            FAISS | ShardedVectorStore: The collection's vector store.
+
+        Raises:
+            FileNotFoundError: If the collection has no index.
+        """
+        loaded = self._acquire(name)
+        try:
+            yield loaded.vectorstore
+        finally:
+            with self._lock:
+                loaded.leases -= 1
+                self._evict()
+
+    def peek(self, name: str):
+        """
+        Return a collection's vector store if it is loaded, without leasing it or loading it.
+
+        Used by index updates, which reuse the unchanged shards of the loaded store.
+        """
+        with self._lock:
+            loaded = self._loaded.get(name)
+        return loaded.vectorstore if loaded is not None else None
+
+    def replace(self, name: str, vectorstore):
+        """
+        Make an updated vector store, already saved to disk, the current index of a collection.
+
+        Searches still using the previous vector store complete with it.
+
+        Args:
+            name (str): The collection name.
+            vectorstore (FAISS | ShardedVectorStore): The updated vector store.
+        """
+        with self._load_lock(name):
+            index_metadata(vectorstore)
+            with self._lock:
+                previous = self._loaded.get(name)
+            # The load time reported is the one of the last load from disk
+            index_path = collection_index_path(name)
+            loaded = LoadedCollection(
+                name, vectorstore, index_size_bytes(index_path), previous.load_ms if previous else 0.0,
+                index_version(index_path)
+            )
+            with self._lock:
+                self._install(loaded)
+                self._generations[name] = self._generations.get(name, 0) + 1
+                self._evict()
+
+    def stats(self) -> list:
+        """
+        Return the index size, number of chunks, load time and state of every collection.
+        """
+        with self._lock:
+            loaded_by_name = dict(self._loaded)
+        collections = []
+        for name in self.list_collections():
+            loaded = loaded_by_name.get(name)
+            collections.append({
+                "name": name,
+                "loaded": loaded is not None,
+                "size_bytes": loaded.size_bytes if loaded else index_size_bytes(collection_index_path(name)),
+                "chunks": vector_count(loaded.vectorstore) if loaded else None,
+                "load_ms": round(loaded.load_ms, 3) if loaded else None,
+                "in_use": loaded.leases if loaded else 0,
+            })
+        return collections
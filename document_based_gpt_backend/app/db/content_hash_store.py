@@ -0,0 +1,123 @@
+# Content hash store - Records the SHA-256 of every indexed document, so that re-uploads of identical content
+# can be detected from the hash computed while streaming the upload, without re-reading or re-embedding the file.
+# Hashes are recorded per collection: the same document may be indexed in several collections.
+#
+# The upload metadata of a document (uploader, upload time, tags) is recorded with its hash, so that an index rebuilt
+# from the document files (see `app.tools.build_index`) restores it in the chunks, where metadata filters match it.
+
+import json
+import os
+import threading
+
+# Imports configuration values like the default collection from the app's config module.
+from app.core import config
+# Imports the directory layout of the collections.
+from app.db.collection_manager import collection_directory
+
+# Guards concurrent reads and writes of the hash file
+_lock = threading.Lock()
+
+
+def _hash_store_path(collection: str) -> str:
+    return os.path.join(collection_directory(collection), "content_hashes.json")
+
+
+def _load(collection: str) -> dict:
+    path = _hash_store_path(collection)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as hash_file:
+        return json.load(hash_file)
+
+
+def _save(hashes: dict, collection: str):
+    path = _hash_store_path(collection)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as hash_file:
+        json.dump(hashes, hash_file)
+    os.replace(f"{path}.tmp", path)
+
+
+def _record(source: str, size: int, metadata: dict = None) -> dict:
+    record = {"source": source, "size": size}
+    if metadata:
+        record["metadata"] = metadata
+    return record
+
+
+def find_document_by_hash(content_hash: str, collection: str = config.DEFAULT_COLLECTION):
+    """
+    Look up an already indexed document by the hash of its content.
+
+    Args:
+        content_hash (str): SHA-256 hex digest of the document content.
+        collection (str): The collection to look in.
+
+    Returns:
+        dict or None: The recorded document (`source`, `size` and upload `metadata` if any) or None if the content
+            is new.
+    """
+    with _lock:
+        return _load(collection).get(content_hash)
+
+
+def record_document_hash(content_hash: str, source: str, size: int, collection: str = config.DEFAULT_COLLECTION,
+                         metadata: dict = None):
+    """
+    Record the hash of a newly indexed document (the file is replaced atomically).
+
+    The records of the document previously saved at the same path, whose content was replaced, are dropped.
+
+    Args:
+        content_hash (str): SHA-256 hex digest of the document content.
+        source (str): Path of the indexed document.
+        size (int): Size of the document in bytes.
+        collection (str): The collection the document was indexed in.
+        metadata (dict, optional): The upload metadata stored in the document's chunks.
+    """
+    with _lock:
+        hashes = {
+            recorded_hash: record for recorded_hash, record in _load(collection).items()
+            if os.path.normpath(record["source"]) != os.path.normpath(source)
+        }
+        hashes[content_hash] = _record(source, size, metadata)
+        _save(hashes, collection)
+
+
+def uploaded_document_metadata(collection: str = config.DEFAULT_COLLECTION) -> dict:
+    """
+    Return the upload metadata of the documents of a collection, by document path.
+
+    A path uploaded several times (with different contents) gets the metadata of its latest upload.
+
+    Returns:
+        dict: The upload metadata (uploader, upload time, tags) by normalized document path.
+    """
+    with _lock:
+        records = list(_load(collection).values())
+    metadata_by_source = {}
+    for record in records:
+        metadata = record.get("metadata")
+        if not metadata:
+            continue
+        source = os.path.normpath(record["source"])
+        previous = metadata_by_source.get(source)
+        if previous is None or metadata.get("uploaded_at", "") >= previous.get("uploaded_at", ""):
+            metadata_by_source[source] = metadata
+    return metadata_by_source
+
+
+def replace_document_hashes(documents: list, collection: str = config.DEFAULT_COLLECTION):
+    """
+    Replace all the recorded hashes of a collection, after its index was rebuilt from scratch.
+
+    Args:
+        documents (list of dict): The indexed documents (`sha256`, `source`, `size` and upload `metadata` if any).
+        collection (str): The collection that was rebuilt.
+    """
+    with _lock:
+        hashes = {
+            document["sha256"]: _record(document["source"], document["size"], document.get("metadata"))
+            for document in documents
+        }
+        _save(hashes, collection)
@@ -3,48 +3,247 @@
 
 # Provides functions to interact with the operating system, used here for file path checks.
 import os
-# import FAISS: A library for efficient similarity search and clustering of dense vectors.
-from langchain_community.vectorstores import FAISS
-# import OpenAIEmbeddings, provides a way to generate text embeddings using OpenAI models.
-from langchain_openai import OpenAIEmbeddings
+# import asyncio: used to run the blocking index updates in a worker thread.
+import asyncio
+# import heapq: used to merge the top results of the shards of a sharded index.
+import heapq
+# import itertools: used to chain the results of the shards before merging them.
+import itertools
+# import uuid: used to generate the ids of new chunks before looking for their near-duplicates.
+import uuid
+# import ThreadPoolExecutor: the shards of a sharded index are searched in parallel (FAISS releases the GIL).
+from concurrent.futures import ThreadPoolExecutor
+# import numpy: used to build the query matrix searched against the FAISS index in a single call.
+import numpy as np
+# import faiss: the underlying similarity search library, used for direct (batched) index searches.
+import faiss
+# import Document: the LangChain schema returned for each retrieved chunk.
+from langchain.schema import Document
+# import DistanceStrategy: tells whether lower or higher scores are better when merging the results of shards.
+from langchain_community.vectorstores.utils import DistanceStrategy
 # Imports configuration values like paths and API keys from the app's config module.
 from app.core import config
+# Imports the shared OpenAI embeddings client.
+from app.core.openai_provider import get_embeddings
+# Imports the metadata bitmap index used to restrict searches to the chunks matching a metadata filter.
+from app.db.metadata_index import MetadataBitmapIndex, bitmap_to_search_params
+# Imports the sharded vector store, whose shards are searched in parallel.
+from app.db.sharded_store import ShardedVectorStore, is_sharded_index, SHARD_MANIFEST
+# Imports the functions handling the FAISS vector stores whose vectors may be quantized.
+from app.db.quantized_store import (
+    create_faiss_store, add_embeddings, save_faiss_store, load_faiss_store, search_index
+)
+# Imports the MinHash/LSH index detecting new chunks that nearly repeat indexed ones.
+from app.db.near_duplicate_index import (
+    NearDuplicateIndex, find_near_duplicates, with_duplicates, add_duplicates, remove_source
+)
+# Imports the stage timer recording the embedding and search times of the current request.
+from app.utils.trace_util import stage
+# Imports the local token counter, used to report the embedding spend of ingestion.
+from app.utils.prompt_util import count_tokens
 
-# Initialize OpenAI embeddings using the provided API key from configuration
-openai_embeddings = OpenAIEmbeddings(openai_api_key=config.OPENAI_API_KEY)
+# Shared OpenAI embeddings client (pooled connections, timeouts and retries)
+openai_embeddings = get_embeddings()
 
+# Threads searching the shards of sharded indexes, shared by all searches
+_shard_search_pool = ThreadPoolExecutor(max_workers=config.INDEX_SEARCH_THREADS, thread_name_prefix="shard-search")
 
-async def update_vector_store(new_docs, vector_store_path: str):
+
+def vector_store_exists(vector_store_path: str) -> bool:
+    """
+    Check whether a FAISS vector store, sharded or not, is saved at the given path.
+    """
+    return (
+        os.path.exists(os.path.join(vector_store_path, "index.faiss"))
+        or os.path.exists(os.path.join(vector_store_path, SHARD_MANIFEST))
+    )
+
+
+def vector_count(vectorstore) -> int:
+    """
+    Return the number of chunks in a vector store, sharded or not.
+    """
+    if isinstance(vectorstore, ShardedVectorStore):
+        return vectorstore.ntotal
+    return vectorstore.index.ntotal
+
+
+def build_vector_store_from_embeddings(texts: list, vectors, metadatas: list, vector_store_path: str,
+                                       ids: list = None, num_shards: int = None, routing: str = None,
+                                       quantization: str = None):
+    """
+    Create a vector store from already embedded chunks and save it.
+
+    Args:
+        texts (list of str): The chunk texts.
+        vectors (list): The embedding of each chunk.
+        metadatas (list of dict): The metadata of each chunk.
+        vector_store_path (str): The path to save the vector store to.
+        ids (list of str, optional): The chunk ids (random ones are generated by default).
+        num_shards (int, optional): The number of shards (`INDEX_SHARDS` by default).
+        routing (str, optional): How chunks are assigned to shards (`INDEX_SHARD_ROUTING` by default).
+        quantization (str, optional): How the vectors are stored (`INDEX_QUANTIZATION` by default).
+
+    Returns:
+        FAISS | ShardedVectorStore: The new vector store.
+    """
+    num_shards = config.INDEX_SHARDS if num_shards is None else num_shards
+    routing = config.INDEX_SHARD_ROUTING if routing is None else routing
+    quantization = config.INDEX_QUANTIZATION if quantization is None else quantization
+
+    if num_shards > 1:
+        vectorstore = ShardedVectorStore.from_embeddings(
+            texts, vectors, metadatas, openai_embeddings, num_shards, routing, quantization, ids
+        )
+        vectorstore.save_local(vector_store_path)
+        return vectorstore
+
+    vectorstore = create_faiss_store(openai_embeddings, len(vectors[0]), quantization)
+    add_embeddings(vectorstore, texts, vectors, metadatas, ids)
+    save_faiss_store(vectorstore, vector_store_path)
+    return vectorstore
+
+
+async def embed_new_chunks(new_docs, current=None) -> dict:
+    """
+    Embed the chunks of new documents ahead of `update_vector_store`, which may then run without embedding them.
+
+    Chunks nearly repeating a chunk of the `current` store, or an earlier new chunk, are not embedded. The store is
+    only read, so documents can be embedded while another update of the store is in progress: `update_vector_store`
+    remains the one deciding which chunks are near-duplicates, and embeds the chunks it keeps that were not embedded
+    here. Nothing is embedded ahead without a loaded store to compare the chunks to.
+
+    Args:
+        new_docs (list): The documents to be added to the vector store.
+        current (FAISS | ShardedVectorStore, optional): The store currently loaded for the collection, if any.
+
+    Returns:
+        dict: The embedding of the chunks to index, by position in `new_docs`.
+    """
+    if current is None:
+        return {}
+
+    def embed():
+        positions = range(len(new_docs))
+        if config.NEAR_DUPLICATE_DETECTION:
+            # The index attached to the store also holds the chunks of an update in progress, if any
+            indexed = getattr(current, "near_duplicate_index", None) or get_near_duplicate_index(current)
+            new_chunks = NearDuplicateIndex()
+            positions = []
+            for position, doc in enumerate(new_docs):
+                signature = new_chunks.signature(doc.page_content)
+                if indexed.find(signature) is None and new_chunks.find(signature) is None:
+                    new_chunks.add(str(position), signature)
+                    positions.append(position)
+        texts = [new_docs[position].page_content for position in positions]
+        return dict(zip(positions, openai_embeddings.embed_documents(texts) if texts else []))
+
+    # Embedding blocks, so it runs in a worker thread
+    return await asyncio.to_thread(embed)
+
+
+async def update_vector_store(new_docs, vector_store_path: str, current=None, embeddings: dict = None,
+                              replaced_source: str = None):
     """
     Update the FAISS vector store with new documents.
 
     This function checks if a vector store already exists at the specified path.
     If it does, it loads the existing store and adds new documents to it.
     If not, it creates a new vector store using the provided documents.
+    The store is loaded from disk, so the vector store object used by searches in progress is never modified.
+
+    For a sharded store, only the shards receiving chunks are reloaded, updated and saved; the other shards
+    of the `current` store are reused as they are.
+
+    Unless `NEAR_DUPLICATE_DETECTION` is disabled, new chunks nearly repeating an indexed chunk (or an earlier new
+    chunk) are neither embedded nor indexed: their source is added to the `duplicate_sources` metadata of the chunk
+    they repeat instead, and their filterable metadata to its `duplicates` metadata.
 
     Args:
         new_docs (list): A list of documents to be added to the vector store.
         vector_store_path (str): The path to save the FAISS vector store.
+        current (FAISS | ShardedVectorStore, optional): The store currently loaded from that path, if any.
+        embeddings (dict, optional): Embeddings of new chunks computed ahead (see `embed_new_chunks`), by position.
+        replaced_source (str, optional): The document the new chunks replace: its chunks are removed first (see
+            `remove_source`).
 
     Returns:
-        None
+        tuple: The updated vector store (FAISS | ShardedVectorStore), and the ingestion statistics: the number of
+            new `chunks`, of near-`duplicates` among them, and the tokens of the `embedded` and `skipped` chunks.
 
     Raises:
         Exception: If the vector store cannot be loaded or updated.
     """
-    # Check if vector store already exists at the given path
-    if os.path.exists(vector_store_path):
-        # Load existing FAISS vector store if the index file is found
-        faiss_index = FAISS.load_local(vector_store_path, openai_embeddings, allow_dangerous_deserialization=True)
-    else:
-        # Create a new FAISS vector store from the documents if the index file doesn't exist
-        faiss_index = FAISS.from_documents(new_docs, openai_embeddings)
+    def update():
+        # Load the existing vector store: a sharded one reuses the unchanged shards of the current store
+        if is_sharded_index(vector_store_path):
+            vectorstore = current if isinstance(current, ShardedVectorStore) \
+                else ShardedVectorStore.load_local(vector_store_path, openai_embeddings)
+        elif os.path.exists(vector_store_path):
+            vectorstore = load_faiss_store(vector_store_path, openai_embeddings)
+        else:
+            vectorstore = None
+
+        # Keep the new chunks that are not near-duplicates (the loaded store holds the same chunks as the saved one)
+        chunk_ids = [str(uuid.uuid4()) for _ in new_docs]
+        kept, duplicates, near_duplicates = range(len(new_docs)), {}, None
+        if config.NEAR_DUPLICATE_DETECTION:
+            indexed = current if current is not None else vectorstore
+            if indexed is None:
+                near_duplicates = NearDuplicateIndex()
+            elif replaced_source is not None:
+                # New chunks must not be matched against the chunks being removed
+                near_duplicates = NearDuplicateIndex.from_vectorstore(indexed, replaced_source)
+            else:
+                near_duplicates = get_near_duplicate_index(indexed)
+            kept, duplicates = find_near_duplicates(new_docs, chunk_ids, near_duplicates)
 
-    # Add new documents to the vector store
-    faiss_index.add_documents(new_docs)
+        # Duplicates of new chunks are recorded in the metadata of these chunks, the others in the stored chunks
+        texts = [new_docs[position].page_content for position in kept]
+        metadatas = [
+            with_duplicates(new_docs[position].metadata, duplicates.pop(chunk_ids[position], []))
+            for position in kept
+        ]
+        ids = [chunk_ids[position] for position in kept]
+        # Embed the kept chunks that were not embedded ahead
+        embedded = dict(embeddings or {})
+        missing = [position for position in kept if position not in embedded]
+        if missing:
+            missing_texts = [new_docs[position].page_content for position in missing]
+            embedded.update(zip(missing, openai_embeddings.embed_documents(missing_texts)))
+        vectors = [embedded[position] for position in kept]
 
-    # Save the updated vector store back to disk at the specified path
-    faiss_index.save_local(vector_store_path)
+        if vectorstore is None:
+            # Create a new vector store from the documents if the index file doesn't exist
+            vectorstore = build_vector_store_from_embeddings(texts, vectors, metadatas, vector_store_path, ids)
+        elif isinstance(vectorstore, ShardedVectorStore):
+            vectorstore = vectorstore.with_embeddings(
+                texts, vectors, metadatas, vector_store_path, ids=ids, duplicates=duplicates,
+                removed_source=replaced_source
+            )
+        else:
+            if replaced_source is not None:
+                remove_source(vectorstore, replaced_source)
+            for chunk_id, chunk_duplicates in duplicates.items():
+                add_duplicates(vectorstore, chunk_id, chunk_duplicates)
+            if texts:
+                add_embeddings(vectorstore, texts, vectors, metadatas, ids)
+            # Save the updated vector store back to disk at the specified path
+            save_faiss_store(vectorstore, vector_store_path)
+
+        if near_duplicates is not None:
+            vectorstore.near_duplicate_index = near_duplicates
+        return vectorstore, {
+            "chunks": len(new_docs),
+            "duplicates": len(new_docs) - len(kept),
+            "embedded_tokens": sum(count_tokens(new_docs[position].page_content) for position in embedded),
+            "skipped_tokens": sum(
+                count_tokens(doc.page_content) for position, doc in enumerate(new_docs) if position not in embedded
+            ),
+        }
+
+    # Embedding the documents and writing the index block, so they run in a worker thread
+    return await asyncio.to_thread(update)
 
 
 def reload_vector_store(vector_store_path: str):
@@ -59,32 +258,208 @@ def reload_vector_store(vector_store_path: str):
         vector_store_path (str): The path from where to load the FAISS vector store.
 
     Returns:
-        FAISS: An instance of the loaded FAISS vector store.
+        FAISS | ShardedVectorStore: An instance of the loaded FAISS vector store.
 
     Raises:
         FileNotFoundError: If the vector store file is not found at the specified path.
     """
     # Load existing FAISS vector store from the given path using OpenAI embeddings
-    faiss_index = FAISS.load_local(vector_store_path, openai_embeddings, allow_dangerous_deserialization=True)
+    if is_sharded_index(vector_store_path):
+        faiss_index = ShardedVectorStore.load_local(vector_store_path, openai_embeddings)
+    else:
+        faiss_index = load_faiss_store(vector_store_path, openai_embeddings)
+
+    # Index the chunk metadata so that searches can be restricted by metadata filters
+    index_metadata(faiss_index)
     return faiss_index
 
 
-def custom_get_relevant_documents_with_scores(query, retriever, top_k=5):
+def index_metadata(vectorstore):
+    """
+    Build the metadata bitmap index of a vector store, or of every shard of a sharded one, if not built yet.
+    """
+    for shard in getattr(vectorstore, "shards", [vectorstore]):
+        get_metadata_index(shard)
+
+
+def get_near_duplicate_index(vectorstore):
+    """
+    Return the near-duplicate index of a vector store (of all its shards if sharded), building it on first use.
+
+    Like the metadata index, it is attached to the vector store object. It is rebuilt if it does not hold the
+    chunks of the vector store, e.g. after an update that failed once the index had been extended.
+
+    Args:
+        vectorstore (FAISS | ShardedVectorStore): The vector store whose chunks are indexed.
+
+    Returns:
+        NearDuplicateIndex: The near-duplicate index of the vector store.
     """
-    Retrieve documents based on query relevance scores using a vector store retriever.
+    near_duplicates = getattr(vectorstore, "near_duplicate_index", None)
+    if near_duplicates is None or near_duplicates.size != vector_count(vectorstore):
+        near_duplicates = NearDuplicateIndex.from_vectorstore(vectorstore)
+        vectorstore.near_duplicate_index = near_duplicates
+    return near_duplicates
+
 
-    This function uses a vector store retriever to find documents relevant to the given query
+def get_metadata_index(vectorstore):
+    """
+    Return the metadata bitmap index of a vector store, building it on first use.
+
+    The index is attached to the vector store object itself, so a search always uses the
+    metadata index matching the exact vectors it searches.
+
+    Args:
+        vectorstore (FAISS): The LangChain FAISS vector store.
+
+    Returns:
+        MetadataBitmapIndex: The metadata index of the vector store.
+    """
+    metadata_index = getattr(vectorstore, "metadata_index", None)
+    if metadata_index is None or metadata_index.size != vectorstore.index.ntotal:
+        metadata_index = MetadataBitmapIndex.from_vectorstore(vectorstore)
+        vectorstore.metadata_index = metadata_index
+    return metadata_index
+
+
+def get_chunk(vectorstore, chunk_id: str):
+    """
+    Return a stored chunk by its docstore id (the `chunk_id` of search results).
+
+    Args:
+        vectorstore (FAISS | ShardedVectorStore): The vector store holding the chunk (in any shard if sharded).
+        chunk_id (str): The docstore id of the chunk.
+
+    Returns:
+        Document or None: The chunk, or None if the vector store holds no chunk with this id.
+    """
+    for shard in getattr(vectorstore, "shards", [vectorstore]):
+        doc = shard.docstore.search(chunk_id)
+        # The docstore returns a "not found" message instead of a Document for unknown ids
+        if isinstance(doc, Document):
+            return doc
+    return None
+
+
+def custom_get_relevant_documents_with_scores(query, vectorstore, top_k=5, metadata_filter=None):
+    """
+    Retrieve documents based on query relevance scores from a vector store.
+
+    This function embeds the given query, finds the documents relevant to it in the vector store
     and returns the top results with their corresponding similarity scores.
 
     Args:
         query (str): The query for which relevant documents are to be retrieved.
-        retriever: The retriever instance that interacts with the vector store.
+        vectorstore (FAISS): The vector store of the collection to search.
         top_k (int): The number of top relevant documents to retrieve. Default is 5.
+        metadata_filter (MetadataFilter, optional): Restricts the search to the chunks matching the filter.
 
     Returns:
         list of tuples: A list of tuples containing documents and their similarity scores.
     """
-    # Use the retriever to perform similarity search on the vector store
-    # and get the top `k` documents along with their relevance scores.
-    results = retriever.vectorstore.similarity_search_with_score(query, k=top_k)
+    # Embed the query and search the vector store for the top `k` documents along with their scores.
+    with stage("embed"):
+        query_vector = vectorstore.embeddings.embed_query(query)
+    return search_vectors_with_scores(vectorstore, [query_vector], top_k, metadata_filter)[0]
+
+
+def custom_get_relevant_documents_batch_with_scores(queries, vectorstore, top_k=5, metadata_filter=None):
+    """
+    Retrieve relevant documents for many queries at once.
+
+    All queries are embedded with a single batched embedding call and searched against the
+    FAISS index with one matrix k-NN search, instead of one call and one search per query.
+
+    Args:
+        queries (list of str): The queries for which relevant documents are to be retrieved.
+        vectorstore (FAISS): The vector store of the collection to search.
+        top_k (int): The number of top relevant documents to retrieve per query. Default is 5.
+        metadata_filter (MetadataFilter, optional): Restricts the search to the chunks matching the filter.
+
+    Returns:
+        list of lists of tuples: For each query (in order), its documents and their similarity scores.
+    """
+    if not queries:
+        return []
+    with stage("embed"):
+        query_vectors = vectorstore.embeddings.embed_documents(list(queries))
+    return search_vectors_with_scores(vectorstore, query_vectors, top_k, metadata_filter)
+
+
+def search_vectors_with_scores(vectorstore, query_vectors, top_k=5, metadata_filter=None):
+    """
+    Search the FAISS index of a vector store with one or more query embeddings.
+
+    Each returned document is a copy of the stored chunk whose metadata also carries its
+    docstore id as `chunk_id`, so callers can refer to chunks without their text.
+
+    A metadata filter is evaluated into a bitmap of matching FAISS ids and applied during the search
+    through an id selector, so the top `k` results are always taken among the matching chunks.
+
+    The shards of a sharded store are searched in parallel, and their top `k` results merged into the
+    global top `k`.
+
+    Args:
+        vectorstore (FAISS | ShardedVectorStore): The vector store to search.
+        query_vectors (list): The query embeddings (one per query).
+        top_k (int): The number of nearest chunks to return per query.
+        metadata_filter (MetadataFilter, optional): Restricts the search to the chunks matching the filter.
+
+    Returns:
+        list of lists of tuples: For each query vector, its documents and their (L2 distance) scores.
+    """
+    with stage("search"):
+        if not isinstance(vectorstore, ShardedVectorStore):
+            return _search_store(vectorstore, query_vectors, top_k, metadata_filter)
+        if len(vectorstore.shards) == 1:
+            return _search_store(vectorstore.shards[0], query_vectors, top_k, metadata_filter)
+
+        # Scatter: search every shard in a pool thread; gather: merge each query's results across shards
+        futures = [
+            _shard_search_pool.submit(_search_store, shard, query_vectors, top_k, metadata_filter)
+            for shard in vectorstore.shards
+        ]
+        shard_results = [future.result() for future in futures]
+
+        # All shards share the same distance: similarities are the higher the better, distances the lower
+        best = heapq.nlargest \
+            if vectorstore.shards[0].distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT else heapq.nsmallest
+        return [
+            best(top_k, itertools.chain.from_iterable(rows), key=lambda hit: hit[1])
+            for rows in zip(*shard_results)
+        ]
+
+
+def _search_store(vectorstore, query_vectors, top_k, metadata_filter):
+    """
+    Search a single FAISS vector store (see `search_vectors_with_scores`).
+    """
+    matrix = np.asarray(query_vectors, dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(matrix)
+
+    id_bitmap = get_metadata_index(vectorstore).evaluate(metadata_filter)
+    if id_bitmap == 0 or vectorstore.index.ntotal == 0:
+        # No chunk matches the filter, or the index (e.g. a shard) is empty
+        return [[] for _ in range(len(matrix))]
+
+    # One k-NN search for the whole query matrix, restricted to the matching ids if filtered
+    # (a quantized index rescores its candidates with the full-precision vectors)
+    params = None if id_bitmap is None else bitmap_to_search_params(id_bitmap, vectorstore.index.ntotal)
+    scores, ids = search_index(vectorstore, matrix, top_k, params, config.INDEX_RESCORE_FACTOR)
+
+    results = []
+    for row_scores, row_ids in zip(scores, ids):
+        row = []
+        for score, faiss_id in zip(row_scores, row_ids):
+            if faiss_id == -1:
+                # Fewer than `top_k` vectors in the index
+                continue
+            docstore_id = vectorstore.index_to_docstore_id[faiss_id]
+            doc = vectorstore.docstore.search(docstore_id)
+            row.append((
+                Document(page_content=doc.page_content, metadata={**doc.metadata, "chunk_id": docstore_id}),
+                float(score)
+            ))
+        results.append(row)
     return results
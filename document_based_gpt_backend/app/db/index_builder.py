@@ -0,0 +1,377 @@
+# Index builder - This module builds the FAISS index of a collection from a document tree, outside the serving
+# processes (see `app.tools.build_index`).
+#
+# The documents are split into contiguous groups, and each group is loaded, split, embedded and indexed by its own
+# worker process into a partial index. The partial indexes are merged in document order into the final index, which
+# is sharded and quantized as configured, written next to the index it replaces and swapped in once complete.
+#
+# Builds are reproducible: documents are processed in sorted order, chunk ids are derived from the source and chunk
+# index, and the result does not depend on the number of workers. The manifest written with the index records the
+# format version, embedding model, chunking parameters, the documents and their checksums, the checksums of the
+# index files (to verify their integrity) and a digest of the index content, so two builds can be compared.
+#
+# Uploaded documents get back the upload metadata (uploader, upload time, tags) recorded with their content hash,
+# which the metadata filters of searches match.
+
+# import hashlib: used to compute the checksums of the documents and of the index files.
+import hashlib
+# import json: used to write the manifest.
+import json
+# import multiprocessing: the worker processes are spawned, so they do not inherit the parent's threads or clients.
+import multiprocessing
+# Provides functions to interact with the operating system, used here for file paths.
+import os
+# import shutil: used to remove the partial indexes and the replaced index.
+import shutil
+# import sys: used to intern the metadata strings of the chunks.
+import sys
+# import time: used to measure the duration of every build phase.
+import time
+# import uuid: used to derive reproducible chunk ids.
+import uuid
+# import ProcessPoolExecutor: the documents are split and embedded by several worker processes.
+from concurrent.futures import ProcessPoolExecutor
+# import datetime, timezone: used to record the build time in the manifest.
+from datetime import datetime, timezone
+# import Path: used to match the document patterns (including `**` for subdirectories).
+from pathlib import Path
+
+# import faiss: used to serialize the indexes when computing their content digest.
+import faiss
+# import numpy: used to read the full-precision vectors of quantized indexes when computing their content digest.
+import numpy as np
+
+# Imports configuration values like the chunking parameters and index settings from the app's config module.
+from app.core import config
+# Imports the shared OpenAI embeddings client.
+from app.core.openai_provider import get_embeddings
+# Imports the functions creating and saving the final vector store.
+from app.db.faiss_store import build_vector_store_from_embeddings, vector_count
+# Imports the functions creating, saving and loading the partial indexes.
+from app.db.quantized_store import create_faiss_store, add_embeddings, save_faiss_store, load_faiss_store
+# Imports the MinHash/LSH index leaving out the chunks that nearly repeat earlier ones, as done for uploads.
+from app.db.near_duplicate_index import NearDuplicateIndex, find_near_duplicates, with_duplicates
+# Imports the function loading and splitting a document, as done for uploads.
+from app.utils.document_util import load_document
+
+# Name of the manifest file written in the index directory
+INDEX_MANIFEST = "index_manifest.json"
+
+# Version of the index layout and manifest format
+INDEX_FORMAT_VERSION = 1
+
+# Namespace of the chunk ids derived from their source and chunk index
+_CHUNK_ID_NAMESPACE = uuid.UUID("5d9c4c36-31b5-4d2e-9a55-7c3f0c3f6a10")
+
+
+def file_sha256(path: str) -> str:
+    """
+    Return the SHA-256 hex digest of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source: str, chunk_index: int) -> str:
+    """
+    Return the id of a chunk, derived from its source and index so that rebuilds produce the same ids.
+    """
+    return str(uuid.uuid5(_CHUNK_ID_NAMESPACE, f"{source}#{chunk_index}"))
+
+
+def scan_documents(source_dir: str, patterns: list) -> list:
+    """
+    Return the paths of the documents matching any of the patterns, in sorted order.
+
+    Hidden files and directories (e.g. upload sessions) are skipped.
+
+    Args:
+        source_dir (str): The root of the document tree.
+        patterns (list of str): Glob patterns relative to the root (e.g. "*.txt", "**/*.pdf").
+
+    Returns:
+        list of str: The document paths, prefixed with `source_dir`.
+    """
+    root = Path(source_dir)
+    paths = set()
+    for pattern in patterns:
+        for path in root.glob(pattern):
+            relative = path.relative_to(root)
+            if path.is_file() and not any(part.startswith(".") for part in relative.parts):
+                paths.add(os.path.join(source_dir, str(relative)))
+    return sorted(paths)
+
+
+def partition(paths: list, parts: int) -> list:
+    """
+    Split the documents into at most `parts` contiguous groups of similar total size.
+    """
+    sizes = [os.path.getsize(path) for path in paths]
+    target = sum(sizes) / max(1, parts)
+    groups, current, current_size = [], [], 0
+    for path, size in zip(paths, sizes):
+        current.append(path)
+        current_size += size
+        if current_size >= target and len(groups) < parts - 1:
+            groups.append(current)
+            current, current_size = [], 0
+    if current:
+        groups.append(current)
+    return groups
+
+
+def build_partial_index(paths: list, part_dir: str, document_metadata: dict = None) -> dict:
+    """
+    Load, split and embed a group of documents, and save their partial (float32) index. Runs in a worker process.
+
+    Args:
+        paths (list of str): The documents of the group.
+        part_dir (str): The directory to save the partial index to.
+        document_metadata (dict, optional): Metadata added to the chunks of documents, by normalized path.
+
+    Returns:
+        dict: The documents (source, checksum, size, number of chunks, and metadata if any), the number of chunks,
+            whether an index was saved, and the duration of the work in seconds.
+    """
+    start = time.perf_counter()
+    documents, chunks = [], []
+    for path in paths:
+        metadata = (document_metadata or {}).get(os.path.normpath(path))
+        document_chunks = load_document(path, metadata)
+        chunks += document_chunks
+        document = {
+            "source": path, "sha256": file_sha256(path), "size": os.path.getsize(path), "chunks": len(document_chunks)
+        }
+        if metadata:
+            document["metadata"] = metadata
+        documents.append(document)
+
+    if chunks:
+        embeddings = get_embeddings()
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = embeddings.embed_documents(texts)
+        partial = create_faiss_store(embeddings, len(vectors[0]))
+        ids = [chunk_id(chunk.metadata["source"], chunk.metadata["chunk_index"]) for chunk in chunks]
+        add_embeddings(partial, texts, vectors, [chunk.metadata for chunk in chunks], ids)
+        save_faiss_store(partial, part_dir)
+
+    return {
+        "documents": documents,
+        "chunks": len(chunks),
+        "saved": bool(chunks),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _canonical_metadata(metadata: dict) -> dict:
+    """
+    Return a copy of chunk metadata whose strings are interned: equal strings are then the same objects whichever
+    partial index they come from, so the pickled chunk store does not depend on the number of workers (as long as
+    the string hash is fixed, e.g. with PYTHONHASHSEED=0).
+    """
+    return {
+        sys.intern(key): sys.intern(value) if isinstance(value, str) else value for key, value in metadata.items()
+    }
+
+
+def merge_partial_indexes(part_dirs: list):
+    """
+    Merge partial indexes, in order, into a single float32 vector store.
+    """
+    merged = load_faiss_store(part_dirs[0], get_embeddings())
+    for part_dir in part_dirs[1:]:
+        merged.merge_from(load_faiss_store(part_dir, get_embeddings()))
+    return merged
+
+
+def artifact_checksums(index_dir: str) -> dict:
+    """
+    Return the SHA-256 of every file of an index directory (except the manifest), by relative path.
+    """
+    checksums = {}
+    for directory, _, file_names in os.walk(index_dir):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+            relative = os.path.relpath(path, index_dir)
+            if relative != INDEX_MANIFEST:
+                checksums[relative.replace(os.sep, "/")] = file_sha256(path)
+    return dict(sorted(checksums.items()))
+
+
+def content_digest(vectorstore) -> str:
+    """
+    Return the SHA-256 of the content of an index: its vectors and its chunks (ids, texts and metadata), shard by
+    shard. Unlike the checksum of the pickled chunk store, it does not depend on the process that wrote it (pickled
+    sets are ordered by the per-process string hash), so equal digests mean identical indexes.
+    """
+    digest = hashlib.sha256()
+    for shard in getattr(vectorstore, "shards", [vectorstore]):
+        digest.update(faiss.serialize_index(shard.index).tobytes())
+        rescore_vectors = getattr(shard, "rescore_vectors", None)
+        if rescore_vectors is not None:
+            digest.update(np.asarray(rescore_vectors.saved).tobytes())
+        for faiss_id in range(shard.index.ntotal):
+            docstore_id = shard.index_to_docstore_id[faiss_id]
+            doc = shard.docstore.search(docstore_id)
+            chunk = [docstore_id, doc.page_content, doc.metadata]
+            digest.update(json.dumps(chunk, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def read_manifest(index_dir: str):
+    """
+    Return the manifest of a built index, or None if it was not built with this module.
+    """
+    path = os.path.join(index_dir, INDEX_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _install(build_dir: str, index_path: str):
+    """
+    Replace the index at `index_path` with the newly built one.
+    """
+    previous = f"{index_path}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(index_path):
+        os.rename(index_path, previous)
+    os.rename(build_dir, index_path)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def build_index(source_dir: str, index_path: str, patterns: list = ("*.txt",), workers: int = 1,
+                num_shards: int = None, routing: str = None, quantization: str = None,
+                document_metadata: dict = None) -> dict:
+    """
+    Build the index of a document tree and install it at `index_path`.
+
+    Args:
+        source_dir (str): The root of the document tree.
+        index_path (str): The directory of the index to build (replaced once the build completes).
+        patterns (list of str): Glob patterns of the documents, relative to `source_dir`.
+        workers (int): The number of worker processes splitting and embedding the documents.
+        num_shards (int, optional): The number of shards (`INDEX_SHARDS` by default).
+        routing (str, optional): How chunks are assigned to shards (`INDEX_SHARD_ROUTING` by default).
+        quantization (str, optional): How the vectors are stored (`INDEX_QUANTIZATION` by default).
+        document_metadata (dict, optional): Metadata added to the chunks of documents, by normalized path, e.g.
+            the upload metadata returned by `uploaded_document_metadata`.
+
+    Returns:
+        dict: The manifest of the built index.
+
+    Raises:
+        ValueError: If no document matches the patterns, or the documents hold no text.
+    """
+    started_at = datetime.now(timezone.utc)
+    timings = {}
+    start = time.perf_counter()
+    paths = scan_documents(source_dir, list(patterns))
+    if not paths:
+        raise ValueError(f"No documents matching {list(patterns)} in {source_dir}")
+    timings["scan"] = time.perf_counter() - start
+
+    index_path = index_path.rstrip("/")
+    build_dir = f"{index_path}.building"
+    parts_dir = f"{index_path}.parts"
+    for directory in (build_dir, parts_dir):
+        shutil.rmtree(directory, ignore_errors=True)
+
+    try:
+        # Split and embed: one partial index per group of documents
+        start = time.perf_counter()
+        groups = partition(paths, max(1, workers))
+        part_dirs = [os.path.join(parts_dir, f"part-{part_no:03d}") for part_no in range(len(groups))]
+        # Each worker only receives the metadata of its own documents
+        document_metadata = {os.path.normpath(path): metadata for path, metadata in (document_metadata or {}).items()}
+        group_metadata = [
+            {path: document_metadata[path] for path in map(os.path.normpath, group) if path in document_metadata}
+            for group in groups
+        ]
+        if len(groups) == 1:
+            results = [build_partial_index(groups[0], part_dirs[0], group_metadata[0])]
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=len(groups), mp_context=context) as pool:
+                results = list(pool.map(build_partial_index, groups, part_dirs, group_metadata))
+        timings["embed"] = time.perf_counter() - start
+
+        # Merge the partial indexes in document order
+        start = time.perf_counter()
+        saved_parts = [part_dir for part_dir, result in zip(part_dirs, results) if result["saved"]]
+        if not saved_parts:
+            raise ValueError(f"The documents in {source_dir} hold no text to index")
+        merged = merge_partial_indexes(saved_parts)
+        timings["merge"] = time.perf_counter() - start
+
+        # Write the final index, sharded and quantized as configured, without the near-duplicate chunks (in
+        # document order, so the same chunks are kept whatever the number of workers)
+        start = time.perf_counter()
+        ntotal = vector_count(merged)
+        chunk_ids = [merged.index_to_docstore_id[faiss_id] for faiss_id in range(ntotal)]
+        docs = [merged.docstore.search(chunk_id) for chunk_id in chunk_ids]
+        kept, duplicates = range(ntotal), {}
+        if config.NEAR_DUPLICATE_DETECTION:
+            kept, duplicates = find_near_duplicates(docs, chunk_ids, NearDuplicateIndex())
+        metadatas = []
+        for position in kept:
+            chunk_duplicates = duplicates.get(chunk_ids[position], [])
+            metadatas.append(_canonical_metadata(with_duplicates(docs[position].metadata, chunk_duplicates)))
+        final = build_vector_store_from_embeddings(
+            [docs[position].page_content for position in kept],
+            merged.index.reconstruct_n(0, ntotal)[list(kept)],
+            metadatas,
+            build_dir,
+            ids=[chunk_ids[position] for position in kept],
+            num_shards=num_shards,
+            routing=routing,
+            quantization=quantization,
+        )
+        timings["write"] = time.perf_counter() - start
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    checksums = artifact_checksums(build_dir)
+    manifest = {
+        "version": INDEX_FORMAT_VERSION,
+        "built_at": started_at.isoformat(),
+        "embedding_model": get_embeddings().model,
+        "dimension": merged.index.d,
+        "chunking": {
+            "splitter": "RecursiveCharacterTextSplitter",
+            "chunk_size": config.CHUNK_SIZE,
+            "chunk_overlap": config.CHUNK_OVERLAP,
+        },
+        "index": {
+            "shards": len(getattr(final, "shards", [final])),
+            "routing": getattr(final, "routing", None),
+            "quantization": config.INDEX_QUANTIZATION if quantization is None else quantization,
+        },
+        "near_duplicates": {
+            "threshold": config.NEAR_DUPLICATE_THRESHOLD,
+            "permutations": config.MINHASH_PERMUTATIONS,
+            "bands": config.MINHASH_BANDS,
+        } if config.NEAR_DUPLICATE_DETECTION else None,
+        "documents": [document for result in results for document in result["documents"]],
+        "chunks": len(kept),
+        "duplicate_chunks": ntotal - len(kept),
+        "artifacts": checksums,
+        "digest": content_digest(final),
+        "build": {
+            "workers": len(groups),
+            "timings_s": {phase: round(seconds, 3) for phase, seconds in timings.items()},
+            "worker_s": [round(result["seconds"], 3) for result in results],
+        },
+    }
+    with open(os.path.join(build_dir, INDEX_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    _install(build_dir, index_path)
+    return manifest
@@ -0,0 +1,189 @@
+# Metadata bitmap index - This module indexes chunk metadata (source, uploader, upload date, tags) into per-value
+# bitmaps of FAISS ids, so that a metadata filter can be turned into an id selector applied during the FAISS search.
+#
+# A chunk also stands for its near-duplicates in other documents, which were not indexed: it matches a filter when
+# its own metadata or the metadata of any of its near-duplicates does. The copies of the chunks are indexed in
+# levels (level 0: the chunks themselves, level `n`: the `n`-th near-duplicate of the chunks having one); a filter is
+# evaluated within every level, so its conditions are all met by the same document, and the levels are ORed.
+
+# import numpy: used to hand the bitmaps to FAISS as packed uint8 arrays.
+import numpy as np
+# import faiss: provides the id selector and search parameters used to restrict a search.
+import faiss
+
+# Metadata fields indexed into bitmaps. "tags" holds a list of values, the others a single value.
+INDEXED_FIELDS = ("source", "uploaded_by", "uploaded_on", "tags")
+
+
+def metadata_copies(metadata: dict) -> list:
+    """
+    Returns the metadata of a chunk followed by the metadata recorded for each of its near-duplicates.
+    """
+    copies = [metadata, *metadata.get("duplicates", [])]
+    recorded = {copy.get("source") for copy in copies}
+    # Near-duplicates recorded before their metadata was: only their source is known
+    copies += [
+        {**metadata, "source": source} for source in metadata.get("duplicate_sources", []) if source not in recorded
+    ]
+    return copies
+
+
+class MetadataBitmapIndex:
+    """
+    Maps every (field, value) pair of the chunk metadata to a bitmap of the FAISS ids having that value.
+
+    Bitmaps are stored as Python integers (bit `i` set when FAISS id `i` matches), which keeps them compact
+    and makes AND / OR of whole bitmaps a single C-level operation. There is one set of bitmaps per level of copies
+    (see `metadata_copies`), most chunks having a single one.
+    """
+
+    def __init__(self, metadatas: list):
+        """
+        Builds the index from the metadata of every chunk, ordered by FAISS id.
+
+        Args:
+            metadatas (list): `metadatas[i]` is the metadata dict of the chunk with FAISS id `i`.
+        """
+        self.size = len(metadatas)
+        self.all_ids = (1 << self.size) - 1
+
+        # Collect the ids of every value first (per level of copies), then build each bitmap in one go
+        level_postings, level_ids = [], []
+        for faiss_id, metadata in enumerate(metadatas):
+            for level, copy in enumerate(metadata_copies(metadata)):
+                if level == len(level_postings):
+                    level_postings.append({field: {} for field in INDEXED_FIELDS})
+                    level_ids.append([])
+                level_ids[level].append(faiss_id)
+                for field in INDEXED_FIELDS:
+                    values = copy.get(field)
+                    if values is None:
+                        continue
+                    if not isinstance(values, (list, tuple, set)):
+                        values = [values]
+                    for value in values:
+                        level_postings[level][field].setdefault(value, []).append(faiss_id)
+
+        self.levels = [
+            {field: {value: ids_to_bitmap(ids) for value, ids in values.items()} for field, values in postings.items()}
+            for postings in level_postings
+        ]
+        self.level_ids = [self.all_ids] + [ids_to_bitmap(ids) for ids in level_ids[1:]]
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        """
+        Builds the index from the docstore of a LangChain FAISS vector store.
+
+        Args:
+            vectorstore (FAISS): The vector store whose chunks are indexed.
+
+        Returns:
+            MetadataBitmapIndex: The metadata index of the vector store.
+        """
+        id_map = vectorstore.index_to_docstore_id
+        metadatas = [vectorstore.docstore.search(id_map[faiss_id]).metadata for faiss_id in range(len(id_map))]
+        return cls(metadatas)
+
+    @staticmethod
+    def _any_of(bitmaps: dict, field: str, values) -> int:
+        """
+        Returns the bitmap of the ids having any of the given values for the field, within a level.
+        """
+        field_bitmaps = bitmaps[field]
+        bitmap = 0
+        for value in values:
+            bitmap |= field_bitmaps.get(value, 0)
+        return bitmap
+
+    def evaluate(self, metadata_filter):
+        """
+        Evaluates a metadata filter into the bitmap of the matching FAISS ids.
+
+        Conditions of the filter are combined with AND; the values listed within one condition with OR
+        (except `tags_all`, which requires every tag). A chunk matches when its own metadata or the metadata of one
+        of its near-duplicates meets all the conditions.
+
+        Args:
+            metadata_filter (MetadataFilter): The filter to evaluate, or None.
+
+        Returns:
+            int or None: The bitmap of matching ids, or None when the filter does not restrict the search.
+        """
+        if metadata_filter is None:
+            return None
+
+        bitmap = 0
+        for bitmaps, level_ids in zip(self.levels, self.level_ids):
+            bitmap |= self._evaluate_level(bitmaps, level_ids, metadata_filter)
+        return None if bitmap == self.all_ids else bitmap
+
+    def _evaluate_level(self, bitmaps: dict, level_ids: int, metadata_filter) -> int:
+        """
+        Evaluates a metadata filter within a level of copies, into the bitmap of the matching FAISS ids.
+        """
+        bitmap = level_ids
+        if metadata_filter.sources is not None:
+            bitmap &= self._any_of(bitmaps, "source", metadata_filter.sources)
+        if metadata_filter.source_prefix is not None:
+            bitmap &= self._any_of(
+                bitmaps, "source", [s for s in bitmaps["source"] if s.startswith(metadata_filter.source_prefix)]
+            )
+        if metadata_filter.uploaded_by is not None:
+            bitmap &= self._any_of(bitmaps, "uploaded_by", metadata_filter.uploaded_by)
+        if metadata_filter.tags_any is not None:
+            bitmap &= self._any_of(bitmaps, "tags", metadata_filter.tags_any)
+        if metadata_filter.tags_all is not None:
+            for tag in metadata_filter.tags_all:
+                bitmap &= bitmaps["tags"].get(tag, 0)
+        if metadata_filter.uploaded_from is not None or metadata_filter.uploaded_to is not None:
+            # Upload dates are stored as ISO strings, so they compare chronologically as strings
+            start = metadata_filter.uploaded_from.isoformat() if metadata_filter.uploaded_from else ""
+            end = metadata_filter.uploaded_to.isoformat() if metadata_filter.uploaded_to else "9999-12-31"
+            bitmap &= self._any_of(
+                bitmaps, "uploaded_on", [d for d in bitmaps["uploaded_on"] if start <= d <= end]
+            )
+        return bitmap
+
+
+def ids_to_bitmap(ids: list) -> int:
+    """
+    Builds the bitmap (as a Python integer) of the given FAISS ids.
+
+    Args:
+        ids (list): The ids to set (non-empty).
+
+    Returns:
+        int: The bitmap with bit `i` set for every id `i`.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    flags = np.zeros(int(ids.max()) + 1, dtype=bool)
+    flags[ids] = True
+    return int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+
+def count_ids(bitmap: int) -> int:
+    """
+    Returns the number of ids set in a bitmap.
+    """
+    return bin(bitmap).count("1")
+
+
+def bitmap_to_search_params(bitmap: int, size: int):
+    """
+    Converts an id bitmap into FAISS search parameters restricting the search to those ids.
+
+    Args:
+        bitmap (int): The bitmap of allowed FAISS ids.
+        size (int): The number of vectors in the index.
+
+    Returns:
+        faiss.SearchParameters: Parameters holding an `IDSelectorBitmap` for the allowed ids.
+    """
+    # Bit `i` of a little-endian byte string is bit `i % 8` of byte `i // 8`, the layout IDSelectorBitmap expects
+    packed = np.frombuffer(bitmap.to_bytes((size + 7) // 8, "little"), dtype=np.uint8).copy()
+    selector = faiss.IDSelectorBitmap(packed)
+    params = faiss.SearchParameters(sel=selector)
+    # Keep the selector and the packed array alive for as long as the parameters are used
+    params.referenced_selector = (selector, packed)
+    return params
@@ -0,0 +1,296 @@
+# Near-duplicate index - This module detects chunks whose text nearly repeats an already indexed chunk (headers,
+# disclaimers, copied sections), so that they are not embedded and indexed again.
+#
+# Every chunk text is reduced to its set of word shingles (runs of consecutive words) and summarized by a MinHash
+# signature: for each of MINHASH_PERMUTATIONS random hash functions, the smallest hash of its shingles. Two signatures
+# agree on a fraction of their positions that estimates the Jaccard similarity of the shingle sets. Signatures are
+# split into MINHASH_BANDS bands, and a hash table per band (locality-sensitive hashing) maps every band value to the
+# chunks having it: only the chunks sharing at least one band with a new chunk are compared to it.
+#
+# A near-duplicate is mapped to its canonical chunk (the first indexed one): the canonical chunk keeps the sources of
+# its duplicates in its `duplicate_sources` metadata and their filterable metadata (source, uploader, upload day,
+# tags) in its `duplicates` metadata, so that metadata filters still find the copies; searches return it once instead
+# of once per copy.
+
+# import hashlib: the shingle hash, stable across processes unlike the built-in hash(), so that builds are
+# reproducible.
+import hashlib
+# import re: used to split chunk texts into words.
+import re
+
+# import numpy: used to compute the signatures of all the hash functions at once.
+import numpy as np
+# import Document: the chunks of the docstore, told apart from the "not found" message of a docstore search.
+from langchain.schema import Document
+# Imports configuration values like the similarity threshold from the app's config module.
+from app.core import config
+# Imports the metadata fields that metadata filters apply to.
+from app.db.metadata_index import INDEXED_FIELDS
+# Imports the deletion of chunks, used when a document is replaced.
+from app.db.quantized_store import delete_chunks
+
+# Number of consecutive words of a shingle
+_SHINGLE_WORDS = 3
+
+# Mersenne prime 2^61 - 1, the modulus of the random hash functions (a * x + b) mod p
+_PRIME = (1 << 61) - 1
+
+# Words: runs of letters and digits, compared case-insensitively
+_WORD = re.compile(r"\w+")
+
+# Metadata key listing the sources of the near-duplicates of a chunk
+DUPLICATE_SOURCES = "duplicate_sources"
+
+# Metadata key listing the filterable metadata of each near-duplicate of a chunk
+DUPLICATES = "duplicates"
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """
+    Return the 32-bit hashes of the distinct word shingles of a text (a single shingle for shorter texts).
+    """
+    words = _WORD.findall(text.lower())
+    shingles = {
+        " ".join(words[start:start + _SHINGLE_WORDS])
+        for start in range(max(1, len(words) - _SHINGLE_WORDS + 1))
+    }
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of the indexed chunks, and an LSH table per band mapping band values to chunk positions.
+
+    The index is only modified by ingestion (which is serialized), never by searches.
+    """
+
+    def __init__(self, num_permutations: int = config.MINHASH_PERMUTATIONS, num_bands: int = config.MINHASH_BANDS,
+                 threshold: float = config.NEAR_DUPLICATE_THRESHOLD, seed: int = 1):
+        """
+        Args:
+            num_permutations (int): The number of hash functions, i.e. the length of the signatures.
+            num_bands (int): The number of bands the signatures are split into (must divide `num_permutations`).
+                More bands find more candidates of lower similarity.
+            threshold (float): The estimated Jaccard similarity from which a chunk is a near-duplicate.
+            seed (int): Seed of the hash functions; signatures are only comparable with the same seed.
+
+        Raises:
+            ValueError: If `num_bands` does not divide `num_permutations`.
+        """
+        if num_permutations % num_bands:
+            raise ValueError(f"{num_bands} bands do not divide {num_permutations} permutations")
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self.rows = num_permutations // num_bands
+        # a < 2^31 and hashes < 2^32, so a * x + b never overflows 64 bits
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, size=num_permutations, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_permutations, dtype=np.uint64)
+        self.chunk_ids = []
+        self._signatures = []
+        self._tables = [{} for _ in range(num_bands)]
+
+    @property
+    def size(self) -> int:
+        """
+        The number of indexed chunks.
+        """
+        return len(self.chunk_ids)
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Return the MinHash signature of a chunk text.
+        """
+        hashes = shingle_hashes(text)
+        permuted = (hashes[:, None] * self._a + self._b) % _PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> list:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.num_bands)]
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        """
+        Index the signature of a chunk.
+        """
+        position = len(self.chunk_ids)
+        self.chunk_ids.append(chunk_id)
+        self._signatures.append(signature)
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            table.setdefault(key, []).append(position)
+
+    def find(self, signature: np.ndarray):
+        """
+        Return the id of the indexed chunk most similar to a signature, if it is a near-duplicate.
+
+        Returns:
+            str or None: The id of the canonical chunk, or None if no indexed chunk reaches the threshold.
+        """
+        candidates = set()
+        for table, key in zip(self._tables, self._band_keys(signature)):
+            candidates.update(table.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for position in sorted(candidates):
+            similarity = float(np.mean(self._signatures[position] == signature))
+            if similarity > best_similarity or (best is None and similarity == best_similarity):
+                best, best_similarity = position, similarity
+        return None if best is None else self.chunk_ids[best]
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, removed_source: str = None) -> "NearDuplicateIndex":
+        """
+        Build the index of the chunks of a vector store (of all its shards if sharded), in FAISS id order.
+
+        Args:
+            vectorstore (FAISS | ShardedVectorStore): The vector store.
+            removed_source (str, optional): A document about to be removed: the chunks standing only for it are
+                left out (see `without_source`).
+        """
+        index = cls()
+        for shard in getattr(vectorstore, "shards", [vectorstore]):
+            for faiss_id in range(shard.index.ntotal):
+                chunk_id = shard.index_to_docstore_id[faiss_id]
+                doc = shard.docstore.search(chunk_id)
+                if removed_source is not None and without_source(doc.metadata, removed_source) is None:
+                    continue
+                index.add(chunk_id, index.signature(doc.page_content))
+        return index
+
+
+def find_near_duplicates(documents: list, chunk_ids: list, index: NearDuplicateIndex):
+    """
+    Split new chunks into the ones to index and the near-duplicates of indexed chunks or of earlier new chunks.
+
+    The chunks to index are added to the near-duplicate index.
+
+    Args:
+        documents (list): The new `Document` chunks, in order.
+        chunk_ids (list of str): The ids the new chunks are indexed under.
+        index (NearDuplicateIndex): The near-duplicate index of the collection.
+
+    Returns:
+        tuple: The positions of the chunks to index, and the filterable metadata of the near-duplicates by canonical
+            chunk id.
+    """
+    kept, duplicates = [], {}
+    for position, (doc, chunk_id) in enumerate(zip(documents, chunk_ids)):
+        signature = index.signature(doc.page_content)
+        canonical = index.find(signature)
+        if canonical is None:
+            index.add(chunk_id, signature)
+            kept.append(position)
+        else:
+            duplicates.setdefault(canonical, []).append(filterable_metadata(doc.metadata))
+    return kept, duplicates
+
+
+def filterable_metadata(metadata: dict) -> dict:
+    """
+    Return the metadata of a chunk that metadata filters apply to.
+    """
+    return {field: metadata[field] for field in INDEXED_FIELDS if metadata.get(field) is not None}
+
+
+def with_duplicates(metadata: dict, duplicates: list) -> dict:
+    """
+    Return a copy of a chunk's metadata also listing the given near-duplicates (their filterable metadata).
+
+    Near-duplicates with the same metadata as the chunk or as an already listed one are left out.
+    """
+    known = [filterable_metadata(metadata), *metadata.get(DUPLICATES, [])]
+    added = []
+    for duplicate in duplicates:
+        if duplicate not in known and duplicate not in added:
+            added.append(duplicate)
+    if not added:
+        return metadata
+    known_sources = set(metadata.get(DUPLICATE_SOURCES, [])) | {metadata.get("source")}
+    added_sources = [d["source"] for d in added if d["source"] not in known_sources]
+    return {
+        **metadata,
+        DUPLICATE_SOURCES: [*metadata.get(DUPLICATE_SOURCES, []), *dict.fromkeys(added_sources)],
+        DUPLICATES: [*metadata.get(DUPLICATES, []), *added],
+    }
+
+
+def without_source(metadata: dict, source: str):
+    """
+    Return the metadata of a chunk once the document `source` is removed from the collection.
+
+    Near-duplicates from that document are dropped. A chunk of that document that also stands for near-duplicates
+    in other documents is kept for them: the first one takes its place.
+
+    Returns:
+        dict or None: The metadata (the same object if unchanged), or None if the chunk only stood for `source`.
+    """
+    recorded, recorded_sources = metadata.get(DUPLICATES, []), metadata.get(DUPLICATE_SOURCES, [])
+    duplicates = [duplicate for duplicate in recorded if duplicate.get("source") != source]
+    sources = [duplicate_source for duplicate_source in recorded_sources if duplicate_source != source]
+    if metadata.get("source") != source:
+        if len(duplicates) == len(recorded) and len(sources) == len(recorded_sources):
+            return metadata
+        return {**metadata, DUPLICATES: duplicates, DUPLICATE_SOURCES: sources}
+
+    if duplicates:
+        first, duplicates = duplicates[0], duplicates[1:]
+    elif sources:
+        # Near-duplicate recorded before its metadata was: only its source is known
+        first = {"source": sources[0]}
+    else:
+        return None
+    # The upload time described the removed document; the chunk keeps its position, the one of the near-duplicate
+    # in its own document is not recorded
+    kept = {key: value for key, value in metadata.items() if key not in INDEXED_FIELDS and key != "uploaded_at"}
+    return {
+        **kept, **first,
+        DUPLICATES: duplicates,
+        DUPLICATE_SOURCES: [duplicate_source for duplicate_source in sources if duplicate_source != first["source"]],
+    }
+
+
+def holds_source(vectorstore, source: str) -> bool:
+    """
+    Tell whether a FAISS vector store holds chunks of a document, or records near-duplicates from it.
+    """
+    for chunk_id in vectorstore.index_to_docstore_id.values():
+        metadata = vectorstore.docstore.search(chunk_id).metadata
+        if without_source(metadata, source) is not metadata:
+            return True
+    return False
+
+
+def remove_source(vectorstore, source: str) -> bool:
+    """
+    Remove a document from a FAISS vector store: delete the chunks standing only for it, and drop it from the
+    near-duplicates recorded in the others.
+
+    Returns:
+        bool: Whether the vector store held chunks of the document.
+    """
+    deleted, changed = [], False
+    for chunk_id in list(vectorstore.index_to_docstore_id.values()):
+        doc = vectorstore.docstore.search(chunk_id)
+        metadata = without_source(doc.metadata, source)
+        if metadata is None:
+            deleted.append(chunk_id)
+        elif metadata is not doc.metadata:
+            doc.metadata = metadata
+            changed = True
+    delete_chunks(vectorstore, deleted)
+    return changed or bool(deleted)
+
+
+def add_duplicates(vectorstore, chunk_id: str, duplicates: list) -> bool:
+    """
+    Record new near-duplicates in the metadata of an indexed chunk of a FAISS vector store.
+
+    Returns:
+        bool: Whether the chunk is stored in this vector store.
+    """
+    doc = vectorstore.docstore.search(chunk_id)
+    if not isinstance(doc, Document):
+        return False
+    doc.metadata = with_duplicates(doc.metadata, duplicates)
+    return True
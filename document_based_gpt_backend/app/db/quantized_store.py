@@ -0,0 +1,307 @@
+# Quantized vector storage - This module creates, saves and loads the LangChain FAISS stores, optionally keeping
+# their vectors compressed in memory.
+#
+# With "fp16" or "int8" quantization, the FAISS index holds scalar-quantized vectors (2 or 1 bytes per dimension
+# instead of 4), which makes the index 2 to 4 times smaller in memory and faster to load. Searches first rank a
+# shortlist of candidates on the compressed vectors, then rescore it exactly with the full-precision vectors, which
+# are kept in a side file (`vectors.f32`) next to the index and memory-mapped: only the rows of the candidates are
+# read, and they are served from the page cache rather than the process heap.
+#
+# The side file is only ever appended to, so an index loaded earlier keeps reading the unchanged prefix it maps
+# while an update adds vectors. Deleting chunks writes a new side file instead, replacing the mapped one.
+
+# Provides functions to interact with the operating system, used here for file paths and sizes.
+import os
+
+# import numpy: used for the full-precision vectors and the exact distances.
+import numpy as np
+# import faiss: the underlying similarity search library, providing the scalar quantizers.
+import faiss
+# import InMemoryDocstore: the chunk store of a new, empty vector store.
+from langchain_community.docstore.in_memory import InMemoryDocstore
+# import FAISS: the LangChain FAISS vector store.
+from langchain_community.vectorstores import FAISS
+
+# Name of the file holding the full-precision vectors of a quantized index
+RESCORE_VECTORS_FILE = "vectors.f32"
+
+# Supported quantizations of the stored vectors
+QUANTIZATIONS = {
+    "none": None,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Margin added to the value ranges learned by the int8 quantizer, as a fraction of the ranges, so that vectors
+# added after training still mostly fit in them (values outside are clipped, which rescoring corrects)
+_INT8_RANGE_MARGIN = 0.1
+
+# Fraction of the values of newly added vectors falling outside the ranges of the int8 quantizer from which it is
+# retrained on all the vectors of the index: ranges learned from the first few chunks of a collection or shard clip
+# most later vectors, and the clipped codes rank the shortlist too badly for rescoring to recover
+_INT8_RETRAIN_CLIPPED_FRACTION = 0.01
+
+
+class RescoreVectors:
+    """
+    The full-precision vectors of a quantized index: those saved in the side file (memory-mapped) followed by
+    those added since the last save (in memory).
+    """
+
+    def __init__(self, dimension: int, saved=None):
+        """
+        Args:
+            dimension (int): The dimension of the vectors.
+            saved (np.ndarray, optional): The saved vectors, usually a read-only memory map of the side file.
+        """
+        self.dimension = dimension
+        self.saved = saved if saved is not None else np.empty((0, dimension), dtype=np.float32)
+        self._added = []
+        self._added_matrix = None
+
+    def __len__(self) -> int:
+        return len(self.saved) + sum(len(matrix) for matrix in self._added)
+
+    def append(self, matrix: np.ndarray):
+        """
+        Add the vectors of newly indexed chunks (in the order of their FAISS ids).
+        """
+        self._added.append(np.ascontiguousarray(matrix, dtype=np.float32))
+        self._added_matrix = None
+
+    def rows(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Return the vectors of the given FAISS ids.
+        """
+        num_saved = len(self.saved)
+        if not self._added:
+            return np.asarray(self.saved[ids])
+        if self._added_matrix is None:
+            self._added_matrix = np.concatenate(self._added)
+        vectors = np.empty((len(ids), self.dimension), dtype=np.float32)
+        saved = ids < num_saved
+        vectors[saved] = self.saved[ids[saved]]
+        vectors[~saved] = self._added_matrix[ids[~saved] - num_saved]
+        return vectors
+
+    def save(self, path: str):
+        """
+        Append the vectors added since the last save to the side file, and memory-map the whole file again.
+
+        Without saved vectors (a new store, or one whose chunks were deleted), a new side file replaces the existing
+        one, which indexes loaded earlier may still map.
+
+        Args:
+            path (str): The path of the side file.
+        """
+        num_saved = len(self.saved)
+        if not num_saved:
+            with open(f"{path}.tmp", "wb") as f:
+                for matrix in self._added:
+                    f.write(matrix.tobytes())
+            os.replace(f"{path}.tmp", path)
+        else:
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                # Drop anything written after the saved vectors by an update that did not complete
+                f.truncate(num_saved * self.dimension * 4)
+                f.seek(0, os.SEEK_END)
+                for matrix in self._added:
+                    f.write(matrix.tobytes())
+        self.saved = map_rescore_vectors(path, self.dimension, len(self))
+        self._added = []
+        self._added_matrix = None
+
+
+def map_rescore_vectors(path: str, dimension: int, count: int) -> np.ndarray:
+    """
+    Memory-map the first `count` vectors of a side file.
+
+    Raises:
+        ValueError: If the file holds fewer vectors.
+    """
+    if count == 0:
+        return np.empty((0, dimension), dtype=np.float32)
+    if not os.path.exists(path) or os.path.getsize(path) < count * dimension * 4:
+        raise ValueError(f"{path} holds fewer than the {count} vectors of its index")
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(count, dimension))
+
+
+def is_quantized(vectorstore) -> bool:
+    """
+    Check whether a FAISS vector store keeps its vectors quantized.
+    """
+    return isinstance(vectorstore.index, faiss.IndexScalarQuantizer)
+
+
+def _new_index(dimension: int, quantization: str):
+    """
+    Create an empty FAISS index storing vectors with the given quantization.
+    """
+    if QUANTIZATIONS[quantization] is None:
+        return faiss.IndexFlatL2(dimension)
+    index = faiss.IndexScalarQuantizer(dimension, QUANTIZATIONS[quantization], faiss.METRIC_L2)
+    if quantization == "int8":
+        index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        index.sq.rangestat_arg = _INT8_RANGE_MARGIN
+    return index
+
+
+def clipped_fraction(index, matrix: np.ndarray) -> float:
+    """
+    Return the fraction of the values of vectors falling outside the value ranges of a trained int8 quantizer.
+    """
+    trained = faiss.vector_to_array(index.sq.trained)
+    vmin, vdiff = trained[:index.d], trained[index.d:]
+    return float(np.mean((matrix < vmin) | (matrix > vmin + vdiff)))
+
+
+def retrain_quantizer(vectorstore: FAISS, matrix: np.ndarray):
+    """
+    Replace the int8 index of a vector store by one trained on all its vectors and the new ones, re-encoding its
+    vectors from their full-precision copies (FAISS ids are unchanged).
+
+    Args:
+        vectorstore (FAISS): The vector store, with an int8 index.
+        matrix (np.ndarray): The vectors about to be added.
+    """
+    existing = vectorstore.rescore_vectors.rows(np.arange(vectorstore.index.ntotal))
+    index = _new_index(vectorstore.index.d, "int8")
+    index.train(np.concatenate([existing, matrix]))
+    if len(existing):
+        index.add(existing)
+    vectorstore.index = index
+
+
+def create_faiss_store(embeddings, dimension: int, quantization: str = "none") -> FAISS:
+    """
+    Create a FAISS vector store holding no chunks yet.
+
+    Args:
+        embeddings (Embeddings): The embedding model of the collection.
+        dimension (int): The dimension of the embeddings.
+        quantization (str): How the vectors are stored: "none" (float32), "fp16" or "int8".
+
+    Returns:
+        FAISS: The empty vector store.
+
+    Raises:
+        ValueError: If the quantization is unknown.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {tuple(QUANTIZATIONS)}")
+    vectorstore = FAISS(
+        embedding_function=embeddings, index=_new_index(dimension, quantization), docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+    if is_quantized(vectorstore):
+        vectorstore.rescore_vectors = RescoreVectors(dimension)
+    return vectorstore
+
+
+def add_embeddings(vectorstore: FAISS, texts: list, vectors, metadatas: list, ids: list = None) -> list:
+    """
+    Add already embedded chunks to a FAISS vector store, keeping their full-precision vectors if it is quantized.
+
+    An untrained int8 quantizer learns the value ranges of the vectors from the first chunks added. It is retrained
+    on all the vectors when more than `_INT8_RETRAIN_CLIPPED_FRACTION` of the values of new vectors fall outside
+    its ranges, e.g. while a collection or shard created with a few chunks grows.
+
+    Returns:
+        list of str: The ids of the added chunks.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        matrix = matrix.copy()
+        faiss.normalize_L2(matrix)
+    if is_quantized(vectorstore):
+        if not vectorstore.index.is_trained:
+            vectorstore.index.train(matrix)
+        elif (vectorstore.index.sq.qtype == faiss.ScalarQuantizer.QT_8bit
+              and clipped_fraction(vectorstore.index, matrix) > _INT8_RETRAIN_CLIPPED_FRACTION):
+            retrain_quantizer(vectorstore, matrix)
+        vectorstore.rescore_vectors.append(matrix)
+    return vectorstore.add_embeddings(zip(texts, matrix), metadatas=metadatas, ids=ids)
+
+
+def delete_chunks(vectorstore: FAISS, chunk_ids: list):
+    """
+    Delete chunks from a FAISS vector store: the FAISS ids of the following chunks shift down.
+
+    The full-precision vectors of a quantized store are copied without those of the deleted chunks, and saved to a
+    new side file.
+    """
+    if not chunk_ids:
+        return
+    if is_quantized(vectorstore):
+        deleted = set(chunk_ids)
+        kept = np.array(
+            [faiss_id for faiss_id, chunk_id in sorted(vectorstore.index_to_docstore_id.items())
+             if chunk_id not in deleted],
+            dtype=np.int64
+        )
+        rescore_vectors = RescoreVectors(vectorstore.index.d)
+        if len(kept):
+            rescore_vectors.append(vectorstore.rescore_vectors.rows(kept))
+        vectorstore.rescore_vectors = rescore_vectors
+    vectorstore.delete(list(chunk_ids))
+
+
+def save_faiss_store(vectorstore: FAISS, path: str):
+    """
+    Save a FAISS vector store, and the full-precision vectors added to it if it is quantized.
+
+    The vectors are saved first: a side file holding more vectors than its index is consistent, but not the reverse.
+    """
+    if is_quantized(vectorstore):
+        os.makedirs(path, exist_ok=True)
+        vectorstore.rescore_vectors.save(os.path.join(path, RESCORE_VECTORS_FILE))
+    vectorstore.save_local(path)
+
+
+def load_faiss_store(path: str, embeddings) -> FAISS:
+    """
+    Load a FAISS vector store saved with `save_faiss_store`, memory-mapping its full-precision vectors if quantized.
+
+    Raises:
+        FileNotFoundError: If the vector store is not found at the specified path.
+    """
+    vectorstore = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    if is_quantized(vectorstore):
+        dimension = vectorstore.index.d
+        saved = map_rescore_vectors(os.path.join(path, RESCORE_VECTORS_FILE), dimension, vectorstore.index.ntotal)
+        vectorstore.rescore_vectors = RescoreVectors(dimension, saved)
+    return vectorstore
+
+
+def search_index(vectorstore: FAISS, matrix: np.ndarray, top_k: int, params=None, rescore_factor: int = 4):
+    """
+    Search the FAISS index of a vector store.
+
+    A quantized index is searched for `top_k * rescore_factor` candidates per query, which are then ranked
+    by their exact (squared L2) distance to the query.
+
+    Args:
+        vectorstore (FAISS): The vector store to search.
+        matrix (np.ndarray): The query vectors.
+        top_k (int): The number of nearest chunks to return per query.
+        params (faiss.SearchParameters, optional): Search parameters, e.g. restricting the searched ids.
+        rescore_factor (int): Size of the shortlist rescored exactly, as a multiple of `top_k`.
+
+    Returns:
+        tuple: The scores and FAISS ids of the results, as returned by `faiss.Index.search`.
+    """
+    if not is_quantized(vectorstore):
+        return vectorstore.index.search(matrix, top_k, params=params)
+
+    _, candidates = vectorstore.index.search(matrix, top_k * max(1, rescore_factor), params=params)
+    scores = np.full((len(matrix), top_k), np.inf, dtype=np.float32)
+    ids = np.full((len(matrix), top_k), -1, dtype=np.int64)
+    for row, (query, row_candidates) in enumerate(zip(matrix, candidates)):
+        row_candidates = row_candidates[row_candidates != -1]
+        if not len(row_candidates):
+            continue
+        distances = ((vectorstore.rescore_vectors.rows(row_candidates) - query) ** 2).sum(axis=1)
+        best = np.argsort(distances, kind="stable")[:top_k]
+        scores[row, :len(best)] = distances[best]
+        ids[row, :len(best)] = row_candidates[best]
+    return scores, ids
@@ -0,0 +1,225 @@
+# Sharded vector store - This module splits the FAISS index of a collection into several smaller indexes (shards)
+# searched in parallel.
+#
+# A sharded index is a directory holding a manifest (`shards.json`: number of shards and routing) and one LangChain
+# FAISS index per shard (`shard-000/`, `shard-001/`, ...). Every chunk is stored in exactly one shard, chosen from a
+# stable hash of either its source document ("source" routing: a document's chunks stay together) or its chunk id
+# ("chunk" routing: the chunks of a large document are spread evenly).
+#
+# All shards are built with the same embedding model and distance, so their scores are directly comparable and the
+# global top `k` of a search is the best `k` of the shards' own top `k` results.
+
+# import hashlib: the routing hash, stable across processes unlike the built-in hash(), and well spread even
+# for keys differing in a single character (unlike crc32).
+import hashlib
+# import json: used to read and write the manifest of a sharded index.
+import json
+# Provides functions to interact with the operating system, used here for file paths.
+import os
+# import uuid: used to generate the chunk ids before routing the chunks to their shards.
+import uuid
+
+# import Document: the chunks of the docstore, told apart from the "not found" message of a docstore search.
+from langchain.schema import Document
+
+# Imports the functions creating, updating, saving and loading the FAISS vector store of each shard.
+from app.db.quantized_store import create_faiss_store, add_embeddings, save_faiss_store, load_faiss_store
+# Imports the functions recording near-duplicates in the metadata of their canonical chunk, and removing documents.
+from app.db.near_duplicate_index import add_duplicates, holds_source, remove_source
+
+# Name of the manifest file of a sharded index
+SHARD_MANIFEST = "shards.json"
+
+# Ways of assigning chunks to shards
+SHARD_ROUTINGS = ("source", "chunk")
+
+
+def is_sharded_index(index_path: str) -> bool:
+    """
+    Check whether an index directory holds a sharded index.
+    """
+    return os.path.exists(os.path.join(index_path, SHARD_MANIFEST))
+
+
+def shard_directory(index_path: str, shard_no: int) -> str:
+    """
+    Return the directory of one shard of a sharded index.
+    """
+    return os.path.join(index_path, f"shard-{shard_no:03d}")
+
+
+def shard_for_key(key: str, num_shards: int) -> int:
+    """
+    Return the shard of a routing key (source path or chunk id).
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % num_shards
+
+
+class ShardedVectorStore:
+    """
+    A collection index split into several FAISS vector stores.
+
+    Like a FAISS vector store, a sharded store is never modified once it serves searches: adding chunks returns
+    a new sharded store, which shares the shards that did not change.
+    """
+
+    def __init__(self, shards: list, routing: str = "source"):
+        """
+        Args:
+            shards (list of FAISS): The vector store of each shard.
+            routing (str): How chunks are assigned to shards ("source" or "chunk").
+        """
+        if routing not in SHARD_ROUTINGS:
+            raise ValueError(f"Unknown shard routing '{routing}', expected one of {SHARD_ROUTINGS}")
+        self.shards = shards
+        self.routing = routing
+
+    @property
+    def embeddings(self):
+        """
+        The embedding model of the collection, shared by all shards.
+        """
+        return self.shards[0].embeddings
+
+    @property
+    def ntotal(self) -> int:
+        """
+        The number of chunks in all shards.
+        """
+        return sum(shard.index.ntotal for shard in self.shards)
+
+    def shard_of(self, metadata: dict, chunk_id: str) -> int:
+        """
+        Return the shard a chunk is stored in.
+        """
+        key = (metadata.get("source") or chunk_id) if self.routing == "source" else chunk_id
+        return shard_for_key(key, len(self.shards))
+
+    def with_embeddings(self, texts: list, vectors: list, metadatas: list, index_path: str = None,
+                        in_place: bool = False, ids: list = None, duplicates: dict = None,
+                        removed_source: str = None) -> "ShardedVectorStore":
+        """
+        Add already embedded chunks to their shards, and record the near-duplicates of stored chunks.
+
+        The shards receiving chunks or near-duplicates, or holding chunks of the removed document, are copied
+        (reloaded from `index_path`) before being modified, unless `in_place` is set, so the searches using this
+        store are not affected.
+
+        Args:
+            texts (list of str): The chunk texts.
+            vectors (list): The embedding of each chunk.
+            metadatas (list of dict): The metadata of each chunk.
+            index_path (str, optional): Directory of the saved sharded index, where the modified shards are saved.
+            in_place (bool): Modify this store's shards instead of copies (only for stores not serving searches).
+            ids (list of str, optional): The chunk ids (random ones are generated by default).
+            duplicates (dict, optional): The metadata of new near-duplicates, by id of the stored chunk they repeat.
+            removed_source (str, optional): A document to remove first (see `remove_source`), e.g. the previous
+                version of the document being added.
+
+        Returns:
+            ShardedVectorStore: The store holding the new chunks.
+        """
+        groups = {}
+        for position, (text, vector, metadata) in enumerate(zip(texts, vectors, metadatas)):
+            chunk_id = ids[position] if ids is not None else str(uuid.uuid4())
+            group = groups.setdefault(self.shard_of(metadata, chunk_id), ([], [], [], []))
+            for values, value in zip(group, (text, vector, metadata, chunk_id)):
+                values.append(value)
+
+        # The stored chunks repeated by near-duplicates are looked up in every shard (their source is not known here)
+        shard_duplicates = {}
+        for chunk_id, chunk_duplicates in (duplicates or {}).items():
+            for shard_no, shard in enumerate(self.shards):
+                if isinstance(shard.docstore.search(chunk_id), Document):
+                    shard_duplicates.setdefault(shard_no, {})[chunk_id] = chunk_duplicates
+                    break
+
+        removing = set()
+        if removed_source is not None:
+            removing = {shard_no for shard_no, shard in enumerate(self.shards) if holds_source(shard, removed_source)}
+
+        shards = list(self.shards)
+        for shard_no in sorted(set(groups) | set(shard_duplicates) | removing):
+            if not in_place:
+                shards[shard_no] = load_faiss_store(shard_directory(index_path, shard_no), self.embeddings)
+            if shard_no in removing:
+                remove_source(shards[shard_no], removed_source)
+            for chunk_id, chunk_duplicates in shard_duplicates.get(shard_no, {}).items():
+                add_duplicates(shards[shard_no], chunk_id, chunk_duplicates)
+            if shard_no in groups:
+                add_embeddings(shards[shard_no], *groups[shard_no])
+            if index_path is not None:
+                save_faiss_store(shards[shard_no], shard_directory(index_path, shard_no))
+        return ShardedVectorStore(shards, self.routing)
+
+    def add_documents(self, documents: list, index_path: str = None, in_place: bool = False) -> "ShardedVectorStore":
+        """
+        Embed documents and add them to their shards (see `with_embeddings`).
+
+        The documents are embedded with a single batched call, whatever the number of shards receiving them.
+        """
+        texts = [doc.page_content for doc in documents]
+        vectors = self.embeddings.embed_documents(texts)
+        return self.with_embeddings(texts, vectors, [doc.metadata for doc in documents], index_path, in_place)
+
+    @classmethod
+    def from_embeddings(cls, texts: list, vectors: list, metadatas: list, embeddings, num_shards: int,
+                        routing: str = "source", quantization: str = "none", ids: list = None) -> "ShardedVectorStore":
+        """
+        Build a sharded store from already embedded chunks.
+
+        Args:
+            texts (list of str): The chunk texts.
+            vectors (list): The embedding of each chunk (at least one).
+            metadatas (list of dict): The metadata of each chunk.
+            embeddings (Embeddings): The embedding model of the collection.
+            num_shards (int): The number of shards.
+            routing (str): How chunks are assigned to shards ("source" or "chunk").
+            quantization (str): How the shards store the vectors: "none" (float32), "fp16" or "int8".
+            ids (list of str, optional): The chunk ids (random ones are generated by default).
+
+        Returns:
+            ShardedVectorStore: The new sharded store.
+        """
+        dimension = len(vectors[0])
+        store = cls([create_faiss_store(embeddings, dimension, quantization) for _ in range(num_shards)], routing)
+        return store.with_embeddings(texts, vectors, metadatas, in_place=True, ids=ids)
+
+    @classmethod
+    def from_documents(cls, documents: list, embeddings, num_shards: int, routing: str = "source",
+                       quantization: str = "none") -> "ShardedVectorStore":
+        """
+        Embed documents and build a sharded store from them (see `from_embeddings`).
+        """
+        texts = [doc.page_content for doc in documents]
+        vectors = embeddings.embed_documents(texts)
+        return cls.from_embeddings(
+            texts, vectors, [doc.metadata for doc in documents], embeddings, num_shards, routing, quantization
+        )
+
+    def save_local(self, index_path: str):
+        """
+        Save every shard and the manifest to an index directory.
+        """
+        for shard_no, shard in enumerate(self.shards):
+            save_faiss_store(shard, shard_directory(index_path, shard_no))
+        # The manifest is written last: a directory without it is not taken for a complete sharded index
+        with open(os.path.join(index_path, SHARD_MANIFEST), "w") as f:
+            json.dump({"shards": len(self.shards), "routing": self.routing}, f)
+
+    @classmethod
+    def load_local(cls, index_path: str, embeddings) -> "ShardedVectorStore":
+        """
+        Load a sharded index saved with `save_local`.
+
+        Raises:
+            FileNotFoundError: If the manifest or a shard is missing.
+        """
+        with open(os.path.join(index_path, SHARD_MANIFEST)) as f:
+            manifest = json.load(f)
+        shards = [
+            load_faiss_store(shard_directory(index_path, shard_no), embeddings)
+            for shard_no in range(manifest["shards"])
+        ]
+        return cls(shards, manifest.get("routing", "source"))
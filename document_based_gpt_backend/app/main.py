@@ -4,8 +4,20 @@ from fastapi import FastAPI
 # Import CORS middleware to allow cross-origin requests from front-end applications
 from fastapi.middleware.cors import CORSMiddleware
 
+# Import GZip middleware to compress large responses
+from fastapi.middleware.gzip import GZipMiddleware
+
 # Import routers for different API endpoints (authentication, document upload, and query handling)
-from app.api.v1.routers import auth_router, document_router, query_router
+from app.api.v1.routers import auth_router, document_router, query_router, metrics_router, admin_router
+
+# Import configuration values such as the maximum upload size
+from app.core import config
+
+# Import the middleware rejecting oversized upload bodies
+from app.utils.upload_util import MaxBodySizeMiddleware
+
+# Import the orjson response class used by default for JSON responses
+from app.utils.response_util import FastJSONResponse
 
 # Import logging configuration function to set up application-level logging
 from app.core.logging_config import setup_logging
@@ -17,12 +29,28 @@ from app.services.vector_store_service import VectorStoreService
 # This ensures that the vector store is created and available throughout the application's lifecycle
 vector_service = VectorStoreService()
 
-# Create a FastAPI application instance
-app = FastAPI()
+# Create a FastAPI application instance, serializing JSON responses with orjson
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Set up logging for the application
 setup_logging()
 
+# Reject oversized uploads with 413 before their body is read (the slack covers the multipart framing).
+# Added before the CORS middleware so that CORS stays the outermost layer and also applies to these responses.
+app.add_middleware(
+    MaxBodySizeMiddleware,
+    max_bytes=config.MAX_UPLOAD_BYTES + 64 * 1024,
+    path_prefixes=("/v1/document/upload",),
+)
+
+# Compress responses of at least RESPONSE_GZIP_MIN_BYTES (answers with their sources, search pages, batches) for the
+# clients sending `Accept-Encoding: gzip`; streamed NDJSON batches are compressed line by line as they are sent
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=config.RESPONSE_GZIP_MIN_BYTES,
+    compresslevel=config.RESPONSE_GZIP_LEVEL,
+)
+
 # Add middleware to handle Cross-Origin Resource Sharing (CORS) for the front-end
 app.add_middleware(
     CORSMiddleware,
@@ -43,3 +71,9 @@ app.include_router(document_router.router, prefix="/v1/document", tags=["documen
 
 # Query router to handle user queries and retrieve responses from vector-based document data
 app.include_router(query_router.router, prefix="/v1/query", tags=["query"])
+
+# Metrics router to expose in-process metrics such as prompt token counts
+app.include_router(metrics_router.router, prefix="/v1/metrics", tags=["metrics"])
+
+# Admin router for operations on the running service (admin-only access)
+app.include_router(admin_router.router, prefix="/v1/admin", tags=["admin"])
@@ -0,0 +1,8 @@
+# Admin related Pydantic Schemas
+from pydantic import BaseModel
+
+
+class ProfileStart(BaseModel):
+    seconds: float = 30  # Duration of the profile, which stops by itself afterwards (at most PROFILER_MAX_SECONDS)
+    interval_ms: float = 10  # Time between two samples of the threads' stacks
+    idle: bool = False  # Also record the threads waiting for work (on a lock, a queue or the event loop)
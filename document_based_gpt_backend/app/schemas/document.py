@@ -1,7 +1,17 @@
 # Document related Pydantic Schemas
+from typing import Optional
+
 from pydantic import BaseModel
 
 
 class DocumentUploadResponse(BaseModel):
     message: str
 
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    collection: Optional[str] = None  # Collection the document is added to (the default collection if omitted)
+
+
+class UploadSessionComplete(BaseModel):
+    tags: Optional[str] = None  # Comma-separated tags stored with the document's chunks
@@ -1,6 +1,43 @@
 # Query related Pydantic Schemas
+from datetime import date
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
+class MetadataFilter(BaseModel):
+    # Conditions are combined with AND; the values listed within one condition with OR
+    sources: Optional[List[str]] = None  # Chunks from any of these sources
+    source_prefix: Optional[str] = None  # Chunks whose source starts with this prefix
+    uploaded_by: Optional[List[str]] = None  # Chunks uploaded by any of these users
+    tags_any: Optional[List[str]] = None  # Chunks having at least one of these tags
+    tags_all: Optional[List[str]] = None  # Chunks having all of these tags
+    uploaded_from: Optional[date] = None  # Chunks uploaded on or after this date
+    uploaded_to: Optional[date] = None  # Chunks uploaded on or before this date
+
+
 class AskQuery(BaseModel):
     query: str
+    collection: Optional[str] = None  # Collection searched (the default collection if omitted)
+    filter: Optional[MetadataFilter] = None  # Restricts the documents used to answer
+    timeout_ms: Optional[int] = None  # Latency budget; a degraded extractive answer is returned when exceeded
+    compact_sources: bool = False  # Return only the id and score of each source (texts: GET /v1/document/chunk/{id})
+
+
+class BatchAskQuery(BaseModel):
+    queries: List[str]
+    collection: Optional[str] = None  # Collection searched for every query (the default collection if omitted)
+    top_k: int = 5  # Number of chunks retrieved per query (1 to SEARCH_MAX_K)
+    retrieval_only: bool = False  # Return only the sources, without generating answers
+    stream: bool = False  # Stream results as NDJSON lines in completion order
+    compact_sources: bool = False  # Return only the id and score of each source (texts: GET /v1/document/chunk/{id})
+    filter: Optional[MetadataFilter] = None  # Restricts the documents used for every query
+
+
+class SearchQuery(BaseModel):
+    query: str
+    collection: Optional[str] = None  # Collection searched (the default collection if omitted)
+    k: int = 10  # Number of ranked results considered
+    offset: int = 0  # Pagination offset within the `k` results
+    limit: int = 10  # Page size
+    filter: Optional[MetadataFilter] = None  # Only return chunks matching this metadata filter
@@ -0,0 +1,303 @@
+# Admission control - Decides which requests may use the LLM (and the OpenAI quota) and when.
+#
+# - Every user has a token bucket: requests beyond its sustained rate and burst are rejected with 429.
+# - Work is admitted through lanes, each with its own concurrency limit and bounded queue. Questions and admin
+#   ingestion use separate lanes, so a burst of uploads never holds the slots questions need (and vice versa).
+# - Within a lane, waiting requests are ordered by priority, then fairly between users (start-time fair queueing):
+#   a user with many queued requests gets one turn for every turn of the other waiting users.
+# - When a lane's queue is full, requests are shed with 429 and a Retry-After estimated from the recent
+#   slot holding times.
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+# Import HTTPException from FastAPI to reject requests
+from fastapi import HTTPException
+
+# Import configuration values such as the rate limits and lane sizes
+from app.core import config
+
+# Import the metrics registry to expose queue depths, waiting times and rejections
+from app.utils.metrics_util import metrics
+
+# Import the stage timer recording the time requests wait for a slot in their trace
+from app.utils.trace_util import stage
+
+# Priority of requests from admins and from other users (lower is served first)
+ADMIN_PRIORITY = 0
+USER_PRIORITY = 1
+
+# Weight of the latest slot holding time in its moving average, used to estimate Retry-After
+_HOLD_TIME_SMOOTHING = 0.2
+
+
+def too_many_requests_error(detail: str, retry_after: float) -> HTTPException:
+    """
+    Returns the HTTP 429 error telling the client when to retry.
+    """
+    return HTTPException(
+        status_code=429, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def user_key(current_user: dict) -> str:
+    """
+    Returns the identity requests are rate limited and scheduled by: the JWT subject (username).
+    """
+    return current_user["username"]
+
+
+def user_priority(current_user: dict) -> int:
+    """
+    Returns the scheduling priority of a user's requests.
+    """
+    return ADMIN_PRIORITY if current_user.get("role") == "admin" else USER_PRIORITY
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at `rate` tokens per second, holding at most `burst` tokens.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """
+        Takes `cost` tokens if available.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds until they will be available.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # A request may cost more than the burst (e.g. a large batch); it then needs a full bucket
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Per-user token buckets. Only the `max_users` most recently seen users are remembered: a forgotten user
+    starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: int, max_users: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+
+    def check(self, key: str, cost: float = 1.0):
+        """
+        Charges a request to the user's bucket.
+
+        Raises:
+            HTTPException: 429 with Retry-After if the user exceeded their rate.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        retry_after = bucket.take(cost)
+        if retry_after:
+            metrics.increment("admission_rejected", reason="rate_limit")
+            raise too_many_requests_error("Rate limit exceeded, please slow down", retry_after)
+
+
+class AdmissionLane:
+    """
+    A concurrency limit with a bounded queue, served by priority and then fairly between users.
+
+    Slots are handed directly to the next waiter on release, so a newly arriving request never overtakes
+    queued ones. Meant to be used from the event loop only (it is not thread-safe).
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_queued: int):
+        """
+        Args:
+            name (str): Name of the lane, used to label its metrics (e.g. "query").
+            max_in_flight (int): Maximum number of slots held at once.
+            max_queued (int): Maximum number of requests waiting for a slot.
+        """
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self._in_flight = 0
+        self._waiting = 0
+        self._queue = []  # heap of (priority, finish tag, sequence, future)
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._user_tags = {}  # user -> finish tag of their last queued request
+        self._hold_seconds = 1.0  # moving average of the slot holding time
+
+    def _retry_after(self) -> float:
+        """
+        Estimates how long the queued requests will take to drain.
+        """
+        return (self._waiting + 1) * self._hold_seconds / self.max_in_flight
+
+    def _update_gauges(self):
+        metrics.set_gauge("admission_in_flight", self._in_flight, lane=self.name)
+        metrics.set_gauge("admission_queued", self._waiting, lane=self.name)
+
+    def ensure_capacity(self):
+        """
+        Rejects a request early, before any work is done for it, when the lane's queue is already full.
+
+        Raises:
+            HTTPException: 429 with Retry-After if the queue is full.
+        """
+        if self._in_flight >= self.max_in_flight and self._waiting >= self.max_queued:
+            metrics.increment("admission_rejected", reason="queue_full", lane=self.name)
+            raise too_many_requests_error("The server is busy, please retry later", self._retry_after())
+
+    def _finish_tag(self, user: str) -> float:
+        """
+        Returns the fair-queueing tag of a new request: each user's requests are spaced one unit apart,
+        starting no earlier than the lane's current virtual time.
+        """
+        tag = max(self._virtual_time, self._user_tags.get(user, 0.0)) + 1.0
+        self._user_tags[user] = tag
+        return tag
+
+    async def acquire(self, user: str, priority: int = USER_PRIORITY, timeout: float = None):
+        """
+        Waits for a slot of the lane.
+
+        Args:
+            user (str): The user the request is scheduled for.
+            priority (int): Requests with a lower priority value are served first.
+            timeout (float, optional): Maximum number of seconds to wait in the queue.
+
+        Raises:
+            HTTPException: 429 with Retry-After if the queue is full or the timeout expires in it.
+        """
+        if self._in_flight < self.max_in_flight and not self._waiting:
+            self._in_flight += 1
+            self._update_gauges()
+            metrics.observe("admission_wait_ms", 0.0, lane=self.name)
+            return
+
+        self.ensure_capacity()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, self._finish_tag(user), next(self._sequence), future))
+        self._waiting += 1
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("admission_rejected", reason="queue_timeout", lane=self.name)
+            raise too_many_requests_error("The server is busy, please retry later", self._retry_after())
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the caller gave up: pass it on
+                self.release()
+            raise
+        finally:
+            if not future.done() or future.cancelled():
+                # Still queued: the entry is skipped when it reaches the head of the queue
+                self._waiting -= 1
+                future.cancel()
+                self._update_gauges()
+            metrics.observe("admission_wait_ms", (time.perf_counter() - start) * 1000, lane=self.name)
+
+    def release(self, held_seconds: float = None):
+        """
+        Releases a slot, handing it to the next waiting request if any.
+
+        Args:
+            held_seconds (float, optional): How long the slot was held, used to estimate Retry-After.
+        """
+        if held_seconds is not None:
+            self._hold_seconds += _HOLD_TIME_SMOOTHING * (held_seconds - self._hold_seconds)
+
+        while self._queue:
+            _, tag, _, future = heapq.heappop(self._queue)
+            if future.done():
+                # Abandoned by a caller that timed out or was cancelled
+                continue
+            self._virtual_time = tag
+            self._waiting -= 1
+            future.set_result(None)
+            self._update_gauges()
+            return
+
+        self._in_flight -= 1
+        # Nobody is waiting: forget the users' tags, so the map does not grow with every user ever seen
+        self._user_tags.clear()
+        self._update_gauges()
+
+    async def run_in_thread(self, user: str, priority: int, fn, *args, timeout: float = None):
+        """
+        Runs the blocking `fn(*args)` in a worker thread while holding a slot of the lane.
+
+        A worker thread cannot be interrupted, so the slot is held until the thread finishes, even if the caller
+        stops waiting for it (e.g. its deadline expired): the limit bounds the work actually in progress.
+
+        Args:
+            user (str): The user the request is scheduled for.
+            priority (int): Requests with a lower priority value are served first.
+            fn (Callable): The blocking function.
+            *args: Arguments passed to `fn`.
+            timeout (float, optional): Maximum number of seconds to wait in the queue.
+
+        Returns:
+            Any: The result of `fn`.
+
+        Raises:
+            HTTPException: 429 with Retry-After if the queue is full or the timeout expires in it.
+        """
+        with stage("queue"):
+            await self.acquire(user, priority, timeout)
+        start = time.perf_counter()
+        task = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+
+        def on_done(done_task):
+            self.release(time.perf_counter() - start)
+            if not done_task.cancelled():
+                # Mark the exception as retrieved when the caller is no longer waiting for it
+                done_task.exception()
+
+        task.add_done_callback(on_done)
+        return await asyncio.shield(task)
+
+    @asynccontextmanager
+    async def slot(self, user: str, priority: int = USER_PRIORITY, timeout: float = None):
+        """
+        Holds a slot of the lane for the duration of the block.
+        """
+        with stage("queue"):
+            await self.acquire(user, priority, timeout)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+
+# Per-user rate limits, shared by the query endpoints
+rate_limiter = RateLimiter(config.RATE_LIMIT_PER_SECOND, config.RATE_LIMIT_BURST, config.RATE_LIMIT_MAX_USERS)
+
+# Lane of the LLM completions answering questions
+query_lane = AdmissionLane("query", config.QUERY_MAX_IN_FLIGHT, config.QUERY_MAX_QUEUED)
+
+# Separate lane for admin document ingestion (parsing, embedding and index updates)
+ingest_lane = AdmissionLane("ingest", config.INGEST_MAX_IN_FLIGHT, config.INGEST_MAX_QUEUED)
@@ -1,22 +1,360 @@
-# Import UploadFile from FastAPI to handle file uploads
-from fastapi import UploadFile
+# Import asyncio to serialize indexing and run blocking file writes off the event loop
+import asyncio
 
-# Import configurations for file paths from the core config module
+# Import standard library modules for hashing, file operations and session bookkeeping
+import hashlib
+import os
+import time
+import uuid
+
+# Import UploadFile and HTTPException from FastAPI to handle file uploads and errors
+from fastapi import HTTPException, UploadFile
+
+# Import configurations for file paths and upload limits from the core config module
+from app.core import config
+
+# Import the store of content hashes used to detect re-uploads of identical documents
+from app.db.content_hash_store import find_document_by_hash, record_document_hash
+
+# Import upload utilities to stream files to disk and move them into place
+from app.utils.upload_util import (
+    safe_filename, too_large_error, stream_upload_to_temp_file, commit_upload, discard_upload
+)
+
+# Import the builder of the upload metadata stored in the chunks of a document
+from app.utils.document_util import upload_metadata
+
+# Import the metrics registry to count duplicate uploads and indexed bytes
+from app.utils.metrics_util import metrics
+
+# Import the vector store service to index the uploaded documents
 from app.services.vector_store_service import VectorStoreService
 
+# Import the admin ingestion lane, which bounds the indexing work separately from the questions
+from app.services.admission_service import ingest_lane, ADMIN_PRIORITY
+
+# Serializes the duplicate check and the index update, so two uploads never update the vector store at once
+# (documents are parsed and embedded outside of it, up to INGEST_MAX_IN_FLIGHT at once)
+_index_lock = asyncio.Lock()
+
+# Resumable upload sessions in progress, keyed by upload id
+upload_sessions = {}
+
+
+def parse_tags(tags: str = None) -> list:
+    """
+    Parses comma-separated tags into a list, ignoring empty entries.
+    """
+    return [tag.strip() for tag in tags.split(",") if tag.strip()] if tags else []
+
+
+def document_path(filename: str, collection: str) -> str:
+    """
+    Returns the path a document of a collection is saved at.
+    """
+    if collection == config.DEFAULT_COLLECTION:
+        return f"{config.DOCUMENT_DIRECTORY_PATH}/new_docs/{filename}"
+    return f"{config.DOCUMENT_DIRECTORY_PATH}/collections/{collection}/{filename}"
+
+
+async def index_uploaded_file(temp_path: str, filename: str, size: int, content_hash: str,
+                              uploaded_by: str = None, tags: list = None, collection: str = config.DEFAULT_COLLECTION):
+    """
+    Indexes a fully received upload, unless a document with the same content is already indexed in the collection.
+
+    Indexing runs in the admin ingestion lane: uploads wait there for their turn (fairly between uploaders),
+    without taking the slots of the query lane. Documents holding a slot are parsed and embedded concurrently;
+    only the duplicate check and the index update are done one document at a time.
+
+    Args:
+        temp_path (str): Path of the temporary file holding the upload.
+        filename (str): The (sanitized) name of the document.
+        size (int): Size of the upload in bytes.
+        content_hash (str): SHA-256 hex digest computed while receiving the upload.
+        uploaded_by (str, optional): Username of the uploader.
+        tags (list, optional): Tags recorded in the chunk metadata.
+        collection (str): The collection the document is added to.
+
+    Returns:
+        dict: A message describing the outcome, with `duplicate_of` set when the upload was skipped.
+
+    Raises:
+        HTTPException: 429 with Retry-After if the ingestion queue is full.
+    """
+    async with ingest_lane.slot(uploaded_by or "", ADMIN_PRIORITY):
+        vss = VectorStoreService()
+        file_path = document_path(filename, collection)
+        metadata = upload_metadata(uploaded_by, tags)
+        prepared = None
+        if await asyncio.to_thread(find_document_by_hash, content_hash, collection) is None:
+            # Parse the upload from its temporary file and embed it while other uploads may be updating the index
+            prepared = await vss.prepare_document(temp_path, metadata, collection, source=file_path)
+
+        async with _index_lock:
+            # Checked again under the lock: an identical upload may have been indexed meanwhile
+            duplicate = await asyncio.to_thread(find_document_by_hash, content_hash, collection)
+            if duplicate is not None:
+                # Identical content is already indexed; nothing is re-embedded
+                discard_upload(temp_path)
+                metrics.increment("upload_duplicates")
+                return {
+                    "message": f"Document '{filename}' has the same content as the already indexed "
+                               f"'{os.path.basename(duplicate['source'])}' and was not indexed again.",
+                    "duplicate_of": duplicate["source"]
+                }
+
+            if prepared is None:
+                prepared = await vss.prepare_document(temp_path, metadata, collection, source=file_path)
+            # A document saved under the same name is replaced: its chunks are removed from the index. The file is
+            # only moved into place once the index is updated, so a failed update leaves no unindexed document.
+            replaces = os.path.exists(file_path)
+            message = await vss.add_document_to_vector_store(file_path, metadata, collection, prepared, replaces)
+            commit_upload(temp_path, file_path)
+            # The upload metadata is kept with the hash, so that rebuilds of the index restore it
+            await asyncio.to_thread(record_document_hash, content_hash, file_path, size, collection, metadata)
+        metrics.increment("upload_bytes", size)
+        return {"message": message}
+
 
-async def add_document(file: UploadFile):
+async def add_document(file: UploadFile, current_user: dict = None, tags: str = None, collection: str = None):
     """
-    Adds a new document to the vector store by saving it, processing it,
+    Adds a new document to the vector store by streaming it to disk, processing it,
     and updating the vector index.
 
     Args:
         file (UploadFile): The file to be added to the vector store.
+        current_user (dict, optional): The uploading user, recorded in the chunk metadata.
+        tags (str, optional): Comma-separated tags recorded in the chunk metadata.
+        collection (str, optional): The collection the document is added to (created if needed), or the default one.
+
+    Returns:
+        dict: A message indicating that the document was added (or was a duplicate of an indexed document).
+
+    Raises:
+        HTTPException: If the filename or collection name is invalid, the file exceeds the maximum upload size,
+            or the ingestion queue is full (429).
+    """
+    filename = safe_filename(file.filename)
+    collection = VectorStoreService().resolve_collection(collection, must_exist=False)
+    # Reject the upload before receiving it if it could not be queued for indexing anyway
+    ingest_lane.ensure_capacity()
+    uploaded_by = current_user["username"] if current_user else None
+
+    # The file is only moved into the document directory once it is complete and known not to be a duplicate
+    temp_path, size, content_hash = await stream_upload_to_temp_file(
+        file, f"{config.DOCUMENT_DIRECTORY_PATH}/new_docs", os.path.splitext(filename)[1]
+    )
+    try:
+        return await index_uploaded_file(
+            temp_path, filename, size, content_hash, uploaded_by, parse_tags(tags), collection
+        )
+    finally:
+        discard_upload(temp_path)
+
+
+def _expire_upload_sessions():
+    """
+    Discards the upload sessions that were not completed within `UPLOAD_SESSION_TTL_SECONDS`.
+    """
+    now = time.monotonic()
+    for upload_id, session in list(upload_sessions.items()):
+        if now - session["updated_at"] > config.UPLOAD_SESSION_TTL_SECONDS and not session["lock"].locked():
+            upload_sessions.pop(upload_id, None)
+            discard_upload(session["part_path"])
+
+
+def _get_upload_session(upload_id: str, current_user: dict = None) -> dict:
+    """
+    Returns an upload session, which is only visible to the user who created it.
+
+    Raises:
+        HTTPException: 404 if the session does not exist or belongs to another user.
+    """
+    session = upload_sessions.get(upload_id)
+    uploaded_by = current_user["username"] if current_user else None
+    if session is None or session["uploaded_by"] != uploaded_by:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+def _session_status(upload_id: str, session: dict) -> dict:
+    return {
+        "upload_id": upload_id,
+        "filename": session["filename"],
+        "collection": session["collection"],
+        "offset": session["offset"],
+        "chunk_size": config.UPLOAD_CHUNK_BYTES,
+        "max_size": config.MAX_UPLOAD_BYTES,
+    }
+
+
+def create_upload_session(filename: str, current_user: dict = None, collection: str = None) -> dict:
+    """
+    Starts a resumable upload: the file is then sent in consecutive chunks, each appended at the current offset.
+
+    Args:
+        filename (str): Name of the document to be uploaded.
+        current_user (dict, optional): The uploading user, the only one allowed to use the session.
+        collection (str, optional): The collection the document is added to (created if needed), or the default one.
+
+    Returns:
+        dict: The upload id, the current offset (0) and the upload limits.
+    """
+    _expire_upload_sessions()
+    collection = VectorStoreService().resolve_collection(collection, must_exist=False)
+
+    upload_id = uuid.uuid4().hex
+    os.makedirs(config.UPLOAD_SESSION_PATH, exist_ok=True)
+    session = {
+        "filename": safe_filename(filename),
+        "collection": collection,
+        "uploaded_by": current_user["username"] if current_user else None,
+        # The part keeps the extension of the document, so its type is detected when it is parsed
+        "part_path": os.path.join(
+            config.UPLOAD_SESSION_PATH, f"{upload_id}.part{os.path.splitext(safe_filename(filename))[1]}"
+        ),
+        "offset": 0,
+        "hasher": hashlib.sha256(),
+        "lock": asyncio.Lock(),
+        "updated_at": time.monotonic(),
+    }
+    open(session["part_path"], "wb").close()
+
+    upload_sessions[upload_id] = session
+    return _session_status(upload_id, session)
+
+
+def get_upload_session(upload_id: str, current_user: dict = None) -> dict:
+    """
+    Returns the state of an upload session, in particular the offset to resume from.
+    """
+    return _session_status(upload_id, _get_upload_session(upload_id, current_user))
+
+
+async def append_upload_chunk(upload_id: str, offset: int, chunks, current_user: dict = None) -> dict:
+    """
+    Appends a chunk of data to an upload session.
+
+    The chunk is only accepted as a whole: if it fails (e.g. the client disconnects), the session stays at its
+    previous offset and the chunk can be sent again.
+
+    Args:
+        upload_id (str): The upload session id.
+        offset (int): The offset the chunk starts at, which must be the session's current offset.
+        chunks (AsyncIterator[bytes]): The chunk's data, as received from the request body.
+        current_user (dict, optional): The uploading user.
+
+    Returns:
+        dict: The session state with the new offset.
+
+    Raises:
+        HTTPException: 404 for an unknown session, 409 if the offset does not match, 413 if the upload gets too large.
+    """
+    session = _get_upload_session(upload_id, current_user)
+
+    async with session["lock"]:
+        if offset != session["offset"]:
+            raise HTTPException(
+                status_code=409, detail=f"Offset mismatch: the upload is at offset {session['offset']}"
+            )
+
+        hasher = session["hasher"].copy()
+        size = session["offset"]
+        with open(session["part_path"], "r+b") as part_file:
+            part_file.seek(size)
+            try:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > config.MAX_UPLOAD_BYTES:
+                        raise too_large_error()
+                    hasher.update(chunk)
+                    await asyncio.to_thread(part_file.write, chunk)
+            except BaseException:
+                # Drop the partially written chunk
+                part_file.truncate(session["offset"])
+                raise
+            part_file.truncate(size)
+
+        session["hasher"] = hasher
+        session["offset"] = size
+        session["updated_at"] = time.monotonic()
+        return _session_status(upload_id, session)
+
+
+async def complete_upload_session(upload_id: str, current_user: dict = None, tags: str = None) -> dict:
+    """
+    Completes an upload session and indexes the received document.
+
+    Args:
+        upload_id (str): The upload session id.
+        current_user (dict, optional): The uploading user.
+        tags (str, optional): Comma-separated tags recorded in the chunk metadata.
 
     Returns:
-        dict: A success message indicating that the document was added and vector store updated.
+        dict: A message indicating that the document was added (or was a duplicate of an indexed document).
     """
+    session = _get_upload_session(upload_id, current_user)
+
+    async with session["lock"]:
+        if upload_sessions.pop(upload_id, None) is None:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+    try:
+        return await index_uploaded_file(
+            session["part_path"], session["filename"], session["offset"], session["hasher"].hexdigest(),
+            session["uploaded_by"], parse_tags(tags), session["collection"]
+        )
+    finally:
+        discard_upload(session["part_path"])
+
+
+async def abort_upload_session(upload_id: str, current_user: dict = None) -> dict:
+    """
+    Aborts an upload session and deletes the data received so far.
+    """
+    session = _get_upload_session(upload_id, current_user)
+
+    async with session["lock"]:
+        upload_sessions.pop(upload_id, None)
+        discard_upload(session["part_path"])
+    return {"message": f"Upload of '{session['filename']}' aborted."}
 
+
+async def list_collections() -> dict:
+    """
+    Lists the collections with the size of their index, their number of chunks, and their load time if loaded.
+    """
     vss = VectorStoreService()
-    return {"message": await vss.add_document_to_vector_store(file)}
+    return {
+        "collections": await asyncio.to_thread(vss.collections.stats),
+        "memory_budget_bytes": vss.collections.memory_budget_bytes,
+    }
+
+
+async def get_chunk(chunk_id: str, collection: str = None) -> dict:
+    """
+    Returns a chunk of a collection by its id, for clients that received only its id (compact answer sources).
 
+    Args:
+        chunk_id (str): The `chunk_id` of a search result or answer source.
+        collection (str, optional): The collection holding the chunk, or the default one.
+
+    Returns:
+        dict: The chunk's id, source, index and text, and the other documents holding a near-duplicate of it.
+
+    Raises:
+        HTTPException: If the collection name is invalid (400), or the collection or chunk does not exist (404).
+    """
+    vss = VectorStoreService()
+    collection = vss.resolve_collection(collection)
+    # Looking the chunk up may load the collection's index from disk
+    doc = await asyncio.to_thread(vss.get_chunk, chunk_id, collection)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    return {
+        "chunk_id": chunk_id,
+        "collection": collection,
+        "source": doc.metadata["source"],
+        "chunk_index": doc.metadata["chunk_index"],
+        "text": doc.page_content,
+        "duplicate_sources": doc.metadata.get("duplicate_sources", []),
+    }
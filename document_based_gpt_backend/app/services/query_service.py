@@ -1,49 +1,139 @@
-# Import necessary modules and classes from FastAPI for HTTP exceptions
+# Import asyncio to run the blocking retrieval and LLM calls off the event loop
+import asyncio
+
+# Import json to build the coalescing keys of questions
+import json
+
+# Import logging to report degraded answers and unexpected errors
+import logging
+
+# Import the errors of the OpenAI SDK and of its HTTP client, raised by failing LLM completions
+import httpx
+import openai
+
+# Import orjson to serialize streamed NDJSON results
+import orjson
+
+# Import necessary modules and classes from FastAPI for HTTP exceptions and streamed responses
 from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+# Import configuration values such as the batch limits
+from app.core import config
 
 # Import utility functions for query validation and processing
-from app.utils.query_util import is_safe_content, is_negative_response
+from app.utils.query_util import is_safe_content, is_negative_response, normalize_query, build_extractive_answer
+
+# Import prompt assembly and metrics utilities
+from app.utils.prompt_util import assemble_prompt_documents
+from app.utils.metrics_util import metrics
+from app.utils.singleflight_util import SingleFlight
+
+# Import request tracing and structured query logging utilities
+from app.utils.trace_util import start_trace, stage, record_hits, format_hits
+from app.utils.logging_util import log_query_event
 
 # Import schema for request validation
-from app.schemas.query import AskQuery
+from app.schemas.query import AskQuery, BatchAskQuery, SearchQuery
 
 # Import VectorStoreService for interacting with vector storage (FAISS)
 from app.services.vector_store_service import VectorStoreService
 
+# Import admission control: per-user rate limits and the lane of LLM completions
+from app.services.admission_service import rate_limiter, query_lane, user_key, user_priority
+
+logger = logging.getLogger(__name__)
 
-def get_answer_from_query(query: str):
+# Coalesce identical questions that are in flight at the same time into one retrieval, then one LLM completion
+retrieval_flight = SingleFlight("retrieval")
+query_flight = SingleFlight("query")
+
+# Relevance threshold used to filter out irrelevant documents
+RELEVANCE_THRESHOLD = 0.20  # Can be fine-tuned based on your specific use case
+
+# Answer returned for queries rejected by content moderation
+INAPPROPRIATE_CONTENT_ANSWER = "The question contains inappropriate content and cannot be processed."
+
+# Degraded answer returned when the LLM cannot answer in time and no relevant passage was retrieved
+NO_TIMELY_ANSWER = "An answer could not be generated in time and no relevant passage was found. Please try again."
+
+
+def format_sources(docs_with_scores: list):
     """
-    Retrieves an answer and relevant document sources based on the user's query.
-    The answer is generated using a QA chain built on top of a vector store.
+    Formats retrieved document chunks as the "sources" returned to the client.
 
     Args:
-        query (str): The user's question or query to be processed.
+        docs_with_scores (list): Tuples of the relevant `Document` chunks and their scores.
 
     Returns:
-        dict: A dictionary containing:
-            - "answer": The generated answer from the QA system.
-            - "sources": A list of relevant document chunks with metadata.
+        list: A list of dictionaries with the chunk's id, source, index, text and file path, the other documents
+            holding a near-duplicate of the chunk, and its score.
     """
-    # Initialize the vector store service
-    vss = VectorStoreService()
+    return [
+        {
+            "chunk_id": doc.metadata.get("chunk_id"),
+            "source": doc.metadata["source"],
+            "chunk_index": doc.metadata["chunk_index"],
+            "text": doc.page_content,
+            "file_path": f"{doc.metadata['source']}",
+            "duplicate_sources": doc.metadata.get("duplicate_sources", []),
+            "score": score
+        }
+        for doc, score in docs_with_scores
+    ]
 
-    # Retrieve relevant documents and their scores using the vector store retriever
-    source_docs_with_scores = vss.get_relevant_documents(query)
 
-    # Set a relevance threshold to filter out irrelevant documents
-    RELEVANCE_THRESHOLD = 0.20  # Can be fine-tuned based on your specific use case
+def compact_sources(sources: list):
+    """
+    Reduces formatted sources to their chunk id and score, for clients fetching (and caching) the chunk texts
+    separately from `GET /v1/document/chunk/{chunk_id}`.
+    """
+    return [{"chunk_id": source["chunk_id"], "score": source["score"]} for source in sources]
+
+
+def get_relevant_hits(source_docs_with_scores: list):
+    """
+    Filters retrieved documents by the relevance threshold.
+
+    Args:
+        source_docs_with_scores (list): Tuples of retrieved documents and their scores.
+
+    Returns:
+        list: The tuples of the documents that meet or exceed the relevance threshold, and their scores.
+    """
+    return [(doc, score) for doc, score in source_docs_with_scores if score >= RELEVANCE_THRESHOLD]
+
+
+def build_answer(query: str, source_docs_with_scores: list):
+    """
+    Generates an answer for a query from documents that were already retrieved for it.
+
+    Args:
+        query (str): The user's question.
+        source_docs_with_scores (list): Tuples of retrieved documents and their scores (best first).
+
+    Returns:
+        dict: A dictionary containing the generated "answer" and the relevant "sources".
+    """
+    vss = VectorStoreService()
 
     # Filter documents that meet or exceed the relevance threshold
-    relevant_docs = [
-        doc for doc, score in source_docs_with_scores if score >= RELEVANCE_THRESHOLD
-    ]
+    relevant_hits = get_relevant_hits(source_docs_with_scores)
 
-    # Generate an answer using the QA chain from the vector store service
-    result = vss.qa_chain.run(query)
+    # Deduplicate, merge and pack the retrieved chunks into the prompt's token budget
+    with stage("assemble"):
+        prompt_docs, prompt_stats = assemble_prompt_documents([doc for doc, _ in source_docs_with_scores])
+    metrics.observe("prompt_tokens_before", prompt_stats["tokens_before"])
+    metrics.observe("prompt_tokens_after", prompt_stats["tokens_after"])
+
+    # Generate an answer from the assembled context using the QA chain from the vector store service
+    with stage("llm"):
+        result = vss.generate_answer(query, prompt_docs)
 
     # If no relevant documents are found or the result indicates a negative response,
     # return the answer without any source context
-    if not relevant_docs or is_negative_response(result):
+    if not relevant_hits or is_negative_response(result):
         return {
             "answer": result,
             "sources": []
@@ -52,48 +142,334 @@ def get_answer_from_query(query: str):
     # Return the answer along with relevant document sources and metadata
     return {
         "answer": result,
-        "sources": [
-            {
-                "source": doc.metadata["source"],
-                "chunk_index": doc.metadata["chunk_index"],
-                "text": doc.page_content,
-                "file_path": f"{doc.metadata['source']}"
-            }
-            for doc in relevant_docs
-        ]
+        "sources": format_sources(relevant_hits)
+    }
+
+
+def get_answer_from_query(query: str, metadata_filter=None, collection: str = config.DEFAULT_COLLECTION):
+    """
+    Retrieves an answer and relevant document sources based on the user's query.
+    The answer is generated using a QA chain built on top of a vector store.
+
+    Args:
+        query (str): The user's question or query to be processed.
+        metadata_filter (MetadataFilter, optional): Restricts the documents used to answer.
+        collection (str): The collection searched.
+
+    Returns:
+        dict: A dictionary containing:
+            - "answer": The generated answer from the QA system.
+            - "sources": A list of relevant document chunks with metadata.
+    """
+    # Initialize the vector store service
+    vss = VectorStoreService()
+
+    # Retrieve relevant documents and their scores using the vector store retriever
+    source_docs_with_scores = vss.get_relevant_documents(query, metadata_filter=metadata_filter, collection=collection)
+    record_hits(source_docs_with_scores)
+
+    return build_answer(query, source_docs_with_scores)
+
+
+def build_degraded_answer(query: str, source_docs_with_scores: list):
+    """
+    Builds an extractive answer from the relevant retrieved documents, for when the LLM cannot answer in time.
+
+    Args:
+        query (str): The user's question.
+        source_docs_with_scores (list): Tuples of retrieved documents and their scores (best first).
+
+    Returns:
+        dict: The extractive "answer", the relevant "sources" and `"degraded": True`.
+    """
+    relevant_hits = get_relevant_hits(source_docs_with_scores)
+    answer = build_extractive_answer(query, [doc for doc, _ in relevant_hits], config.EXTRACTIVE_ANSWER_SENTENCES)
+    return {
+        "answer": answer or NO_TIMELY_ANSWER,
+        "sources": format_sources(relevant_hits),
+        "degraded": True
     }
 
 
-async def process_query(query_data: AskQuery):
+def record_query_outcome(degraded: bool):
+    """
+    Counts answered questions and exports the fraction of degraded answers.
+    """
+    metrics.increment("query_responses")
+    if degraded:
+        metrics.increment("query_degraded")
+    metrics.set_gauge(
+        "query_degraded_ratio", metrics.get_counter("query_degraded") / metrics.get_counter("query_responses")
+    )
+
+
+async def process_query(query_data: AskQuery, current_user: dict):
     """
     Processes a user's query, performs content moderation, and retrieves a relevant answer.
 
+    The query runs within a latency budget (`timeout_ms`, or `QUERY_TIMEOUT_MS` by default). If the documents are
+    retrieved but the LLM cannot answer within the remaining budget, or fails, a degraded extractive answer built
+    from the retrieved documents is returned instead, flagged with `"degraded": true`.
+
+    The question is charged to the user's rate limit, and its LLM completion waits for a slot of the query lane,
+    where the questions of all users are served fairly.
+
+    With `compact_sources`, each source is reduced to its `chunk_id` and `score`: clients fetch the chunk texts once
+    from `GET /v1/document/chunk/{chunk_id}` and reuse them across questions.
+
     Args:
         query_data (AskQuery): The query data encapsulated in a Pydantic schema.
+        current_user (dict): The authenticated user asking the question.
 
     Returns:
-        dict: A dictionary containing the answer and related document sources if any.
+        dict: A dictionary containing the answer, related document sources if any, and the `degraded` flag.
 
     Raises:
-        HTTPException: If an error occurs while processing the query or if content is deemed inappropriate.
+        HTTPException: If the budget or the collection name is invalid (400), the collection does not exist (404),
+            the user exceeded their rate or the query lane is full (429), the documents cannot be retrieved within
+            the budget (504), or an error occurs while processing the query (500).
     """
+    if query_data.timeout_ms is not None and query_data.timeout_ms <= 0:
+        raise HTTPException(status_code=400, detail="timeout_ms must be positive")
+    timeout_ms = min(query_data.timeout_ms or config.QUERY_TIMEOUT_MS, config.QUERY_MAX_TIMEOUT_MS)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_ms / 1000
+
+    trace = start_trace("/v1/query/ask/", jsonable_encoder(query_data))
     try:
+        # Shed the request before doing any work for it if the user is over their rate or the server is saturated
+        rate_limiter.check(user_key(current_user))
+        query_lane.ensure_capacity()
+        vss = VectorStoreService()
+        collection = vss.resolve_collection(query_data.collection)
+
         # Extract the query string from the request data
         query = query_data.query
 
         # Check if the query contains any inappropriate content
-        if not is_safe_content(query):
-            return {
-                "answer": "The question contains inappropriate content and cannot be processed.",
+        with stage("moderation"):
+            safe = is_safe_content(query)
+        if not safe:
+            response = {
+                "answer": INAPPROPRIATE_CONTENT_ANSWER,
                 "sources": []
             }
+            log_query_event(trace, "rejected", response)
+            return response
+
+        # Identical questions against the same collection and index generation share one in-flight computation.
+        # The blocking retrieval and LLM calls run in a worker thread so the event loop stays responsive.
+        key = (
+            normalize_query(query),
+            json.dumps(jsonable_encoder(query_data.filter), sort_keys=True),
+            collection,
+            vss.index_generation(collection)
+        )
+        try:
+            source_docs_with_scores = await asyncio.wait_for(
+                retrieval_flight.do(
+                    key, asyncio.to_thread, vss.get_relevant_documents, query, 5, query_data.filter, collection
+                ),
+                deadline - loop.time()
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="The documents could not be retrieved within the time limit")
+        trace.hits = format_hits(source_docs_with_scores)
+
+        try:
+            # Waiting for a slot of the query lane and the completion may only use what is left of the budget.
+            # On timeout the worker thread is not interrupted, but its result is no longer awaited (it is bounded
+            # by the OpenAI read timeout, and keeps its lane slot until then).
+            response = await asyncio.wait_for(
+                query_flight.do(
+                    key, query_lane.run_in_thread, user_key(current_user), user_priority(current_user),
+                    build_answer, query, source_docs_with_scores
+                ),
+                max(0.0, deadline - loop.time())
+            )
+            response = {**response, "degraded": False}
+        except (asyncio.TimeoutError, HTTPException, openai.OpenAIError, httpx.HTTPError) as e:
+            # Slow, saturated (the query lane sheds with 429) or failing LLM: answer from the retrieved documents
+            # instead. Any other error is a bug, reported as such.
+            if isinstance(e, HTTPException) and e.status_code != 429:
+                raise
+            logger.warning("Degraded answer (%s)", type(e).__name__, exc_info=True)
+            with stage("extractive"):
+                response = build_degraded_answer(query, source_docs_with_scores)
+
+        # The response may be shared with coalesced identical questions: compact a copy
+        if query_data.compact_sources:
+            response = {**response, "sources": compact_sources(response["sources"])}
+
+        record_query_outcome(response["degraded"])
+        log_query_event(trace, "degraded" if response["degraded"] else "ok", response)
+        return response
 
-        # Retrieve the answer based on the query using the vector store
-        return get_answer_from_query(query)
+    except HTTPException as e:
+        log_query_event(trace, "error", error=e)
+        raise
 
     except Exception as e:
         # Log the error for debugging purposes
-        print(e)
+        logger.exception("Query failed")
+        log_query_event(trace, "error", error=e)
 
         # Raise an HTTP 500 Internal Server Error if any exception occurs
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def process_batch_query(batch_data: BatchAskQuery, current_user: dict):
+    """
+    Processes a batch of queries: all of them are embedded in one call and searched with one matrix k-NN search,
+    then the LLM completions are fanned out with bounded concurrency.
+
+    Every query of the batch is charged to the user's rate limit, and each completion goes through the query lane
+    like the completion of a single question.
+
+    Args:
+        batch_data (BatchAskQuery): The batch of queries and its options.
+        current_user (dict): The authenticated user sending the batch.
+
+    Returns:
+        dict or StreamingResponse: `{"results": [...]}` in query order, or an NDJSON stream of results
+            (each tagged with its `index`) in completion order when `stream` is set.
+
+    Raises:
+        HTTPException: If the batch is too large (413), `top_k` or the collection is invalid (400), the collection
+            does not exist (404), the user exceeded their rate or the query lane is full (429), or the retrieval
+            fails.
+    """
+    queries = batch_data.queries
+    if len(queries) > config.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=413, detail=f"A batch may contain at most {config.BATCH_MAX_QUERIES} queries"
+        )
+    if not 1 <= batch_data.top_k <= config.SEARCH_MAX_K:
+        raise HTTPException(status_code=400, detail=f"top_k must be between 1 and {config.SEARCH_MAX_K}")
+    rate_limiter.check(user_key(current_user), cost=len(queries))
+    if not batch_data.retrieval_only:
+        query_lane.ensure_capacity()
+    vss = VectorStoreService()
+    collection = vss.resolve_collection(batch_data.collection)
+
+    trace = start_trace("/v1/query/ask/batch", jsonable_encoder(batch_data))
+
+    # Moderate every query; unsafe ones are answered directly and excluded from retrieval
+    with stage("moderation"):
+        safe_indices = [i for i, query in enumerate(queries) if is_safe_content(query)]
+
+    try:
+        # One batched embedding call and one index search for all the safe queries
+        retrieved = await asyncio.to_thread(
+            vss.get_relevant_documents_batch, [queries[i] for i in safe_indices], batch_data.top_k, batch_data.filter,
+            collection
+        )
+    except Exception as e:
+        logger.exception("Batch retrieval failed")
+        log_query_event(trace, "error", error=e)
+        raise HTTPException(status_code=500, detail=str(e))
+    results_by_index = dict(zip(safe_indices, retrieved))
+    trace.hits = [
+        format_hits(results_by_index[i]) if i in results_by_index else None for i in range(len(queries))
+    ]
+
+    semaphore = asyncio.Semaphore(config.BATCH_LLM_CONCURRENCY)
+
+    async def answer(index: int):
+        query = queries[index]
+        if index not in results_by_index:
+            result = {"answer": INAPPROPRIATE_CONTENT_ANSWER, "sources": []}
+        elif batch_data.retrieval_only:
+            result = {"answer": None, "sources": format_sources(get_relevant_hits(results_by_index[index]))}
+        else:
+            try:
+                # Bound the number of concurrent LLM completions of the batch, then queue in the query lane
+                async with semaphore:
+                    result = await query_lane.run_in_thread(
+                        user_key(current_user), user_priority(current_user),
+                        build_answer, query, results_by_index[index]
+                    )
+            except Exception as e:
+                # A failed completion only fails its own entry, not the whole batch
+                result = {"answer": None, "sources": [], "error": str(e)}
+        if batch_data.compact_sources:
+            result = {**result, "sources": compact_sources(result["sources"])}
+        return {"index": index, "query": query, **result}
+
+    tasks = [asyncio.ensure_future(answer(i)) for i in range(len(queries))]
+
+    if not batch_data.stream:
+        response = {"results": await asyncio.gather(*tasks)}
+        log_query_event(trace, "ok", response)
+        return response
+
+    async def stream_results():
+        status = "error"
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield orjson.dumps(await next_done) + b"\n"
+            status = "ok"
+        finally:
+            log_query_event(trace, status)
+            # Stop pending completions if the client disconnects
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+async def process_search_query(search_data: SearchQuery, current_user: dict):
+    """
+    Ranks document chunks for a query without generating an answer, so it answers without waiting for the LLM.
+
+    Searches do not use the LLM, so they are only charged to the user's rate limit.
+
+    Args:
+        search_data (SearchQuery): The search query, `k`, pagination and filter options.
+        current_user (dict): The authenticated user searching.
+
+    Returns:
+        dict: The requested page of scored chunks, along with the total number of ranked results.
+
+    Raises:
+        HTTPException: If the parameters are invalid (400), the collection does not exist (404)
+            or the user exceeded their rate (429).
+    """
+    if not 1 <= search_data.k <= config.SEARCH_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {config.SEARCH_MAX_K}")
+    if search_data.offset < 0 or search_data.limit < 1:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit must be >= 1")
+    rate_limiter.check(user_key(current_user))
+    vss = VectorStoreService()
+    collection = vss.resolve_collection(search_data.collection)
+
+    trace = start_trace("/v1/query/search", jsonable_encoder(search_data))
+    try:
+        results = await asyncio.to_thread(
+            vss.search_documents, search_data.query, search_data.k, search_data.filter, collection
+        )
+    except Exception as e:
+        log_query_event(trace, "error", error=e)
+        raise
+    trace.hits = format_hits(results)
+    page = results[search_data.offset:search_data.offset + search_data.limit]
+
+    response = {
+        "query": search_data.query,
+        "total": len(results),
+        "offset": search_data.offset,
+        "limit": search_data.limit,
+        "results": [
+            {
+                "chunk_id": doc.metadata["chunk_id"],
+                "source": doc.metadata["source"],
+                "chunk_index": doc.metadata["chunk_index"],
+                "text": doc.page_content,
+                "duplicate_sources": doc.metadata.get("duplicate_sources", []),
+                "score": score
+            }
+            for doc, score in page
+        ]
+    }
+    log_query_event(trace, "ok", response)
+    return response
@@ -1,25 +1,46 @@
 # Import necessary modules from LangChain for vector storage and QA chain creation
-from langchain.chains import RetrievalQA  # For building QA chains from vector stores
-from langchain_openai import OpenAI  # OpenAI integration for LLM-based operations
-from langchain_community.document_loaders import DirectoryLoader  # For loading documents from a directory
-from langchain_community.vectorstores import FAISS  # FAISS vector store for storing document embeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter  # For splitting text into manageable chunks
-from langchain.schema import Document  # Schema for representing documents
-from langchain_openai import OpenAIEmbeddings  # For generating OpenAI-based embeddings
+from langchain.chains.combine_documents import create_stuff_documents_chain  # For answering from retrieved documents
+from langchain.chains.question_answering.stuff_prompt import PROMPT_SELECTOR  # The "stuff" question answering prompt
 import os  # Standard library for OS-level file operations
+import asyncio  # For running the blocking indexing work off the event loop
+import logging  # For reporting the index built at startup
+from functools import lru_cache  # For caching query embeddings
+
+# Import HTTPException from FastAPI to reject unknown or invalid collections
+from fastapi import HTTPException
 
 # Import configurations and constants
 from app.core import config
 
+# Import the shared OpenAI clients (pooled connections, timeouts, retries and circuit breaker)
+from app.core.openai_provider import get_embeddings, get_llm
+
 # Import vector store-related functions from the FAISS store module
 from app.db.faiss_store import (
     update_vector_store as update_faiss_vector_store,  # For updating vector store
-    reload_vector_store as reload_faiss_vector_store,  # For reloading vector store from disk
-    custom_get_relevant_documents_with_scores  # For custom document retrieval based on query
+    embed_new_chunks,  # For embedding the chunks of a document ahead of the update
+    custom_get_relevant_documents_with_scores,  # For custom document retrieval based on query
+    custom_get_relevant_documents_batch_with_scores,  # For batched document retrieval for many queries
+    search_vectors_with_scores,  # For searching the index with already computed query embeddings
+    get_chunk  # For looking up a stored chunk by its id
 )
 
+# Import the collection manager, which loads the index of every collection on first use within a memory budget
+from app.db.collection_manager import CollectionManager, collection_index_path, is_valid_collection_name
+
+# Import the index builder, used when the server is configured to build the missing default index itself
+from app.db.index_builder import build_index
+
 # Import utility function to load and split new documents
-from app.utils.document_util import load_new_documents
+from app.utils.document_util import load_document
+
+# Import the stage timer recording the embedding time of the current request
+from app.utils.trace_util import stage
+
+# Import the metrics registry to report the embedding spend and near-duplicates of ingestion
+from app.utils.metrics_util import metrics
+
+logger = logging.getLogger(__name__)
 
 
 def create_vector_store():
@@ -27,41 +48,41 @@ def create_vector_store():
     Initialize the vector store by loading documents, generating embeddings,
     and saving them to the FAISS vector store.
 
+    The index is built in process, the way `python -m app.tools.build_index` builds it offline.
+
     Returns:
-        FAISS: The FAISS vector store object created.
+        dict: The manifest of the built index.
     """
-    # Generate embeddings using OpenAI
-    openai_embeddings = OpenAIEmbeddings(openai_api_key=config.OPENAI_API_KEY)
-
-    # Load documents from the specified directory
-    loader = DirectoryLoader(config.DOCUMENT_DIRECTORY_PATH, glob="*.txt")
-
-    # Load and split documents into smaller chunks
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-
-    # Add metadata (document name and chunk index) to each split document
-    split_docs_with_metadata = []
-    for doc in documents:
-        chunks = text_splitter.split_text(doc.page_content)
-        for i, chunk in enumerate(chunks):
-            split_docs_with_metadata.append(
-                Document(page_content=chunk, metadata={"source": doc.metadata["source"], "chunk_index": i})
-            )
+    manifest = build_index(config.DOCUMENT_DIRECTORY_PATH, collection_index_path(config.DEFAULT_COLLECTION))
+    logger.info("FAISS index created successfully: %d chunks", manifest["chunks"])
+    return manifest
 
-    # Create a FAISS vector store with generated embeddings
-    faiss_index = FAISS.from_documents(split_docs_with_metadata, openai_embeddings)
 
-    # Save the updated vector store to disk
-    faiss_index.save_local(f"{config.VECTOR_STORE_PATH}faiss_index")
-    print("FAISS index created successfully:", faiss_index)
-    return faiss_index
+def record_ingestion(ingestion: dict, collection: str):
+    """
+    Report the chunks, near-duplicates and embedded tokens of an ingested document, and the share of the chunks
+    ingested so far that were near-duplicates (not embedded nor indexed).
+    """
+    metrics.increment("ingest_chunks", ingestion["chunks"], collection=collection)
+    metrics.increment("ingest_duplicate_chunks", ingestion["duplicates"], collection=collection)
+    metrics.increment("embedding_tokens", ingestion["embedded_tokens"], collection=collection)
+    metrics.increment("embedding_tokens_saved", ingestion["skipped_tokens"], collection=collection)
+    chunks = metrics.get_counter("ingest_chunks", collection=collection)
+    if chunks:
+        metrics.set_gauge(
+            "ingest_dedupe_ratio",
+            metrics.get_counter("ingest_duplicate_chunks", collection=collection) / chunks,
+            collection=collection
+        )
 
 
 class VectorStoreService:
     """
     A singleton service layer for handling vector store operations, like adding new documents,
     updating the vector store, and retrieving relevant documents based on queries.
+
+    Documents are organized in named collections, each with its own index; operations use the default
+    collection unless another one is named.
     """
 
     _instance = None  # Singleton instance
@@ -77,82 +98,221 @@ class VectorStoreService:
 
     def __initialize_service(self):
         """
-        Initialize the VectorStoreService, setting up the LLM and vector store paths,
-        and loading the QA chain if a vector store already exists.
+        Initialize the VectorStoreService, setting up the LLM, the answering chain and the collection manager,
+        and loading the default collection (created from the document directory if it does not exist yet).
         """
-        self.llm = OpenAI(api_key=config.OPENAI_API_KEY)
-        self.vector_store_path = f"{config.VECTOR_STORE_PATH}/faiss_index"
+        self.llm = get_llm()
+
+        # "Stuff" chain generating an answer from the retrieved documents
+        self.answer_chain = create_stuff_documents_chain(self.llm, PROMPT_SELECTOR.get_prompt(self.llm))
+
+        # Indexes of the collections, loaded on first use and unloaded beyond the memory budget
+        self.collections = CollectionManager(config.COLLECTION_MEMORY_BUDGET_BYTES)
+
+        # Cache of query embeddings used by retrieval-only searches
+        self._embed_query_cached = lru_cache(maxsize=config.QUERY_EMBEDDING_CACHE_SIZE)(self._embed_query)
 
-        # Check if the FAISS index exists and create it if necessary
+        # Check if the FAISS index exists; serving processes only load prebuilt indexes unless configured otherwise
         if not self._faiss_index_exists():
+            if not config.BUILD_INDEX_ON_STARTUP:
+                raise RuntimeError(
+                    "The index of the default collection is missing: build it with `python -m app.tools.build_index` "
+                    "(or set BUILD_INDEX_ON_STARTUP=true)"
+                )
             create_vector_store()
 
-        # Initialize the QA chain for query-answering
-        self.qa_chain = self._initialize_qa_chain()
+        # Load the default collection up front, so that the first queries do not wait for it
+        with self.collections.use(config.DEFAULT_COLLECTION):
+            pass
 
     def _faiss_index_exists(self):
         """
-        Check if the FAISS index files exist.
+        Check if the FAISS index files of the default collection exist.
 
         Returns:
             bool: True if the index files exist, otherwise False.
         """
-        return os.path.exists(f"{self.vector_store_path}/index.faiss")
+        return self.collections.exists(config.DEFAULT_COLLECTION)
 
-    def _initialize_qa_chain(self):
+    def resolve_collection(self, name: str = None, must_exist: bool = True) -> str:
         """
-        Initialize the QA chain from the vector store using FAISS.
+        Return the collection a request applies to: the named one, or the default collection.
+
+        Args:
+            name (str, optional): The requested collection.
+            must_exist (bool): Whether the collection must already have an index (False for uploads,
+                which create the collection).
 
         Returns:
-            RetrievalQA: The QA chain initialized with vector store retriever.
+            str: The collection name.
+
+        Raises:
+            HTTPException: 400 if the name is invalid, 404 if the collection must exist and does not.
         """
-        faiss_index = reload_faiss_vector_store(self.vector_store_path)
-        self.qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm, chain_type="stuff", retriever=faiss_index.as_retriever()
-        )
-        return self.qa_chain
+        name = name or config.DEFAULT_COLLECTION
+        if not is_valid_collection_name(name):
+            raise HTTPException(
+                status_code=400,
+                detail="Collection names may only contain letters, digits, '-' and '_' (at most 64 characters)"
+            )
+        if must_exist and not self.collections.exists(name):
+            raise HTTPException(status_code=404, detail=f"Collection '{name}' not found")
+        return name
 
-    async def reload_qa_chain(self):
+    def index_generation(self, collection: str = config.DEFAULT_COLLECTION) -> int:
         """
-        Reload the QA chain to reflect vector store updates, ensuring the latest data is used.
+        Return the version of a collection's index, incremented at every update, so callers can tell
+        results of different index versions apart.
         """
-        return self._initialize_qa_chain()
+        return self.collections.generation(collection)
 
-    async def add_document_to_vector_store(self, file):
+    async def prepare_document(self, file_path: str, upload_metadata: dict = None,
+                               collection: str = config.DEFAULT_COLLECTION, source: str = None):
         """
-        Add a new document to the vector store and update the QA chain.
+        Parse a document and embed its chunks, ahead of `add_document_to_vector_store`.
+
+        Nothing is modified, so documents can be prepared while another one is being added to the collection.
 
         Args:
-            file (UploadFile): The file to be uploaded.
+            file_path (str): Path of the document to parse.
+            upload_metadata (dict, optional): The uploader, upload time and tags (see `upload_metadata`).
+            collection (str): The collection the document will be added to.
+            source (str, optional): The path the document will be saved at, if it is parsed from another one.
 
         Returns:
-            str: A message indicating the document was added successfully.
+            tuple: The chunks of the document, and the embeddings of the chunks to index by position.
+        """
+        # Load and split only the uploaded document, so previously uploaded ones are not indexed again.
+        # Parsing and embedding block, so they run in worker threads and questions keep being served.
+        new_docs = await asyncio.to_thread(load_document, file_path, upload_metadata, source)
+        embeddings = await embed_new_chunks(new_docs, self.collections.peek(collection))
+        return new_docs, embeddings
+
+    async def add_document_to_vector_store(self, file_path: str, upload_metadata: dict = None,
+                                           collection: str = config.DEFAULT_COLLECTION, prepared: tuple = None,
+                                           replaces: bool = False):
         """
-        # Save the uploaded file to the document directory
-        file_path = f"{config.DOCUMENT_DIRECTORY_PATH}/new_docs/{file.filename}"
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
+        Add a document to a collection's vector store.
 
-        # Load and split new documents
-        new_docs = load_new_documents(f"{config.DOCUMENT_DIRECTORY_PATH}/new_docs/")
+        Updates of a collection must not run concurrently: callers serialize them.
 
-        # Update the FAISS vector store with the new documents
-        await update_faiss_vector_store(new_docs, vector_store_path=self.vector_store_path)
+        Args:
+            file_path (str): Path of the document in the document directory (where it is parsed from unless
+                `prepared`).
+            upload_metadata (dict, optional): The uploader, upload time and tags (see `upload_metadata`), stored in
+                the chunk metadata and indexed for filtered searches.
+            collection (str): The collection the document is added to (created if needed).
+            prepared (tuple, optional): The document as returned by `prepare_document` (prepared here by default).
+            replaces (bool): Whether the document replaces one indexed under the same path, whose chunks are removed.
 
-        # Reload the QA chain to reflect the updated vector store
-        await self.reload_qa_chain()
+        Returns:
+            str: A message indicating the document was added successfully.
+        """
+        new_docs, embeddings = prepared or await self.prepare_document(file_path, upload_metadata, collection)
+
+        # Update the collection's FAISS vector store with the new documents (the unchanged shards of a sharded
+        # index are reused from the loaded one); near-duplicates of indexed chunks are not embedded again
+        # An index rebuilt offline since it was loaded must not be updated from its stale loaded copy
+        await asyncio.to_thread(self.collections.refresh, collection, True)
+        updated, ingestion = await update_faiss_vector_store(
+            new_docs, vector_store_path=collection_index_path(collection), current=self.collections.peek(collection),
+            embeddings=embeddings, replaced_source=file_path if replaces else None
+        )
+        record_ingestion(ingestion, collection)
+
+        # Serve the updated index from now on; searches in progress complete with the previous one
+        await asyncio.to_thread(self.collections.replace, collection, updated)
 
-        return f"Document '{file.filename}' added and vector store updated successfully."
+        action = "replaced" if replaces else "added"
+        message = f"Document '{os.path.basename(file_path)}' {action} and vector store updated successfully."
+        if ingestion["duplicates"]:
+            message += (f" {ingestion['duplicates']} of its {ingestion['chunks']} chunks nearly repeat indexed text "
+                        f"and were not indexed again.")
+        return message
 
-    def get_relevant_documents(self, query: str, top_k: int = 5):
+    def get_relevant_documents(self, query: str, top_k: int = 5, metadata_filter=None,
+                               collection: str = config.DEFAULT_COLLECTION):
         """
-        Retrieve relevant documents based on a query using the vector store.
+        Retrieve relevant documents based on a query using a collection's vector store.
 
         Args:
             query (str): The user query.
             top_k (int): Number of top relevant documents to retrieve.
+            metadata_filter (MetadataFilter, optional): Restricts the search to the chunks matching the filter.
+            collection (str): The collection to search.
 
         Returns:
             list: A list of tuples containing relevant documents and their scores.
         """
-        return custom_get_relevant_documents_with_scores(query, self.qa_chain.retriever, top_k)
+        with self.collections.use(collection) as vectorstore:
+            return custom_get_relevant_documents_with_scores(query, vectorstore, top_k, metadata_filter)
+
+    def get_relevant_documents_batch(self, queries: list, top_k: int = 5, metadata_filter=None,
+                                     collection: str = config.DEFAULT_COLLECTION):
+        """
+        Retrieve relevant documents for many queries with one embedding call and one index search.
+
+        Args:
+            queries (list): The user queries.
+            top_k (int): Number of top relevant documents to retrieve per query.
+            metadata_filter (MetadataFilter, optional): Restricts the search to the chunks matching the filter.
+            collection (str): The collection to search.
+
+        Returns:
+            list: For each query (in order), a list of tuples containing relevant documents and their scores.
+        """
+        with self.collections.use(collection) as vectorstore:
+            return custom_get_relevant_documents_batch_with_scores(queries, vectorstore, top_k, metadata_filter)
+
+    def _embed_query(self, query: str):
+        """
+        Embed a query with the embedding model shared by all collections.
+        """
+        return tuple(get_embeddings().embed_query(query))
+
+    def search_documents(self, query: str, k: int = 10, metadata_filter=None,
+                         collection: str = config.DEFAULT_COLLECTION):
+        """
+        Rank the chunks of a collection for a query, without involving the LLM.
+
+        Args:
+            query (str): The search query.
+            k (int): Number of top ranked chunks to return.
+            metadata_filter (MetadataFilter, optional): Restricts the search to the chunks matching the filter.
+            collection (str): The collection to search.
+
+        Returns:
+            list: Up to `k` tuples of documents and their (L2 distance) scores, best first.
+        """
+        with stage("embed"):
+            query_vector = self._embed_query_cached(query)
+        with self.collections.use(collection) as vectorstore:
+            return search_vectors_with_scores(vectorstore, [query_vector], k, metadata_filter)[0]
+
+    def get_chunk(self, chunk_id: str, collection: str = config.DEFAULT_COLLECTION):
+        """
+        Look up a chunk of a collection by its id.
+
+        Args:
+            chunk_id (str): The `chunk_id` of a search result or answer source.
+            collection (str): The collection holding the chunk.
+
+        Returns:
+            Document or None: The chunk, or None if the collection holds no chunk with this id.
+        """
+        with self.collections.use(collection) as vectorstore:
+            return get_chunk(vectorstore, chunk_id)
+
+    def generate_answer(self, query: str, documents: list):
+        """
+        Generate an answer with the "stuff" documents chain from already assembled context,
+        without running the retriever a second time.
+
+        Args:
+            query (str): The user query.
+            documents (list): The `Document` passages to be stuffed into the prompt.
+
+        Returns:
+            str: The answer generated by the LLM.
+        """
+        return self.answer_chain.invoke({"context": documents, "question": query})
@@ -0,0 +1,77 @@
+# Microbenchmark of query moderation and negative-answer detection: the compiled matchers compared with
+# `better_profanity.contains_profanity` and the per-keyword scan they replace. For negative answers, an
+# Aho-Corasick automaton over the same phrases is also measured.
+#
+# Usage:
+#     python -m app.tools.bench_moderation --repeat 200
+
+import argparse
+import random
+import timeit
+
+from better_profanity import profanity
+
+from app.utils.moderation_util import DEFAULT_NEGATIVE_PHRASES, AhoCorasickMatcher
+from app.utils.query_util import is_safe_content, is_negative_response
+
+# Vocabulary used to generate realistic questions and answers
+_WORDS = (
+    "how many rounds of interviews are there for the ml engineer position at the company what is notice period "
+    "policy remote work allowed days per week benefits health insurance leave vacation salary review process "
+    "team manager onboarding documents required laptop security training deadline project report quarterly"
+).split()
+
+
+def _baseline_is_negative_response(result: str) -> bool:
+    """
+    The previous implementation: one scan of the lowercased text per keyword.
+    """
+    return any(keyword in result.lower() for keyword in DEFAULT_NEGATIVE_PHRASES)
+
+
+def _make_text(rng: random.Random, num_words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(num_words)).capitalize() + "?"
+
+
+def _bench(label: str, func, texts: list, repeat: int):
+    seconds = timeit.timeit(lambda: [func(text) for text in texts], number=repeat)
+    micros = seconds / (repeat * len(texts)) * 1e6
+    print(f"  {label:<42} {micros:>10.1f} us/call")
+    return micros
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark moderation and negative-answer detection.")
+    parser.add_argument("--repeat", type=int, default=20, help="Number of passes over the generated texts")
+    parser.add_argument("--texts", type=int, default=50, help="Number of generated texts per length")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    negative_automaton = AhoCorasickMatcher(DEFAULT_NEGATIVE_PHRASES)
+
+    # Realistic lengths: short and long questions, short and long answers
+    for kind, num_words in (("query", 12), ("query", 60), ("answer", 80), ("answer", 300)):
+        texts = [_make_text(rng, num_words) for _ in range(args.texts)]
+        print(f"{kind} of {num_words} words (~{sum(map(len, texts)) // len(texts)} chars):")
+        if kind == "query":
+            old = _bench("better_profanity.contains_profanity", profanity.contains_profanity, texts, args.repeat)
+            new = _bench("is_safe_content (Aho-Corasick)", is_safe_content, texts, args.repeat)
+        else:
+            old = _bench("per-keyword scan", _baseline_is_negative_response, texts, args.repeat)
+            _bench("Aho-Corasick automaton", lambda t: negative_automaton.contains_any(t.lower()), texts, args.repeat)
+            new = _bench("is_negative_response", is_negative_response, texts, args.repeat)
+        print(f"  speedup: {old / new:.1f}x")
+
+    # Agreement of both implementations on texts containing profane words
+    samples = [_make_text(rng, 12) + " " + rng.choice(["fuck", "sh1t", "b1tch", "a$$hole", "f*ck", "damn"])
+               for _ in range(args.texts)]
+    agree = sum(profanity.contains_profanity(s) == (not is_safe_content(s)) for s in samples)
+    print(f"agreement with better_profanity on profane samples: {agree}/{len(samples)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Benchmark of quantized vector storage: index memory, load time, search latency and recall@k of float16 and int8
+# indexes (with exact rescoring of shortlists of several sizes) against the exact float32 index. Runs fully offline
+# on synthetic, clustered and normalized vectors resembling text embeddings.
+#
+# Usage:
+#     python -m app.tools.bench_quantized_search --vectors 100000 --dim 1536 --queries 200 --k 5 --rescore 1,2,4,8
+
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from langchain_community.embeddings import FakeEmbeddings
+
+from app.db.quantized_store import (
+    RESCORE_VECTORS_FILE, create_faiss_store, add_embeddings, save_faiss_store, load_faiss_store, search_index
+)
+
+# Storage modes compared with the exact float32 index
+QUANTIZATIONS = ("fp16", "int8")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark quantized FAISS indexes with exact rescoring.")
+    parser.add_argument("--vectors", type=int, default=100000, help="Number of indexed vectors")
+    parser.add_argument("--dim", type=int, default=1536, help="Vector dimension")
+    parser.add_argument("--clusters", type=int, default=500, help="Number of topics the vectors are drawn around")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=5, help="Number of results per query")
+    parser.add_argument("--rescore", default="1,2,4,8", help="Comma-separated shortlist sizes, as multiples of k")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+def synthetic_embeddings(rng, count: int, centers: np.ndarray, spread: float = 0.5) -> np.ndarray:
+    """
+    Draw normalized vectors around topic centers (unit vectors), at a distance of about `spread` from them.
+    """
+    vectors = centers[rng.integers(0, len(centers), size=count)]
+    vectors = vectors + rng.standard_normal(vectors.shape, dtype=np.float32) * spread / np.sqrt(centers.shape[1])
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_and_load(directory: str, quantization: str, texts, vectors, embeddings):
+    """
+    Build and save an index, then load it back from disk.
+
+    Returns:
+        tuple: The loaded vector store, the load time of the FAISS index alone and of the whole store in ms.
+    """
+    path = os.path.join(directory, quantization)
+    vectorstore = create_faiss_store(embeddings, vectors.shape[1], quantization)
+    add_embeddings(vectorstore, texts, vectors, [{} for _ in texts])
+    save_faiss_store(vectorstore, path)
+    start = time.perf_counter()
+    faiss.read_index(os.path.join(path, "index.faiss"))
+    index_load_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    vectorstore = load_faiss_store(path, embeddings)
+    return vectorstore, index_load_ms, (time.perf_counter() - start) * 1000
+
+
+def timed_search(vectorstore, queries: np.ndarray, k: int, rescore_factor: int):
+    """
+    Search the queries one at a time.
+
+    Returns:
+        tuple: The result ids of every query and the mean latency in ms.
+    """
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        _, ids = search_index(vectorstore, query[None, :], k, rescore_factor=rescore_factor)
+        results.append(ids[0])
+    return np.array(results), (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall(results: np.ndarray, expected: np.ndarray) -> float:
+    """
+    Return the mean fraction of the exact top k found.
+    """
+    return float(np.mean([
+        len(set(row) & set(reference)) / len(reference) for row, reference in zip(results, expected)
+    ]))
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    centers = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    vectors = synthetic_embeddings(rng, args.vectors, centers)
+    queries = synthetic_embeddings(rng, args.queries, centers)
+    texts = [str(i) for i in range(args.vectors)]
+    # The vectors are already embedded: the embedding model is never called
+    embeddings = FakeEmbeddings(size=args.dim)
+    rescore_factors = [int(n) for n in args.rescore.split(",")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        exact, index_load_ms, load_ms = build_and_load(directory, "none", texts, vectors, embeddings)
+        expected, search_ms = timed_search(exact, queries, args.k, 1)
+
+        # Index MB: memory of the vectors; side MB: memory-mapped full-precision vectors; index / store load ms:
+        # load time of the FAISS index alone / with the chunk store
+        print(f"{'storage':>8} {'rescore':>7} {'index MB':>9} {'side MB':>8} {'index ms':>9} {'store ms':>9} "
+              f"{'ms/query':>9} {'recall@' + str(args.k):>9}")
+        index_mb = exact.index.code_size * exact.index.ntotal / 2 ** 20
+        print(f"{'float32':>8} {'-':>7} {index_mb:>9.1f} {'-':>8} {index_load_ms:>9.1f} {load_ms:>9.1f} "
+              f"{search_ms:>9.3f} {1.0:>9.3f}")
+
+        for quantization in QUANTIZATIONS:
+            vectorstore, index_load_ms, load_ms = build_and_load(directory, quantization, texts, vectors, embeddings)
+            index_mb = vectorstore.index.code_size * vectorstore.index.ntotal / 2 ** 20
+            side_mb = os.path.getsize(os.path.join(directory, quantization, RESCORE_VECTORS_FILE)) / 2 ** 20
+            for rescore_factor in rescore_factors:
+                results, search_ms = timed_search(vectorstore, queries, args.k, rescore_factor)
+                print(f"{quantization:>8} {rescore_factor:>6}x {index_mb:>9.1f} {side_mb:>8.1f} "
+                      f"{index_load_ms:>9.1f} {load_ms:>9.1f} {search_ms:>9.3f} {recall(results, expected):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Benchmark of sharded search: QPS and latency of single-query searches against the number of shards, with
+# concurrent clients. Every configuration is checked to return the same top `k` chunks as the unsharded index.
+# Runs fully offline on synthetic vectors.
+#
+# Usage:
+#     python -m app.tools.bench_sharded_search --vectors 200000 --dim 1536 --shards 1,2,4,8 --clients 1,8
+
+import argparse
+import threading
+import time
+
+import numpy as np
+from langchain_community.embeddings import FakeEmbeddings
+
+from app.db.faiss_store import search_vectors_with_scores
+from app.db.sharded_store import ShardedVectorStore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark sharded FAISS search.")
+    parser.add_argument("--vectors", type=int, default=200000, help="Number of indexed vectors")
+    parser.add_argument("--dim", type=int, default=1536, help="Vector dimension")
+    parser.add_argument("--shards", default="1,2,4,8", help="Comma-separated numbers of shards to benchmark")
+    parser.add_argument("--clients", default="1,8", help="Comma-separated numbers of concurrent clients")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries per configuration")
+    parser.add_argument("--k", type=int, default=5, help="Number of results per query")
+    parser.add_argument("--routing", default="chunk", choices=("source", "chunk"), help="Shard routing")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+def run_clients(vectorstore, queries, k: int, clients: int):
+    """
+    Search every query once, spread over `clients` threads.
+
+    Returns:
+        tuple: The wall time in seconds, the latency of each query in ms, and each query's result texts.
+    """
+    latencies = [0.0] * len(queries)
+    results = [None] * len(queries)
+
+    def client(offset: int):
+        for i in range(offset, len(queries), clients):
+            start = time.perf_counter()
+            hits = search_vectors_with_scores(vectorstore, queries[i:i + 1], k)[0]
+            latencies[i] = (time.perf_counter() - start) * 1000
+            results[i] = [doc.page_content for doc, _ in hits]
+
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies, results
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    vectors = rng.standard_normal((args.vectors, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    # The chunk text is its position, so results of differently sharded indexes can be compared
+    texts = [str(i) for i in range(args.vectors)]
+    metadatas = [{"source": f"doc_{i // 50:05d}.txt"} for i in range(args.vectors)]
+
+    # The queries are already embedded: the embedding model is never called
+    embeddings = FakeEmbeddings(size=args.dim)
+
+    # Reference results of the unsharded index
+    baseline = ShardedVectorStore.from_embeddings(texts, vectors, metadatas, embeddings, 1, args.routing)
+    _, _, expected = run_clients(baseline, queries, args.k, 1)
+
+    print(f"{'shards':>6} {'clients':>7} {'QPS':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'same top-k':>10}")
+    for num_shards in [int(n) for n in args.shards.split(",")]:
+        vectorstore = ShardedVectorStore.from_embeddings(
+            texts, vectors, metadatas, embeddings, num_shards, args.routing
+        )
+        # Warm up the search threads
+        run_clients(vectorstore, queries[:10], args.k, 1)
+        for clients in [int(n) for n in args.clients.split(",")]:
+            elapsed, latencies, results = run_clients(vectorstore, queries, args.k, clients)
+            same = np.mean([result == reference for result, reference in zip(results, expected)])
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            print(f"{num_shards:>6} {clients:>7} {len(queries) / elapsed:>9.1f} {p50:>8.2f} {p95:>8.2f} "
+                  f"{p99:>8.2f} {same:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+# Load-test harness replaying recorded queries against the API.
+#
+# The workload is read from the query log (`query_logs.log`, see `app.core.logging_config`) or from any JSONL file
+# of `{"endpoint": ..., "request": {...}}` or `{"query": ...}` records. Requests are sent either open-loop (Poisson
+# arrivals at a fixed rate), closed-loop (N users sending their next request when the previous one completes), or
+# with the recorded arrival times, optionally compressed. Document uploads can be mixed in. Queries are spread over
+# `--query-users` users, since every user is rate limited.
+#
+# By default the app runs in-process in a scratch directory, against `app.tools.mock_openai`, so no network access
+# nor OpenAI key is needed. With `--base-url`, a running deployment is targeted instead.
+#
+# Usage:
+#     python -m app.tools.loadtest --log query_logs.log --mode poisson --rate 20 --duration 60 --upload-ratio 0.02
+#     python -m app.tools.loadtest --log queries.jsonl --mode closed --users 16 --requests 2000
+#     python -m app.tools.loadtest --log query_logs.log --mode replay --time-compression 10
+#     python -m app.tools.loadtest --log query_logs.log --base-url http://127.0.0.1:8000 --admin-key ...
+
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+# Root of the backend package (the directory holding `app/`)
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+UPLOAD_ENDPOINT = "/v1/document/upload/"
+
+# Query lines of the former plain-text query log
+_LEGACY_QUERY_LINE = re.compile(r"Query: (.+)$")
+
+
+def _to_workload_item(record: dict):
+    """
+    Converts a log or JSONL record into a `{"endpoint", "body", "ts"}` workload item (None if not a request).
+    """
+    ts = record.get("ts")
+    if isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts).timestamp()
+        except ValueError:
+            ts = None
+    if "endpoint" in record and "request" in record:
+        return {"endpoint": record["endpoint"], "body": record["request"], "ts": ts}
+    if isinstance(record.get("query"), str):
+        body = {"query": record["query"]}
+        if record.get("filter"):
+            body["filter"] = record["filter"]
+        return {"endpoint": "/v1/query/ask/", "body": body, "ts": ts}
+    if isinstance(record.get("queries"), list):
+        return {"endpoint": "/v1/query/ask/batch", "body": {"queries": record["queries"]}, "ts": ts}
+    return None
+
+
+def load_workload(paths: list) -> list:
+    """
+    Reads the recorded requests from query logs or JSONL files (rotated logs can be passed with a glob).
+
+    Args:
+        paths (list): Paths or glob patterns of the files to read.
+
+    Returns:
+        list: The workload items, in file order.
+    """
+    items = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, encoding="utf-8") as workload_file:
+                for line in workload_file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        item = _to_workload_item(json.loads(line))
+                    except json.JSONDecodeError:
+                        match = _LEGACY_QUERY_LINE.search(line)
+                        item = {"endpoint": "/v1/query/ask/", "body": {"query": match.group(1)}, "ts": None} \
+                            if match else None
+                    if item is not None:
+                        items.append(item)
+    return items
+
+
+class LoadStats:
+    """
+    Collects the latency and outcome of every request, per endpoint.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.dropped = 0
+        self.started = None
+        self.finished = None
+
+    def record(self, endpoint: str, latency_s: float, status):
+        self.latencies[endpoint].append(latency_s)
+        self.statuses[endpoint][status] += 1
+        if not (isinstance(status, int) and status < 400):
+            self.errors[endpoint] += 1
+
+    def report(self) -> dict:
+        """
+        Returns throughput, error rate and latency percentiles (in ms) per endpoint and overall.
+        """
+        elapsed = max((self.finished or time.perf_counter()) - self.started, 1e-9)
+        endpoints = {}
+        rows = list(self.latencies.items())
+        rows.append(("ALL", [latency for values in self.latencies.values() for latency in values]))
+        for endpoint, values in rows:
+            if not values:
+                continue
+            ordered = sorted(values)
+            errors = sum(self.errors.values()) if endpoint == "ALL" else self.errors[endpoint]
+
+            def percentile(fraction):
+                return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] * 1000
+
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": errors,
+                "error_rate": errors / len(values),
+                "throughput_rps": len(values) / elapsed,
+                "p50_ms": percentile(0.50),
+                "p90_ms": percentile(0.90),
+                "p95_ms": percentile(0.95),
+                "p99_ms": percentile(0.99),
+                "max_ms": ordered[-1] * 1000,
+            }
+            if endpoint != "ALL":
+                endpoints[endpoint]["statuses"] = {str(k): v for k, v in self.statuses[endpoint].items()}
+        return {"elapsed_s": elapsed, "dropped": self.dropped, "endpoints": endpoints}
+
+
+def print_report(report: dict):
+    print(f"\nElapsed: {report['elapsed_s']:.1f}s   dropped (client overload): {report['dropped']}")
+    header = f"{'endpoint':<28}{'reqs':>7}{'err%':>7}{'rps':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, row in report["endpoints"].items():
+        print(
+            f"{endpoint:<28}{row['requests']:>7}{row['error_rate'] * 100:>6.1f}%{row['throughput_rps']:>8.1f}"
+            f"{row['p50_ms']:>9.1f}{row['p90_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}"
+        )
+        if row.get("statuses"):
+            print(f"{'':<28}statuses: {row['statuses']}")
+    print("(latencies in ms)")
+
+
+class LoadGenerator:
+    """
+    Sends the workload to the API and records the outcome of every request.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, workload: list, args):
+        self.client = client
+        self.workload = workload
+        self.args = args
+        self.stats = LoadStats()
+        self.rng = random.Random(args.seed)
+        self.admin_headers = {}
+        self.user_headers = []
+        self.upload_files = sorted(glob.glob(os.path.join(args.upload_dir, "*.txt"))) if args.upload_dir else []
+        self._vocabulary = [
+            word for item in workload[:1000] for word in str(item["body"].get("query", "")).split()
+        ] or "policy leave interview salary remote work benefits".split()
+        self._upload_count = 0
+        self._in_flight = 0
+
+    async def _login(self, username: str, password: str, role: str, admin_key: str = None) -> dict:
+        """
+        Registers (if needed) and logs in a user, and returns its authorization headers.
+        """
+        registration = {"username": username, "password": password, "role": role}
+        if admin_key is not None:
+            registration["admin_key"] = admin_key
+        await self.client.post("/v1/auth/register/", json=registration)
+        response = await self.client.post("/v1/auth/token/", data={"username": username, "password": password})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def login_admin(self):
+        """
+        Registers (if needed) and logs in the admin user used for uploads.
+        """
+        args = self.args
+        self.admin_headers = await self._login(args.admin_user, args.admin_password, "admin", args.admin_key)
+
+    async def _login_query_user(self, index: int):
+        self.user_headers[index] = await self._login(
+            f"{self.args.query_user_prefix}-{index}", self.args.query_user_password, "user"
+        )
+
+    async def login_query_users(self):
+        """
+        Registers (if needed) and logs in the users the queries are sent as.
+        """
+        self.user_headers = [None] * self.args.query_users
+        await asyncio.gather(*(self._login_query_user(i) for i in range(self.args.query_users)))
+
+    def _upload_payload(self):
+        self._upload_count += 1
+        if self.upload_files:
+            path = self.upload_files[self._upload_count % len(self.upload_files)]
+            with open(path, "rb") as upload_file:
+                content = upload_file.read()
+            # Distinct names and content, so uploads are not skipped as duplicates
+            return f"loadtest-{self._upload_count}-{os.path.basename(path)}", \
+                content + f"\n\nLoad test upload {self._upload_count}.".encode()
+        words = [self.rng.choice(self._vocabulary) for _ in range(self.args.upload_words)]
+        text = f"Load test document {self._upload_count}.\n\n" + " ".join(words)
+        return f"loadtest-{self._upload_count}.txt", text.encode()
+
+    async def send(self, item: dict):
+        """
+        Sends one request (a workload item, or an upload when `item` is None) and records its outcome.
+        """
+        if item is None:
+            endpoint = UPLOAD_ENDPOINT
+        else:
+            endpoint = item["endpoint"]
+        start = time.perf_counter()
+        try:
+            if item is None:
+                filename, content = self._upload_payload()
+                response = await self.client.post(
+                    UPLOAD_ENDPOINT, files={"file": (filename, content, "text/plain")}, headers=self.admin_headers
+                )
+                if response.status_code == 401:
+                    # The token expired during a long run
+                    await self.login_admin()
+                    response = await self.client.post(
+                        UPLOAD_ENDPOINT, files={"file": (filename, content, "text/plain")}, headers=self.admin_headers
+                    )
+            else:
+                user = self.rng.randrange(len(self.user_headers))
+                response = await self.client.post(endpoint, json=item["body"], headers=self.user_headers[user])
+                if response.status_code == 401:
+                    await self._login_query_user(user)
+                    response = await self.client.post(endpoint, json=item["body"], headers=self.user_headers[user])
+            await response.aread()
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        self.stats.record(endpoint, time.perf_counter() - start, status)
+
+    def _next_item(self, index: int):
+        if self.args.upload_ratio and self.rng.random() < self.args.upload_ratio:
+            return None
+        if self.args.shuffle:
+            return self.rng.choice(self.workload)
+        return self.workload[index % len(self.workload)]
+
+    async def _send_tracked(self, item):
+        self._in_flight += 1
+        try:
+            await self.send(item)
+        finally:
+            self._in_flight -= 1
+
+    def _total_requests(self):
+        return self.args.requests or (None if self.args.duration else len(self.workload))
+
+    async def run_open_loop(self):
+        """
+        Poisson arrivals at `--rate` requests per second, independent of the response times.
+        """
+        deadline = time.perf_counter() + self.args.duration if self.args.duration else None
+        total = self._total_requests()
+        tasks = []
+        next_arrival = time.perf_counter()
+        index = 0
+        while (total is None or index < total) and (deadline is None or next_arrival < deadline):
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._in_flight >= self.args.max_in_flight:
+                self.stats.dropped += 1
+            else:
+                tasks.append(asyncio.ensure_future(self._send_tracked(self._next_item(index))))
+            index += 1
+            next_arrival += self.rng.expovariate(self.args.rate)
+        await asyncio.gather(*tasks)
+
+    async def run_closed_loop(self):
+        """
+        `--users` concurrent users, each sending its next request as soon as the previous one completed.
+        """
+        deadline = time.perf_counter() + self.args.duration if self.args.duration else None
+        total = self._total_requests()
+        counter = iter(range(total)) if total is not None else itertools.count()
+
+        async def user():
+            for index in counter:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                await self.send(self._next_item(index))
+                if self.args.think_time_ms:
+                    await asyncio.sleep(self.rng.expovariate(1000 / self.args.think_time_ms))
+
+        await asyncio.gather(*(user() for _ in range(self.args.users)))
+
+    async def run_replay(self):
+        """
+        Sends the requests at their recorded arrival times, divided by `--time-compression`.
+        """
+        timed = [item for item in self.workload if item["ts"] is not None]
+        if not timed:
+            raise SystemExit("The workload has no timestamps; use --mode poisson or closed instead")
+        timed.sort(key=lambda item: item["ts"])
+        first_ts = timed[0]["ts"]
+        start = time.perf_counter()
+        tasks = []
+        for item in timed[:self.args.requests or None]:
+            delay = start + (item["ts"] - first_ts) / self.args.time_compression - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.args.upload_ratio and self.rng.random() < self.args.upload_ratio:
+                tasks.append(asyncio.ensure_future(self._send_tracked(None)))
+            tasks.append(asyncio.ensure_future(self._send_tracked(item)))
+        await asyncio.gather(*tasks)
+
+    async def run(self) -> dict:
+        if self.args.upload_ratio:
+            await self.login_admin()
+        await self.login_query_users()
+        self.stats.started = time.perf_counter()
+        if self.args.mode == "poisson":
+            await self.run_open_loop()
+        elif self.args.mode == "closed":
+            await self.run_closed_loop()
+        else:
+            await self.run_replay()
+        self.stats.finished = time.perf_counter()
+        return self.stats.report()
+
+
+def prepare_in_process_app(args):
+    """
+    Starts the mock OpenAI API and imports the app in a scratch directory seeded with documents.
+
+    Returns:
+        tuple: The ASGI app, the mock server and the scratch directory.
+    """
+    from app.tools.mock_openai import MockOpenAIServer
+
+    mock = MockOpenAIServer(
+        dim=args.mock_dim,
+        embedding_latency_ms=args.mock_embedding_latency_ms,
+        completion_latency_ms=args.mock_completion_latency_ms,
+        error_rate=args.mock_error_rate,
+    ).start()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    os.makedirs(os.path.join(workdir, "app", "Documents", "new_docs"))
+    seed_docs = sorted(glob.glob(os.path.join(args.seed_docs, "*.txt")))
+    if not seed_docs:
+        raise SystemExit(f"No seed documents (*.txt) found in {args.seed_docs}")
+    for path in seed_docs:
+        shutil.copy(path, os.path.join(workdir, "app", "Documents"))
+
+    # The configuration is read from the environment when the app is imported. The scratch directory has no
+    # prebuilt index: the app builds it from the seed documents at startup.
+    os.environ.update({
+        "OPENAI_BASE_URL": mock.base_url,
+        "OPENAI_API_KEY": "mock",
+        "EMBEDDING_CHECK_CTX_LENGTH": "false",
+        "QUERY_LOG_PATH": os.path.join(workdir, "query_logs.log"),
+        "BUILD_INDEX_ON_STARTUP": "true",
+    })
+    os.environ.setdefault("SECRET_KEY", "loadtest-secret")
+    os.environ.setdefault("ADMIN_KEY", args.admin_key)
+    args.admin_key = os.environ["ADMIN_KEY"]
+
+    if BACKEND_ROOT not in sys.path:
+        sys.path.insert(0, BACKEND_ROOT)
+    os.chdir(workdir)
+    from app.main import app
+    return app, mock, workdir
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay recorded queries against the API and report latencies.")
+    parser.add_argument("--log", nargs="+", default=["query_logs.log"], help="Query logs or JSONL files (globs allowed)")
+    parser.add_argument("--mode", choices=("poisson", "closed", "replay"), default="poisson",
+                        help="Open-loop Poisson arrivals, closed-loop users, or recorded arrival times")
+    parser.add_argument("--rate", type=float, default=10.0, help="Poisson arrival rate (requests/second)")
+    parser.add_argument("--users", type=int, default=8, help="Number of closed-loop users")
+    parser.add_argument("--think-time-ms", type=float, default=0.0, help="Mean pause between a user's requests")
+    parser.add_argument("--time-compression", type=float, default=1.0, help="Replay speed-up factor")
+    parser.add_argument("--duration", type=float, help="Stop sending after this many seconds")
+    parser.add_argument("--requests", type=int, help="Number of requests (default: the workload size)")
+    parser.add_argument("--shuffle", action="store_true", help="Pick workload items at random instead of in order")
+    parser.add_argument("--max-in-flight", type=int, default=1000,
+                        help="Open-loop arrivals beyond this many outstanding requests are dropped and counted")
+    parser.add_argument("--upload-ratio", type=float, default=0.0, help="Fraction of requests that are uploads")
+    parser.add_argument("--upload-dir", help="Directory of .txt files to upload (default: generated documents)")
+    parser.add_argument("--upload-words", type=int, default=2000, help="Size of generated upload documents")
+    parser.add_argument("--base-url", help="Target a running deployment instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Request timeout (seconds)")
+    parser.add_argument("--admin-user", default="loadtest-admin", help="Admin user used for uploads")
+    parser.add_argument("--admin-password", default="loadtest-password", help="Password of the admin user")
+    parser.add_argument("--admin-key", default=os.getenv("ADMIN_KEY", "loadtest-admin-key"),
+                        help="Admin key used to register the admin user")
+    parser.add_argument("--query-users", type=int, default=20, help="Number of users the queries are spread over")
+    parser.add_argument("--query-user-prefix", default="loadtest-user", help="Username prefix of the query users")
+    parser.add_argument("--query-user-password", default="loadtest-password", help="Password of the query users")
+    parser.add_argument("--seed-docs", default=os.path.join(BACKEND_ROOT, "app", "Documents"),
+                        help="Documents indexed by the in-process app at startup")
+    parser.add_argument("--mock-dim", type=int, default=256, help="Embedding dimension of the mock OpenAI API")
+    parser.add_argument("--mock-embedding-latency-ms", type=float, default=50.0, help="Mock embedding latency")
+    parser.add_argument("--mock-completion-latency-ms", type=float, default=500.0, help="Mock completion latency")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="Fraction of mock API errors")
+    parser.add_argument("--report-json", help="Also write the report to this JSON file")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args()
+
+
+async def run(args, app=None) -> dict:
+    workload = load_workload(args.log)
+    if not workload:
+        raise SystemExit(f"No requests found in {args.log}")
+    print(f"Loaded {len(workload)} recorded requests")
+
+    if app is not None:
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://loadtest"
+    else:
+        transport = None
+        base_url = args.base_url
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout,
+                                 limits=limits) as client:
+        return await LoadGenerator(client, workload, args).run()
+
+
+def main():
+    args = parse_args()
+    # Resolve the workload paths before the in-process app changes the working directory
+    args.log = [os.path.abspath(path) for path in args.log]
+    if args.upload_dir:
+        args.upload_dir = os.path.abspath(args.upload_dir)
+    if args.report_json:
+        args.report_json = os.path.abspath(args.report_json)
+
+    app = mock = workdir = None
+    if not args.base_url:
+        app, mock, workdir = prepare_in_process_app(args)
+    try:
+        report = asyncio.run(run(args, app))
+    finally:
+        if mock is not None:
+            mock.stop()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.report_json:
+        with open(args.report_json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# Local stand-in for the OpenAI embedding and completion APIs, so the service can be run and load-tested offline.
+#
+# Embeddings are deterministic feature-hashed bags of words (texts sharing words get similar vectors, so retrieval
+# behaves sensibly), and completions return a short answer built from the question. Latencies and error rates of
+# the real API can be simulated.
+#
+# Usage:
+#     python -m app.tools.mock_openai --port 8900 --completion-latency-ms 800
+#     OPENAI_BASE_URL=http://127.0.0.1:8900/v1 EMBEDDING_CHECK_CTX_LENGTH=false uvicorn app.main:app
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Words of the texts to embed
+_WORD = re.compile(r"\w+")
+
+# The question of a "stuff" QA prompt
+_QUESTION = re.compile(r"Question:\s*(.+)")
+
+
+def _hashed_embedding(text, dim: int) -> list:
+    """
+    Embeds a text (or a list of token ids) as a normalized feature-hashed bag of words.
+    """
+    tokens = [str(token) for token in text] if isinstance(text, list) else _WORD.findall(text.lower())
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in tokens:
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        vector[0] = 1.0
+        norm = 1.0
+    return vector / norm
+
+
+def _answer(prompt: str) -> str:
+    match = _QUESTION.search(prompt)
+    question = match.group(1).strip() if match else prompt.strip()[-200:]
+    return f" According to the provided documents, the answer to \"{question}\" is described in the context above."
+
+
+class MockOpenAIServer:
+    """
+    A threaded HTTP server implementing `/v1/embeddings`, `/v1/completions` and `/v1/chat/completions`.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = 256,
+                 embedding_latency_ms: float = 0.0, completion_latency_ms: float = 0.0, error_rate: float = 0.0):
+        """
+        Args:
+            host (str): Interface to listen on.
+            port (int): Port to listen on (0 picks a free port).
+            dim (int): Dimension of the returned embeddings.
+            embedding_latency_ms (float): Mean simulated latency of an embedding request.
+            completion_latency_ms (float): Mean simulated latency of a completion request.
+            error_rate (float): Fraction of requests failing with a 429 or 500 error.
+        """
+        self.dim = dim
+        self.embedding_latency_ms = embedding_latency_ms
+        self.completion_latency_ms = completion_latency_ms
+        self.error_rate = error_rate
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """
+        Serves requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately: without TCP_NODELAY, delayed ACKs add ~40ms per response
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict, headers: dict = None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _simulate(self, latency_ms: float) -> bool:
+                if latency_ms:
+                    time.sleep(latency_ms * random.uniform(0.5, 1.5) / 1000)
+                if server.error_rate and random.random() < server.error_rate:
+                    if random.random() < 0.5:
+                        self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                        {"Retry-After": "0.1"})
+                    else:
+                        self._send_json(500, {"error": {"message": "Internal error", "type": "server_error"}})
+                    return False
+                return True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.split("?")[0].rstrip("/")
+
+                if path.endswith("/embeddings"):
+                    if self._simulate(server.embedding_latency_ms):
+                        self._send_json(200, self._embeddings(request))
+                elif path.endswith("/chat/completions"):
+                    if self._simulate(server.completion_latency_ms):
+                        prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+                        self._send_json(200, self._completion(request, [prompt], chat=True))
+                elif path.endswith("/completions"):
+                    if self._simulate(server.completion_latency_ms):
+                        prompts = request.get("prompt", "")
+                        self._send_json(200, self._completion(request, prompts if isinstance(prompts, list) else [prompts]))
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def _embeddings(self, request: dict) -> dict:
+                inputs = request.get("input", [])
+                # A single string or a single list of token ids is one input
+                if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                    inputs = [inputs]
+                data = []
+                for index, text in enumerate(inputs):
+                    vector = _hashed_embedding(text, server.dim)
+                    if request.get("encoding_format") == "base64":
+                        embedding = base64.b64encode(vector.astype(np.float32).tobytes()).decode()
+                    else:
+                        embedding = vector.tolist()
+                    data.append({"object": "embedding", "index": index, "embedding": embedding})
+                tokens = sum(len(text) if isinstance(text, list) else len(_WORD.findall(text)) for text in inputs)
+                return {
+                    "object": "list",
+                    "data": data,
+                    "model": request.get("model", "mock-embedding"),
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                }
+
+            def _completion(self, request: dict, prompts: list, chat: bool = False) -> dict:
+                choices = []
+                for index, prompt in enumerate(prompts):
+                    text = _answer(prompt)
+                    if chat:
+                        choices.append({"index": index, "finish_reason": "stop",
+                                        "message": {"role": "assistant", "content": text.strip()}})
+                    else:
+                        choices.append({"index": index, "finish_reason": "stop", "text": text, "logprobs": None})
+                prompt_tokens = sum(len(_WORD.findall(prompt)) for prompt in prompts)
+                completion_tokens = sum(len(_WORD.findall(_answer(prompt))) for prompt in prompts)
+                return {
+                    "id": f"cmpl-mock-{random.getrandbits(48):012x}",
+                    "object": "chat.completion" if chat else "text_completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "mock-completion"),
+                    "choices": choices,
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }
+
+        return Handler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for the OpenAI embedding and completion APIs.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8900, help="Port to listen on")
+    parser.add_argument("--dim", type=int, default=256, help="Dimension of the returned embeddings")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0, help="Mean simulated embedding latency")
+    parser.add_argument("--completion-latency-ms", type=float, default=0.0, help="Mean simulated completion latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 429/500")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = MockOpenAIServer(
+        args.host, args.port, args.dim, args.embedding_latency_ms, args.completion_latency_ms, args.error_rate
+    )
+    print(f"Mock OpenAI API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
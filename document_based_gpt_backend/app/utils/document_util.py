@@ -1,34 +1,72 @@
+# Import datetime to record the upload time of documents
+from datetime import datetime, timezone
+
 # Import necessary classes from LangChain community modules for document processing
-from langchain_community.document_loaders import DirectoryLoader
+from langchain_community.document_loaders import UnstructuredFileLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+# Import configuration values such as the chunking parameters
+from app.core import config
+
 
-def load_new_documents(directory_path: str):
+def upload_metadata(uploaded_by: str = None, tags: list = None) -> dict:
     """
-    Load, split, and format documents from the specified directory.
+    Build the metadata of an uploaded document, stored in every chunk and indexed for filtered searches.
 
-    This function reads all text files from the given directory, splits their content into smaller chunks
-    while preserving some overlap for context, and returns a list of documents in a structured format with metadata.
+    Args:
+        uploaded_by (str, optional): Username of the uploader.
+        tags (list, optional): User-supplied tags.
+
+    Returns:
+        dict: The uploader, the upload time and day (UTC) and the tags.
+    """
+    uploaded_at = datetime.now(timezone.utc)
+    return {
+        "uploaded_by": uploaded_by,
+        "uploaded_at": uploaded_at.isoformat(),
+        "uploaded_on": uploaded_at.date().isoformat(),
+        "tags": tags or [],
+    }
+
+
+def load_document(file_path: str, extra_metadata: dict = None, source: str = None):
+    """
+    Load, split, and format a single document.
 
     Args:
-        directory_path (str): Path to the directory containing documents to be loaded.
+        file_path (str): Path to the document to be loaded.
+        extra_metadata (dict, optional): Metadata (e.g. uploader, upload time, tags) added to every chunk.
+        source (str, optional): The source recorded in the chunks, when the document is loaded from another path
+            than its final one (e.g. an upload not moved into place yet). Defaults to `file_path`.
 
     Returns:
         list: A list of `Document` objects, each containing content chunks and associated metadata.
     """
+    # Load the file with the loader used for every indexed document.
+    loader = UnstructuredFileLoader(file_path)
+    documents = loader.load()
+    if source is not None:
+        for doc in documents:
+            doc.metadata["source"] = source
+    return split_documents(documents, extra_metadata)
 
-    # Initialize the DirectoryLoader to read text files from the specified directory.
-    # The `glob` parameter specifies that only `.txt` files will be read.
-    loader = DirectoryLoader(directory_path, glob="*.txt")
 
-    # Load the documents from the specified directory path.
-    documents = loader.load()
+def split_documents(documents: list, extra_metadata: dict = None):
+    """
+    Split loaded documents into chunks carrying their source, chunk index and any extra metadata.
+
+    Args:
+        documents (list): The loaded `Document` objects.
+        extra_metadata (dict, optional): Metadata added to every chunk.
 
+    Returns:
+        list: A list of `Document` objects, each containing content chunks and associated metadata.
+    """
     # Create a text splitter to divide the content into chunks.
     # `chunk_size` specifies the maximum size of each chunk (in characters).
     # `chunk_overlap` specifies the overlap (in characters) between consecutive chunks.
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=config.CHUNK_SIZE, chunk_overlap=config.CHUNK_OVERLAP)
 
     # Initialize a list to store split documents with metadata.
     split_docs_with_metadata = []
@@ -45,6 +83,7 @@ def load_new_documents(directory_path: str):
                 Document(
                     page_content=chunk,
                     metadata={
+                        **(extra_metadata or {}),
                         "source": doc.metadata["source"],  # Original source file of the document
                         "chunk_index": i  # Index of the chunk within the source file
                     }
@@ -1,6 +1,53 @@
 import logging
+import random
+from datetime import datetime, timezone
 
+# Import configuration values such as the body sampling rate
+from app.core import config
 
-# Log the query and the response
-def log_query_response(query: str, response: str):
-    logging.info(f"Query: {query}\nResponse: {response}\n---")
+# Import the name of the query log, whose handlers are configured at startup
+from app.core.logging_config import QUERY_LOGGER_NAME
+
+# Import the ring buffer keeping the traces of slow requests
+from app.utils.trace_util import slow_requests
+
+# Logger of the query log (configured in `app.core.logging_config`)
+query_logger = logging.getLogger(QUERY_LOGGER_NAME)
+
+
+# Log a processed request as one structured JSON line
+def log_query_event(trace, status: str, response=None, error: Exception = None):
+    """
+    Logs a processed request from its trace.
+
+    Every record holds the endpoint and the JSON request body, so the log can be replayed as a load-test
+    workload, plus the stage timings and the hits (chunk ids and scores). The full response body is only
+    included in a `QUERY_LOG_BODY_SAMPLE_RATE` fraction of the records. Slow requests are also kept, with the
+    timeline of their stages, in the slow request buffer.
+
+    Args:
+        trace (RequestTrace): The trace of the request.
+        status (str): "ok", "degraded" (extractive fallback answer), "rejected" (moderation) or "error".
+        response (dict, optional): The response body.
+        error (Exception, optional): The error that failed the request.
+    """
+    event = {
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "query_id": trace.query_id,
+        "endpoint": trace.endpoint,
+        "request": trace.request,
+        "status": status,
+        "timings_ms": {
+            **{name: round(ms, 3) for name, ms in trace.timings.items()},
+            "total": round(trace.elapsed_ms(), 3)
+        },
+        "hits": trace.hits,
+        # Whether the retrieval or the answer was shared with an identical request started earlier
+        "coalesced": trace.coalesced,
+    }
+    if error is not None:
+        event["error"] = str(error)
+    if response is not None and random.random() < config.QUERY_LOG_BODY_SAMPLE_RATE:
+        event["response"] = response
+    query_logger.info("query", extra={"event": event})
+    slow_requests.record(trace, status, error)
@@ -0,0 +1,116 @@
+# In-process metrics registry
+# Collects counters, gauges and value distributions (e.g. token counts, latencies) so that they can be
+# exposed through the metrics endpoint without requiring an external monitoring dependency.
+
+import threading
+from collections import deque
+
+# Number of most recent observations kept per distribution to compute percentiles
+_MAX_SAMPLES = 1024
+
+
+def _metric_key(name: str, labels: dict) -> str:
+    """
+    Builds a unique key for a metric from its name and optional labels.
+
+    Args:
+        name (str): The metric name.
+        labels (dict): Optional labels (e.g. {"endpoint": "embeddings"}).
+
+    Returns:
+        str: A key such as `upstream_latency_ms{endpoint=embeddings}`.
+    """
+    if not labels:
+        return name
+    label_str = ",".join(f"{key}={labels[key]}" for key in sorted(labels))
+    return f"{name}{{{label_str}}}"
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    """
+    Returns the value at the given fraction (0..1) of an already sorted list.
+    """
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class MetricsRegistry:
+    """
+    A thread-safe registry holding counters, gauges and distributions of observed values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._distributions = {}
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """
+        Increments a counter by the given value.
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """
+        Sets a gauge to the given value, replacing the previous one.
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Records a single observation of a distribution (count, sum, min, max and recent samples).
+        """
+        key = _metric_key(name, labels)
+        with self._lock:
+            dist = self._distributions.get(key)
+            if dist is None:
+                dist = {"count": 0, "sum": 0.0, "min": value, "max": value, "samples": deque(maxlen=_MAX_SAMPLES)}
+                self._distributions[key] = dist
+            dist["count"] += 1
+            dist["sum"] += value
+            dist["min"] = min(dist["min"], value)
+            dist["max"] = max(dist["max"], value)
+            dist["samples"].append(value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        """
+        Returns the current value of a counter (0 if it was never incremented).
+        """
+        with self._lock:
+            return self._counters.get(_metric_key(name, labels), 0)
+
+    def snapshot(self) -> dict:
+        """
+        Returns a JSON-serializable snapshot of all metrics.
+
+        Returns:
+            dict: Counters, gauges and distribution summaries including p50/p95/p99 of recent samples.
+        """
+        with self._lock:
+            distributions = {}
+            for key, dist in self._distributions.items():
+                samples = sorted(dist["samples"])
+                distributions[key] = {
+                    "count": dist["count"],
+                    "sum": dist["sum"],
+                    "avg": dist["sum"] / dist["count"],
+                    "min": dist["min"],
+                    "max": dist["max"],
+                    "p50": _percentile(samples, 0.50),
+                    "p95": _percentile(samples, 0.95),
+                    "p99": _percentile(samples, 0.99),
+                }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "distributions": distributions,
+            }
+
+
+# Application-wide metrics registry
+metrics = MetricsRegistry()
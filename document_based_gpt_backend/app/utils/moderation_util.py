@@ -0,0 +1,237 @@
+# Multi-pattern text matching for content moderation and negative-answer detection
+# Wordlists are compiled once at startup and can be swapped at runtime by reloading them. The large profanity
+# wordlist is compiled into an Aho-Corasick automaton, so each query is checked in a single linear pass.
+
+import os
+import re
+import threading
+from collections import deque
+
+# Import better_profanity only to locate its bundled default wordlist
+import better_profanity
+
+# Import configuration values such as the wordlist paths
+from app.core import config
+
+# Default wordlist shipped with better_profanity
+DEFAULT_PROFANITY_WORDLIST_PATH = os.path.join(os.path.dirname(better_profanity.__file__), "profanity_wordlist.txt")
+
+# Keywords or phrases indicating a negative or "no information" answer.
+DEFAULT_NEGATIVE_PHRASES = [
+    "i don't", "i do not", "i'm sorry", "no mention", "not mention", "not found",
+    "no information", "cannot find", "does not exist", "not specified", "not mentioned",
+    "not available", "no details", "not provided"
+]
+
+# Leetspeak normalization: digits and symbols standing for a letter are folded to it, both in the wordlist and
+# in the checked text (e.g. "$h1t" becomes "sh1t"). Letters are never folded into other letters, so real words
+# stay distinct.
+_LEET_TABLE = str.maketrans({
+    "4": "a", "@": "a",
+    "3": "e",
+    "0": "o",
+    "5": "s", "$": "s",
+    "7": "t",
+})
+
+# "1" stands for either "i" or "l": it is kept in the text, and the patterns get variants using it instead
+_ONE_LETTERS = "il"
+
+# Letters that may be masked with "*" (e.g. "f*ck"), after folding
+_MASKABLE_LETTERS = "aeiou"
+
+# Runs of anything other than word characters and the "*" mask are word separators, and so are apostrophes
+# unless they are inside a word (so "hell's" is a single word, but "'hell'" is quoted)
+_SEPARATORS = re.compile(r"(?:[^\w*']|(?<![\w*])'|'(?![\w*]))+")
+
+
+class AhoCorasickMatcher:
+    """
+    An Aho-Corasick automaton matching any number of patterns in a single pass over the text.
+    """
+
+    def __init__(self, patterns):
+        """
+        Compiles the patterns into the automaton.
+
+        Args:
+            patterns (Iterable[str]): The patterns to be matched.
+        """
+        # State 0 is the root; `goto[s]` maps a character to the next state, `output[s]` holds the
+        # patterns ending at state `s` (including those reachable through failure links).
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for pattern in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] = self.output[state] + (pattern,)
+
+        # Breadth-first computation of the failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def contains_any(self, text: str) -> bool:
+        """
+        Returns True as soon as any pattern is found in the text.
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
+
+    def find_all(self, text: str) -> list:
+        """
+        Returns every (end index, pattern) occurrence found in the text.
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        matches = []
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            matches.extend((end, pattern) for pattern in output[state])
+        return matches
+
+
+def normalize_for_profanity(text: str) -> str:
+    """
+    Normalizes text for profanity matching: case-folding, leetspeak folding, and single-space word
+    separators, padded with a space on each side so that patterns only match whole words.
+
+    Args:
+        text (str): The text to be normalized.
+
+    Returns:
+        str: The normalized text.
+    """
+    return f" {_SEPARATORS.sub(' ', text.casefold().translate(_LEET_TABLE)).strip()} "
+
+
+def _read_wordlist(path: str) -> list:
+    """
+    Reads a wordlist file, one word or phrase per line (blank lines are ignored).
+    """
+    with open(path, encoding="utf-8") as wordlist_file:
+        return [line.strip() for line in wordlist_file if line.strip()]
+
+
+def build_profanity_matcher(words) -> AhoCorasickMatcher:
+    """
+    Builds the profanity matcher, including the variants of each word with "1" written for some of its "i" and
+    "l" letters, and the variants with one letter masked by "*".
+
+    Args:
+        words (Iterable[str]): The profane words and phrases.
+
+    Returns:
+        AhoCorasickMatcher: The compiled matcher (patterns are whole words padded with spaces).
+    """
+    patterns = set()
+    for word in words:
+        variants = [""]
+        for char in normalize_for_profanity(word):
+            variants = [variant + char for variant in variants]
+            if char in _ONE_LETTERS:
+                variants += [variant[:-1] + "1" for variant in variants]
+        for variant in variants:
+            patterns.add(variant)
+            for i, char in enumerate(variant):
+                if char in _MASKABLE_LETTERS:
+                    patterns.add(variant[:i] + "*" + variant[i + 1:])
+    return AhoCorasickMatcher(patterns)
+
+
+class SubstringSetMatcher:
+    """
+    Matches a small set of phrases with C-level substring searches.
+
+    For a short phrase list (like the negative-answer phrases) this is faster than walking an automaton
+    character by character in Python; see `app.tools.bench_moderation`.
+    """
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns (Iterable[str]): The patterns to be matched.
+        """
+        self.patterns = tuple(pattern for pattern in patterns if pattern)
+
+    def contains_any(self, text: str) -> bool:
+        """
+        Returns True as soon as any pattern is found in the text.
+        """
+        return any(pattern in text for pattern in self.patterns)
+
+
+def build_negative_phrase_matcher(phrases) -> SubstringSetMatcher:
+    """
+    Builds the negative-answer matcher (case-insensitive substring matching on lowercased text).
+
+    Args:
+        phrases (Iterable[str]): The phrases indicating a negative answer.
+
+    Returns:
+        SubstringSetMatcher: The compiled matcher.
+    """
+    return SubstringSetMatcher(phrase.lower() for phrase in phrases)
+
+
+class ModerationMatchers:
+    """
+    Holds the compiled profanity and negative-phrase matchers, which can be reloaded at runtime.
+
+    A reload compiles new automata first and then swaps them in with a single assignment, so
+    concurrent checks always use a complete matcher.
+    """
+
+    def __init__(self):
+        self._reload_lock = threading.Lock()
+        self.profanity = None
+        self.negative_phrases = None
+        self.reload()
+
+    def reload(self) -> dict:
+        """
+        (Re)loads the wordlists configured in `PROFANITY_WORDLIST_PATH` and `NEGATIVE_PHRASES_PATH`.
+
+        Returns:
+            dict: The number of profane words and negative phrases loaded.
+        """
+        with self._reload_lock:
+            words = _read_wordlist(config.PROFANITY_WORDLIST_PATH or DEFAULT_PROFANITY_WORDLIST_PATH)
+            phrases = _read_wordlist(config.NEGATIVE_PHRASES_PATH) if config.NEGATIVE_PHRASES_PATH \
+                else DEFAULT_NEGATIVE_PHRASES
+
+            self.profanity = build_profanity_matcher(words)
+            self.negative_phrases = build_negative_phrase_matcher(phrases)
+            return {"profanity_words": len(words), "negative_phrases": len(phrases)}
+
+
+# Matchers compiled once at startup and shared by the whole application
+moderation_matchers = ModerationMatchers()
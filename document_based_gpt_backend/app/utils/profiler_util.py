@@ -0,0 +1,196 @@
+# Sampling profiler utility
+# Samples the Python stacks of every thread of the process at a fixed interval, from a background thread, and counts
+# identical stacks. The result is written in the "collapsed stacks" format (`frame;frame;frame count` per line) read
+# by flamegraph.pl, speedscope and most flame graph viewers.
+#
+# Sampling only reads `sys._current_frames()`: nothing is installed in the profiled threads (no trace hooks, no
+# signals), so the profiler can be started and stopped on a live worker. Its cost is one stack walk per thread and
+# sample, and a profile is bounded both in duration and in number of distinct stacks.
+
+# Import os to shorten the file names of the frames
+import os
+
+# Import sys to read the current stack of every thread
+import sys
+
+# Import threading to sample from a background thread and name the sampled threads
+import threading
+
+# Import time to pace the samples and measure the profile duration
+import time
+
+# Import Counter to count identical stacks
+from collections import Counter
+
+# Import datetime to timestamp the profiles
+from datetime import datetime, timezone
+
+# Import configuration values such as the maximum profile duration
+from app.core import config
+
+# Stack counted in place of the new distinct stacks once PROFILER_MAX_STACKS is reached
+_TRUNCATED_STACK = "[truncated]"
+
+# Innermost frames of threads waiting for work (lock or condition, queue, idle pool worker, event loop selector):
+# (file, function)
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+}
+
+
+def _is_idle(frame) -> bool:
+    """
+    Tell whether a thread's innermost frame is one of a thread waiting for work.
+    """
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES
+
+
+class SamplingProfiler:
+    """
+    A sampling profiler recording one profile at a time; the last profile is kept until the next one starts.
+    """
+
+    def __init__(self, max_stacks: int = 20000):
+        """
+        Args:
+            max_stacks (int): Maximum number of distinct stacks of a profile; further ones are counted together.
+        """
+        self.max_stacks = max_stacks
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = Counter()
+        self._frame_names = {}
+        self._samples = 0
+        self._settings = None
+        self._started_at = None
+        self._stopped_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval_ms: float = 10.0, idle: bool = False) -> dict:
+        """
+        Start a profile, which stops by itself after `seconds`.
+
+        Args:
+            seconds (float): Duration of the profile (at most `PROFILER_MAX_SECONDS`).
+            interval_ms (float): Time between two samples (at least 1 ms).
+            idle (bool): Also record the threads waiting for work, which are skipped by default.
+
+        Returns:
+            dict: The state of the profiler.
+
+        Raises:
+            ValueError: If the duration or interval is out of range.
+            RuntimeError: If a profile is already running.
+        """
+        if not 0 < seconds <= config.PROFILER_MAX_SECONDS:
+            raise ValueError(f"seconds must be between 0 and {config.PROFILER_MAX_SECONDS}")
+        if interval_ms < 1:
+            raise ValueError("interval_ms must be at least 1")
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A profile is already running")
+            self._stop = threading.Event()
+            self._stacks = Counter()
+            self._frame_names = {}
+            self._samples = 0
+            self._settings = {"seconds": seconds, "interval_ms": interval_ms, "idle": idle}
+            self._started_at = datetime.now(timezone.utc)
+            self._stopped_at = None
+            self._thread = threading.Thread(
+                target=self._run, args=(seconds, interval_ms / 1000, idle, self._stop),
+                name="sampling-profiler", daemon=True
+            )
+            self._thread.start()
+        return self.status()
+
+    def stop(self) -> dict:
+        """
+        Stop the running profile, if any, and wait for its last sample.
+
+        Returns:
+            dict: The state of the profiler.
+        """
+        thread = self._thread
+        self._stop.set()
+        if thread is not None:
+            thread.join()
+        return self.status()
+
+    def status(self) -> dict:
+        """
+        Return the state of the profiler and the summary of the current or last profile.
+        """
+        with self._lock:
+            return {
+                "running": self.running,
+                "started_at": self._started_at.isoformat() if self._started_at else None,
+                "stopped_at": self._stopped_at.isoformat() if self._stopped_at else None,
+                "settings": self._settings,
+                "samples": self._samples,
+                "stacks": len(self._stacks),
+            }
+
+    def collapsed(self) -> str:
+        """
+        Return the current or last profile in the collapsed stacks format, most frequent stacks first.
+        """
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self, seconds: float, interval: float, idle: bool, stop: threading.Event):
+        deadline = time.monotonic() + seconds
+        own_id = threading.get_ident()
+        try:
+            while time.monotonic() < deadline:
+                self._sample(own_id, idle)
+                if stop.wait(interval):
+                    break
+        finally:
+            with self._lock:
+                self._stopped_at = datetime.now(timezone.utc)
+
+    def _frame_name(self, frame) -> str:
+        """
+        Return the name of a frame in the stacks: function, file and line (formatted once per code location).
+        """
+        key = (frame.f_code, frame.f_lineno)
+        name = self._frame_names.get(key)
+        if name is None:
+            code = frame.f_code
+            name = self._frame_names[key] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        return name
+
+    def _sample(self, own_id: int, idle: bool):
+        """
+        Record the current stack of every thread but the profiler's, outermost frame first, under the thread name.
+        """
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (not idle and _is_idle(frame)):
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(self._frame_name(frame))
+                frame = frame.f_back
+            frames.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+            stacks.append(";".join(reversed(frames)))
+        with self._lock:
+            for stack in stacks:
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = _TRUNCATED_STACK
+                self._stacks[stack] += 1
+            self._samples += 1
+
+
+# Process-wide profiler, driven by the admin endpoints
+profiler = SamplingProfiler(config.PROFILER_MAX_STACKS)
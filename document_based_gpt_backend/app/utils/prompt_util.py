@@ -0,0 +1,210 @@
+# Prompt assembly utilities
+# Turns the ranked chunks returned by the vector store into the document context "stuffed" into the LLM prompt:
+# identical chunks are removed, adjacent chunks of the same source are merged (trimming the chunk overlap),
+# and the resulting passages are packed into a token budget measured with a local tokenizer.
+
+import logging
+import re
+from functools import lru_cache
+
+# Import tiktoken to count tokens locally, without calling the OpenAI API
+import tiktoken
+
+# Import the Document schema used by LangChain chains
+from langchain.schema import Document
+
+# Import configuration values such as the chunk overlap and tokenizer encoding
+from app.core import config
+
+# Shortest suffix/prefix match treated as a real chunk overlap rather than a coincidence
+MIN_OVERLAP_CHARS = 8
+
+
+class _ApproximateEncoding:
+    """
+    Fallback tokenizer used when the tiktoken encoding cannot be loaded (e.g. offline, without a cached
+    encoding file): every run of up to 4 non-space characters, with its leading whitespace, is one token.
+    """
+
+    _TOKEN = re.compile(r"\s*\S{1,4}|\s+")
+
+    def encode(self, text: str) -> list:
+        return self._TOKEN.findall(text)
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(encoding_name: str):
+    """
+    Loads (once) the tiktoken encoding used to count prompt tokens.
+    """
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logging.warning(f"Tiktoken encoding '{encoding_name}' unavailable ({e}); approximating token counts")
+        return _ApproximateEncoding()
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the number of tokens in the given text using the configured local tokenizer.
+
+    Args:
+        text (str): The text to be tokenized.
+
+    Returns:
+        int: The number of tokens.
+    """
+    return len(_get_encoding(config.PROMPT_TOKENIZER_ENCODING).encode(text))
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Truncates the text so that it contains at most `max_tokens` tokens.
+    """
+    encoding = _get_encoding(config.PROMPT_TOKENIZER_ENCODING)
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def _trim_overlap(previous: str, following: str) -> str:
+    """
+    Removes from `following` the prefix it shares with the end of `previous`.
+
+    Consecutive chunks produced by the text splitter repeat up to `CHUNK_OVERLAP` characters,
+    so only overlaps of that length (and at least `MIN_OVERLAP_CHARS`) are considered.
+
+    Args:
+        previous (str): Text of the earlier chunk.
+        following (str): Text of the chunk that directly follows it in the source document.
+
+    Returns:
+        str: The following chunk with the overlapping prefix removed (unchanged if no overlap is found).
+    """
+    max_overlap = min(len(previous), len(following), config.CHUNK_OVERLAP)
+    for size in range(max_overlap, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return following[size:]
+    return following
+
+
+def deduplicate_chunks(docs: list) -> list:
+    """
+    Removes chunks whose text is identical to a higher ranked chunk (e.g. created by re-uploads).
+
+    Args:
+        docs (list): Ranked list of `Document` objects (best first).
+
+    Returns:
+        list: The documents without duplicates, in their original order.
+    """
+    seen = set()
+    unique_docs = []
+    for doc in docs:
+        key = " ".join(doc.page_content.split())
+        if key in seen:
+            continue
+        seen.add(key)
+        unique_docs.append(doc)
+    return unique_docs
+
+
+def merge_adjacent_chunks(docs: list) -> list:
+    """
+    Merges chunks of the same source with consecutive `chunk_index` values into contiguous passages.
+
+    Each passage keeps the rank of its best chunk so that the overall ranking is preserved.
+
+    Args:
+        docs (list): Ranked list of unique `Document` objects (best first).
+
+    Returns:
+        list: Ranked list of passage `Document` objects with `source` and `chunk_indices` metadata.
+    """
+    # Group the chunks by source, remembering the rank of each chunk
+    by_source = {}
+    for rank, doc in enumerate(docs):
+        by_source.setdefault(doc.metadata.get("source"), []).append((doc.metadata.get("chunk_index"), rank, doc))
+
+    ranked_passages = []
+    for source, chunks in by_source.items():
+        # Chunks without an index cannot be ordered, so each one is its own passage
+        indexed = sorted((c for c in chunks if c[0] is not None), key=lambda c: c[0])
+        runs = [[c] for c in chunks if c[0] is None]
+
+        # Split the ordered chunks into runs of consecutive indices
+        for chunk in indexed:
+            if runs and runs[-1][-1][0] is not None and chunk[0] == runs[-1][-1][0] + 1:
+                runs[-1].append(chunk)
+            else:
+                runs.append([chunk])
+
+        for run in runs:
+            text = run[0][2].page_content
+            for (_, _, previous), (_, _, following) in zip(run, run[1:]):
+                trimmed = _trim_overlap(previous.page_content, following.page_content)
+                # Without a detectable overlap the chunks are simply joined with a space
+                text += trimmed if trimmed != following.page_content else " " + trimmed
+            passage = Document(
+                page_content=text,
+                metadata={"source": source, "chunk_indices": [c[0] for c in run]}
+            )
+            ranked_passages.append((min(c[1] for c in run), passage))
+
+    ranked_passages.sort(key=lambda item: item[0])
+    return [passage for _, passage in ranked_passages]
+
+
+def pack_to_token_budget(passages: list, token_budget: int) -> list:
+    """
+    Greedily selects passages, best first, while their total token count stays within the budget.
+
+    Passages that do not fit are skipped so that smaller, lower ranked passages can still be used.
+    If even the best passage exceeds the budget it is truncated, so the prompt always has context.
+
+    Args:
+        passages (list): Ranked list of passage `Document` objects.
+        token_budget (int): Maximum number of context tokens.
+
+    Returns:
+        list: The selected passages, in rank order.
+    """
+    packed = []
+    used_tokens = 0
+    for passage in passages:
+        tokens = count_tokens(passage.page_content)
+        if used_tokens + tokens <= token_budget:
+            packed.append(passage)
+            used_tokens += tokens
+        elif not packed:
+            packed.append(Document(
+                page_content=_truncate_to_tokens(passage.page_content, token_budget),
+                metadata=passage.metadata
+            ))
+            used_tokens = token_budget
+    return packed
+
+
+def assemble_prompt_documents(docs: list, token_budget: int = None):
+    """
+    Builds the document context for the "stuff" prompt from ranked retrieval results.
+
+    Args:
+        docs (list): Ranked list of `Document` objects returned by the vector store (best first).
+        token_budget (int, optional): Maximum number of context tokens. Defaults to `config.PROMPT_TOKEN_BUDGET`.
+
+    Returns:
+        tuple: A list of passage `Document` objects and a dict with the token counts
+            before (`tokens_before`) and after (`tokens_after`) assembly.
+    """
+    if token_budget is None:
+        token_budget = config.PROMPT_TOKEN_BUDGET
+
+    passages = pack_to_token_budget(merge_adjacent_chunks(deduplicate_chunks(docs)), token_budget)
+
+    stats = {
+        "tokens_before": sum(count_tokens(doc.page_content) for doc in docs),
+        "tokens_after": sum(count_tokens(passage.page_content) for passage in passages),
+    }
+    return passages, stats
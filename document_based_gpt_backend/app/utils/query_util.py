@@ -1,5 +1,13 @@
-# Import profanity checking module
-from better_profanity import profanity
+import re
+
+# Import the compiled multi-pattern matchers used for moderation and negative-answer detection
+from app.utils.moderation_util import moderation_matchers, normalize_for_profanity
+
+# Sentence boundaries of document chunks: end-of-sentence punctuation followed by whitespace, or line breaks
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+# Words of queries and sentences
+_WORD = re.compile(r"\w+")
 
 
 # Check for profanity in the query
@@ -7,7 +15,8 @@ def is_safe_content(text: str) -> bool:
     """
     Checks if the provided text contains any profane or inappropriate content.
 
-    Uses the `better_profanity` library to filter out queries with inappropriate content,
+    Uses an Aho-Corasick automaton compiled from the profanity wordlist (with leetspeak normalization)
+    to filter out queries with inappropriate content in a single pass over the text,
     ensuring that the system only processes "safe" and clean queries.
 
     Args:
@@ -18,7 +27,7 @@ def is_safe_content(text: str) -> bool:
     """
     # Check if the text contains any profane words or phrases.
     # Returns `True` if clean; otherwise, `False`.
-    return not profanity.contains_profanity(text)
+    return not moderation_matchers.profanity.contains_any(normalize_for_profanity(text))
 
 
 # Check if the response is a negative answer
@@ -35,12 +44,54 @@ def is_negative_response(result: str) -> bool:
     Returns:
         bool: `True` if the response contains any negative indicators, otherwise `False`.
     """
-    # Keywords or phrases indicating a negative or "no information" answer.
-    negative_keywords = [
-        "i don't", "i do not", "i'm sorry", "no mention", "not mention", "not found",
-        "no information", "cannot find", "does not exist", "not specified", "not mentioned",
-        "not available", "no details", "not provided"
-    ]
+    # Check if any of the negative keywords are present in the response (case insensitive),
+    # lowercasing the response once for all the phrases.
+    return moderation_matchers.negative_phrases.contains_any(result.lower())
+
+
+# Normalize a query so that trivially different spellings of the same question are treated as identical
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for request coalescing: case-folds it and collapses whitespace.
+
+    Args:
+        query (str): The raw user query.
+
+    Returns:
+        str: The normalized query.
+    """
+    return " ".join(query.casefold().split())
+
+
+# Build an answer from the retrieved chunks, without the LLM
+def build_extractive_answer(query: str, docs: list, max_sentences: int = 3) -> str:
+    """
+    Builds an extractive answer from already retrieved document chunks, used when the LLM cannot answer in time.
+
+    The sentences sharing the most words with the query are selected (ties favor the best ranked chunks)
+    and returned in their document order.
+
+    Args:
+        query (str): The user's question.
+        docs (list): The retrieved `Document` chunks, best first.
+        max_sentences (int): Maximum number of sentences in the answer.
+
+    Returns:
+        str: The extracted sentences, or an empty string if there are no chunks.
+    """
+    query_words = {word for word in _WORD.findall(query.casefold()) if len(word) > 2}
+
+    candidates = []
+    seen = set()
+    for rank, doc in enumerate(docs):
+        for position, sentence in enumerate(_SENTENCE_BOUNDARY.split(doc.page_content)):
+            sentence = " ".join(sentence.split())
+            if not sentence or sentence in seen:
+                continue
+            seen.add(sentence)
+            overlap = len(query_words & set(_WORD.findall(sentence.casefold())))
+            candidates.append((overlap, rank, position, sentence))
 
-    # Check if any of the negative keywords are present in the response (case insensitive).
-    return any(keyword in result.lower() for keyword in negative_keywords)
+    # Most overlapping words first, then the best ranked chunk and the earliest sentence
+    best = sorted(candidates, key=lambda c: (-c[0], c[1], c[2]))[:max_sentences]
+    return " ".join(sentence for _, _, _, sentence in sorted(best, key=lambda c: (c[1], c[2])))
@@ -0,0 +1,50 @@
+# Response utility
+# JSON responses serialized with orjson, and the entity tags (ETags) of cacheable responses.
+#
+# FastAPI runs the values returned by an endpoint through `jsonable_encoder`, which walks every nested dict and list in
+# Python before the response class serializes them. Endpoints returning large payloads of plain JSON values (answers
+# and their sources) return a `FastJSONResponse` themselves instead, which skips that walk and serializes in C.
+
+import hashlib
+
+# Import orjson for fast JSON serialization to bytes
+import orjson
+
+# Import the JSON response class of FastAPI, whose rendering is replaced
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSON response serialized with orjson: content must be made of JSON values (dicts with string keys, lists,
+    strings, numbers, booleans, None), numpy scalars and arrays, datetimes or dataclasses.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def content_etag(content) -> str:
+    """
+    Returns a strong entity tag of JSON content: equal content (whatever the order of its keys) has equal tags.
+    """
+    digest = hashlib.sha256(orjson.dumps(content, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Tells whether an If-None-Match request header matches an entity tag, i.e. the client's copy is current.
+
+    Args:
+        if_none_match (str): The header value: `*` or a comma-separated list of (possibly weak, `W/`) entity tags.
+        etag (str): The current entity tag of the resource.
+
+    Returns:
+        bool: Whether a `304 Not Modified` may be returned instead of the resource.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison: `W/"x"` matches `"x"`
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
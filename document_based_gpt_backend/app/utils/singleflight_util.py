@@ -0,0 +1,83 @@
+# Request coalescing ("single-flight") utility
+# Concurrent callers asking for the same key share one in-flight computation and all receive its result.
+# Nothing is cached: the key is forgotten as soon as the computation completes.
+# The stages timed by the shared computation are merged into the trace of every caller, followers being marked as
+# coalesced.
+
+import asyncio
+
+# Import the application-wide metrics registry
+from app.utils.metrics_util import metrics
+
+# Import the request tracing, to give every caller the stage timings of the shared computation
+from app.utils.trace_util import RequestTrace, run_traced, merge_shared_trace
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into a single asyncio task.
+
+    - Every caller receives the shared result, or the shared exception if the computation fails.
+    - A cancelled caller only stops waiting; the shared task is cancelled only once no caller is left waiting.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): Name used to label the coalescing metrics (e.g. "query").
+        """
+        self.name = name
+        self._calls = {}  # key -> [task, number of waiting callers, trace of the computation]
+
+    async def do(self, key, fn, *args):
+        """
+        Runs `fn(*args)` for the given key, or joins the computation already in flight for it.
+
+        The stages timed by the computation are added to the trace of the caller, which is marked as coalesced if
+        it joined a computation started by another caller.
+
+        Args:
+            key (Hashable): Identifies identical requests.
+            fn (Callable): Coroutine function performing the computation.
+            *args: Arguments passed to `fn`.
+
+        Returns:
+            Any: The result of the (shared) computation.
+
+        Raises:
+            Exception: Whatever the shared computation raised.
+        """
+        call = self._calls.get(key)
+        leader = call is None
+        if leader:
+            trace = RequestTrace(f"singleflight:{self.name}", None)
+            task = asyncio.ensure_future(run_traced(trace, fn, *args))
+            call = [task, 0, trace]
+            self._calls[key] = call
+            # Forget the key as soon as the computation completes, so results are never reused later
+            task.add_done_callback(lambda _, k=key, c=call: self._forget(k, c))
+            metrics.increment("singleflight_leader", flight=self.name)
+        else:
+            metrics.increment("singleflight_shared", flight=self.name)
+
+        call[1] += 1
+        try:
+            # Shield the shared task so that one caller's cancellation does not cancel it for the others
+            return await asyncio.shield(call[0])
+        except asyncio.CancelledError:
+            if not call[0].done() and call[1] == 1:
+                # The last waiting caller is gone: nobody needs the result anymore
+                call[0].cancel()
+                self._forget(key, call)
+            raise
+        finally:
+            call[1] -= 1
+            # The stages timed so far (all of them, unless this caller stopped waiting early)
+            merge_shared_trace(call[2], coalesced=not leader)
+
+    def _forget(self, key, call):
+        """
+        Removes the key once its computation is done (unless a newer call already replaced it).
+        """
+        if self._calls.get(key) is call:
+            del self._calls[key]
@@ -0,0 +1,269 @@
+# Per-request tracing utility
+# A trace started at the beginning of a request is carried through a context variable, so the retrieval and LLM code
+# can record stage timings and retrieved hits without passing it around. Worker threads started with
+# `asyncio.to_thread` inherit the context and therefore record into the same trace. A computation shared by
+# coalesced identical requests records into a trace of its own, which is then merged into the trace of every request
+# that waited for it.
+# The traces of the requests slower than SLOW_REQUEST_THRESHOLD_MS are kept in a bounded ring buffer, with the
+# timeline of their stages, so that latency spikes can be looked into after the fact.
+
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# Import configuration values such as the slow request threshold
+from app.core import config
+
+# Import the metrics registry to count the slow requests
+from app.utils.metrics_util import metrics
+
+# The trace of the request being processed, if any
+_current_trace = ContextVar("current_trace", default=None)
+
+# Maximum number of stage spans recorded per request (a stage running in a loop is still summed in its timing)
+_MAX_SPANS = 256
+
+
+def covered_ms(spans: list, total_ms: float) -> float:
+    """
+    Returns the time covered by at least one of the spans between the start of a request and `total_ms`, in
+    milliseconds: spans running at the same time (e.g. the queries of a batch) are only counted once.
+    """
+    covered, covered_until = 0.0, 0.0
+    for span in sorted(spans, key=lambda span: span["start_ms"]):
+        start = max(span["start_ms"], covered_until)
+        end = min(span["start_ms"] + span["duration_ms"], total_ms)
+        if end > start:
+            covered += end - start
+            covered_until = end
+    return covered
+
+
+class RequestTrace:
+    """
+    Collects the query id, the per-stage timings and the retrieved hits of one request.
+    """
+
+    def __init__(self, endpoint: str, request: dict):
+        """
+        Args:
+            endpoint (str): The path of the endpoint handling the request.
+            request (dict): The JSON request body, logged so that the request can be replayed.
+        """
+        self.query_id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.request = request
+        self.started = time.perf_counter()
+        self.timings = {}  # stage name -> milliseconds (summed if the stage runs several times)
+        self.spans = []  # every stage run: name, start offset and duration in milliseconds, and thread
+        self.dropped_spans = 0  # stage runs not kept in `spans` beyond _MAX_SPANS
+        self.hits = None
+        self.coalesced = False  # whether the request joined a computation started by an identical one
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times the enclosed block as the given stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.timings[name] = self.timings.get(name, 0.0) + elapsed_ms
+                if len(self.spans) < _MAX_SPANS:
+                    self.spans.append({
+                        "stage": name,
+                        "start_ms": round((start - self.started) * 1000, 3),
+                        "duration_ms": round(elapsed_ms, 3),
+                        "thread": threading.current_thread().name,
+                    })
+                else:
+                    self.dropped_spans += 1
+
+    def merge(self, shared: "RequestTrace", coalesced: bool):
+        """
+        Adds the stages recorded by a computation shared with other requests (see `run_traced`) to this trace.
+
+        Args:
+            shared (RequestTrace): The trace the shared computation recorded into.
+            coalesced (bool): Whether this request joined the computation after another request started it.
+        """
+        timings, spans = shared.snapshot()
+        # The spans of the shared trace start from when the computation started
+        offset_ms = (shared.started - self.started) * 1000
+        with self._lock:
+            for name, ms in timings.items():
+                self.timings[name] = self.timings.get(name, 0.0) + ms
+            kept = spans[:max(0, _MAX_SPANS - len(self.spans))]
+            for span in kept:
+                self.spans.append({**span, "start_ms": round(span["start_ms"] + offset_ms, 3)})
+            self.dropped_spans += shared.dropped_spans + len(spans) - len(kept)
+            self.coalesced = self.coalesced or coalesced
+            if self.hits is None:
+                self.hits = shared.hits
+
+    def snapshot(self):
+        """
+        Returns copies of the stage timings and spans recorded so far.
+        """
+        with self._lock:
+            return dict(self.timings), list(self.spans)
+
+    def elapsed_ms(self) -> float:
+        """
+        Returns the time elapsed since the trace was started, in milliseconds.
+        """
+        return (time.perf_counter() - self.started) * 1000
+
+
+class SlowRequestLog:
+    """
+    Keeps the traces of the most recent requests slower than a threshold, in a ring buffer of bounded size.
+    """
+
+    def __init__(self, threshold_ms: float, capacity: int):
+        """
+        Args:
+            threshold_ms (float): Requests taking at least this long (in milliseconds) are kept.
+            capacity (int): Number of requests kept; the oldest ones are dropped beyond it.
+        """
+        self.threshold_ms = threshold_ms
+        self.capacity = capacity
+        self._records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def record(self, trace: RequestTrace, status: str, error: Exception = None) -> bool:
+        """
+        Keeps the trace of a completed request if it was slow.
+
+        Args:
+            trace (RequestTrace): The trace of the request.
+            status (str): The outcome of the request, as logged.
+            error (Exception, optional): The error that failed the request.
+
+        Returns:
+            bool: Whether the request was slow enough to be kept.
+        """
+        total_ms = trace.elapsed_ms()
+        if total_ms < self.threshold_ms:
+            return False
+        timings, spans = trace.snapshot()
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "query_id": trace.query_id,
+            "endpoint": trace.endpoint,
+            "status": status,
+            "total_ms": round(total_ms, 3),
+            "timings_ms": {name: round(ms, 3) for name, ms in timings.items()},
+            "coalesced": trace.coalesced,
+            # Time not covered by any stage (e.g. waiting for the event loop), an upper bound if spans were dropped
+            "unaccounted_ms": round(max(0.0, total_ms - covered_ms(spans, total_ms)), 3),
+            "spans": sorted(spans, key=lambda span: span["start_ms"]),
+            "dropped_spans": trace.dropped_spans,
+            "hits": trace.hits,
+            "request": trace.request,
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+        }
+        with self._lock:
+            self._records.append(record)
+        metrics.increment("slow_requests", endpoint=trace.endpoint)
+        return True
+
+    def list(self, limit: int = None, endpoint: str = None) -> list:
+        """
+        Returns the kept requests, most recent first.
+
+        Args:
+            limit (int, optional): Maximum number of requests returned.
+            endpoint (str, optional): Only return the requests of this endpoint.
+        """
+        with self._lock:
+            records = list(self._records)
+        records = [record for record in reversed(records) if endpoint is None or record["endpoint"] == endpoint]
+        return records if limit is None else records[:limit]
+
+
+# Traces of the recent slow requests, browsable by admins
+slow_requests = SlowRequestLog(config.SLOW_REQUEST_THRESHOLD_MS, config.SLOW_REQUEST_BUFFER_SIZE)
+
+
+def start_trace(endpoint: str, request: dict) -> RequestTrace:
+    """
+    Starts the trace of the current request.
+
+    Args:
+        endpoint (str): The path of the endpoint handling the request.
+        request (dict): The JSON request body.
+
+    Returns:
+        RequestTrace: The new trace, also made current for the rest of the request.
+    """
+    trace = RequestTrace(endpoint, request)
+    _current_trace.set(trace)
+    return trace
+
+
+async def run_traced(trace: RequestTrace, fn, *args):
+    """
+    Awaits `fn(*args)` with the given trace as the current one.
+
+    Run as a task of its own, the stages timed by the computation are recorded into `trace` rather than into the
+    trace of the request that created the task, so they can be merged into every request sharing the computation.
+    """
+    _current_trace.set(trace)
+    return await fn(*args)
+
+
+def merge_shared_trace(shared: RequestTrace, coalesced: bool):
+    """
+    Merges the stages of a shared computation into the trace of the current request (if traced).
+
+    Args:
+        shared (RequestTrace): The trace the shared computation recorded into.
+        coalesced (bool): Whether the current request joined the computation after another request started it.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.merge(shared, coalesced)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times the enclosed block as a stage of the current request (does nothing outside a traced request).
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def format_hits(docs_with_scores: list) -> list:
+    """
+    Returns the chunk ids and scores of retrieved documents, as recorded in the traces.
+    """
+    return [
+        {"chunk_id": doc.metadata.get("chunk_id"), "score": round(score, 6)}
+        for doc, score in docs_with_scores
+    ]
+
+
+def record_hits(docs_with_scores: list):
+    """
+    Records the documents retrieved for the current request (does nothing outside a traced request).
+
+    Args:
+        docs_with_scores (list): Tuples of retrieved documents and their scores.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.hits = format_hits(docs_with_scores)
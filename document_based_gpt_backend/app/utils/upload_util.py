@@ -0,0 +1,148 @@
+# Upload handling utilities
+# Uploads are streamed to disk in fixed-size chunks through a temporary file that is atomically renamed into place,
+# and the content hash is computed during the copy, so a file is never held in memory nor read twice.
+
+import asyncio
+import hashlib
+import os
+import tempfile
+
+# Import FastAPI exception handling to reject oversized uploads
+from fastapi import HTTPException
+
+# Import configuration values such as the size limits
+from app.core import config
+
+
+def safe_filename(filename: str) -> str:
+    """
+    Strips any directory components from a client-supplied filename.
+
+    Args:
+        filename (str): The filename sent by the client.
+
+    Returns:
+        str: The bare filename.
+
+    Raises:
+        HTTPException: If no usable filename remains.
+    """
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    return name
+
+
+def too_large_error() -> HTTPException:
+    """
+    Returns the 413 error raised when an upload exceeds `MAX_UPLOAD_BYTES`.
+    """
+    return HTTPException(
+        status_code=413, detail=f"The upload exceeds the maximum size of {config.MAX_UPLOAD_BYTES} bytes"
+    )
+
+
+async def stream_upload_to_temp_file(file, directory: str, extension: str = ""):
+    """
+    Streams an uploaded file to a temporary file in fixed-size chunks, hashing it on the fly.
+
+    The temporary file lives in the destination directory so that `commit_upload` can rename it
+    into place atomically once the caller decided to keep it.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        directory (str): Directory of the final file.
+        extension (str): Extension of the final file, also given to the temporary file so that the type of the
+            document is detected when it is parsed before being moved into place.
+
+    Returns:
+        tuple: The temporary file path, the number of bytes written and the SHA-256 hex digest of the content.
+
+    Raises:
+        HTTPException: 413 if the upload exceeds `MAX_UPLOAD_BYTES` (nothing is kept on disk).
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    hasher = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=f".part{extension}")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                chunk = await file.read(config.UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > config.MAX_UPLOAD_BYTES:
+                    raise too_large_error()
+                hasher.update(chunk)
+                await asyncio.to_thread(buffer.write, chunk)
+    except BaseException:
+        discard_upload(temp_path)
+        raise
+    return temp_path, size, hasher.hexdigest()
+
+
+def commit_upload(temp_path: str, destination_path: str):
+    """
+    Atomically moves a fully received upload to its final path (replacing any previous file).
+    """
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    os.replace(temp_path, destination_path)
+
+
+def discard_upload(temp_path: str):
+    """
+    Deletes the temporary file of an upload that is not kept.
+    """
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+class MaxBodySizeMiddleware:
+    """
+    ASGI middleware rejecting request bodies larger than a limit with 413, before they are parsed.
+
+    Requests announcing a larger `Content-Length` are rejected without reading the body; bodies without one
+    (e.g. chunked transfer encoding) are counted while they are received and cut off once over the limit.
+    """
+
+    def __init__(self, app, max_bytes: int, path_prefixes: tuple):
+        """
+        Args:
+            app: The wrapped ASGI application.
+            max_bytes (int): The maximum accepted body size.
+            path_prefixes (tuple): Only requests whose path starts with one of these prefixes are limited.
+        """
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            body = b'{"detail":"Request body too large"}'
+            await send({
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while the application reads the body; FastAPI turns it into the 413 response
+                    raise too_large_error()
+            return message
+
+        await self.app(scope, limited_receive, send)
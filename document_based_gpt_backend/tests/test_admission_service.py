@@ -0,0 +1,166 @@
+# Tests of the admission control: rate limits and admission lanes
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.services import admission_service
+from app.services.admission_service import (
+    TokenBucket, RateLimiter, AdmissionLane, ADMIN_PRIORITY, USER_PRIORITY
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    A fake monotonic clock, advanced by the tests.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(admission_service.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_allows_the_burst_then_tells_when_to_retry(clock):
+    bucket = TokenBucket(rate=2.0, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert bucket.take() == 0.0
+    # Refilling stops at the burst
+    clock[0] += 60
+    assert [bucket.take() for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_token_bucket_requests_costing_more_than_the_burst_need_a_full_bucket(clock):
+    bucket = TokenBucket(rate=1.0, burst=2)
+    assert bucket.take(5) == 0.0
+    assert bucket.take(5) == pytest.approx(2.0)
+
+
+def test_rate_limiter_rejects_with_retry_after_per_user(clock):
+    limiter = RateLimiter(rate=0.5, burst=1, max_users=10)
+    limiter.check("alice")
+    with pytest.raises(HTTPException) as error:
+        limiter.check("alice")
+    assert error.value.status_code == 429 and error.value.headers["Retry-After"] == "2"
+    # Other users have their own bucket
+    limiter.check("bob")
+
+
+def test_rate_limiter_forgets_the_least_recently_seen_users(clock):
+    limiter = RateLimiter(rate=0.1, burst=1, max_users=2)
+    limiter.check("alice")
+    limiter.check("bob")
+    limiter.check("carol")
+    # alice was forgotten and starts again with a full bucket, bob was not
+    limiter.check("alice")
+    with pytest.raises(HTTPException):
+        limiter.check("carol")
+
+
+async def _queue(lane, requests):
+    """
+    Queues requests of (user, priority) behind a held slot, then releases the slots one by one and returns the
+    order the requests were served in.
+    """
+    served = []
+
+    async def request(name, user, priority):
+        await lane.acquire(user, priority)
+        served.append(name)
+
+    await lane.acquire("holder")
+    tasks = []
+    for name, (user, priority) in enumerate(requests):
+        tasks.append(asyncio.ensure_future(request(name, user, priority)))
+        await asyncio.sleep(0)
+    for _ in requests:
+        lane.release()
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    lane.release()
+    return served
+
+
+def test_lane_serves_users_in_turn_and_admins_first():
+    lane = AdmissionLane("test", max_in_flight=1, max_queued=10)
+    requests = [("alice", USER_PRIORITY)] * 3 + [("bob", USER_PRIORITY), ("admin", ADMIN_PRIORITY)]
+    served = asyncio.run(_queue(lane, requests))
+
+    assert served == [4, 0, 3, 1, 2]
+    assert lane._in_flight == 0 and lane._waiting == 0
+
+
+def test_lane_rejects_when_the_queue_is_full_with_retry_after():
+    async def main():
+        lane = AdmissionLane("test", max_in_flight=1, max_queued=1)
+        await lane.acquire("alice")
+        waiter = asyncio.ensure_future(lane.acquire("bob"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await lane.acquire("carol")
+        lane.release()
+        await waiter
+        lane.release()
+        return lane, error.value
+
+    lane, error = asyncio.run(main())
+    # Two requests (the queued one and the rejected one) of 1 s each on average, over 1 slot
+    assert error.status_code == 429 and error.headers["Retry-After"] == "2"
+    assert lane._in_flight == 0 and lane._waiting == 0
+
+
+def test_lane_timeout_frees_the_queue_entry():
+    async def main():
+        lane = AdmissionLane("test", max_in_flight=1, max_queued=5)
+        await lane.acquire("alice")
+        with pytest.raises(HTTPException) as error:
+            await lane.acquire("bob", timeout=0.01)
+        assert error.value.status_code == 429 and "Retry-After" in error.value.headers
+        assert lane._waiting == 0 and lane._in_flight == 1
+        # The abandoned entry is skipped: the slot is freed
+        lane.release()
+        return lane
+
+    lane = asyncio.run(main())
+    assert lane._in_flight == 0 and lane._waiting == 0 and not lane._user_tags
+
+
+def test_lane_cancelled_waiter_frees_the_queue_entry():
+    async def main():
+        lane = AdmissionLane("test", max_in_flight=1, max_queued=5)
+        await lane.acquire("alice")
+        waiter = asyncio.ensure_future(lane.acquire("bob"))
+        await asyncio.sleep(0)
+        assert lane._waiting == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert lane._waiting == 0 and lane._in_flight == 1
+        lane.release()
+        return lane
+
+    lane = asyncio.run(main())
+    assert lane._in_flight == 0 and lane._waiting == 0
+
+
+def test_lane_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    async def main():
+        lane = AdmissionLane("test", max_in_flight=1, max_queued=5)
+        await lane.acquire("alice")
+        first = asyncio.ensure_future(lane.acquire("bob"))
+        second = asyncio.ensure_future(lane.acquire("carol"))
+        await asyncio.sleep(0)
+        # The slot is handed to the first waiter, which is cancelled before it resumes
+        lane.release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await second
+        assert lane._waiting == 0 and lane._in_flight == 1
+        lane.release()
+        return lane
+
+    lane = asyncio.run(main())
+    assert lane._in_flight == 0 and lane._waiting == 0
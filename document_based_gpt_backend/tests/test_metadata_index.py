@@ -0,0 +1,53 @@
+# Tests of the metadata bitmap index
+from app.db.metadata_index import MetadataBitmapIndex, count_ids
+from app.db.near_duplicate_index import with_duplicates, filterable_metadata
+from app.schemas.query import MetadataFilter
+
+
+def _chunk(source, uploaded_by, tags, uploaded_on="2026-10-01"):
+    return {"source": source, "uploaded_by": uploaded_by, "uploaded_on": uploaded_on, "tags": tags}
+
+
+def _matches(metadatas, **conditions):
+    bitmap = MetadataBitmapIndex(metadatas).evaluate(MetadataFilter(**conditions))
+    return len(metadatas) if bitmap is None else count_ids(bitmap)
+
+
+def test_filters_match_the_metadata_of_near_duplicates():
+    # B (tagged "hr", uploaded by bob) nearly repeats the chunk of A (tagged "finance", uploaded by alice)
+    canonical = with_duplicates(
+        _chunk("a.txt", "alice", ["finance"]), [filterable_metadata(_chunk("b.txt", "bob", ["hr"], "2026-10-02"))]
+    )
+    metadatas = [canonical, _chunk("c.txt", "carol", ["legal"])]
+
+    assert canonical["duplicate_sources"] == ["b.txt"]
+    assert _matches(metadatas, tags_any=["hr"]) == 1
+    assert _matches(metadatas, uploaded_by=["bob"]) == 1
+    assert _matches(metadatas, sources=["b.txt"]) == 1
+    assert _matches(metadatas, uploaded_from="2026-10-02") == 1
+
+
+def test_filter_conditions_are_met_by_the_same_copy():
+    canonical = with_duplicates(_chunk("a.txt", "alice", ["finance"]), [_chunk("b.txt", "bob", ["hr"])])
+    metadatas = [canonical, _chunk("c.txt", "carol", ["legal"])]
+
+    assert _matches(metadatas, tags_any=["finance"], uploaded_by=["bob"]) == 0
+    assert _matches(metadatas, tags_all=["finance", "hr"]) == 0
+    assert _matches(metadatas, tags_any=["hr"], uploaded_by=["bob"]) == 1
+
+
+def test_near_duplicates_recorded_by_source_only_keep_the_canonical_metadata():
+    metadatas = [{**_chunk("a.txt", "alice", ["finance"]), "duplicate_sources": ["b.txt"]}]
+
+    assert _matches(metadatas, sources=["b.txt"], tags_any=["finance"]) == 1
+    assert _matches(metadatas, source_prefix="b", uploaded_by=["bob"]) == 0
+
+
+def test_identical_near_duplicates_are_recorded_once():
+    metadata = _chunk("a.txt", "alice", ["finance"])
+    duplicate = _chunk("b.txt", "bob", ["hr"])
+
+    once = with_duplicates(metadata, [duplicate, duplicate])
+    assert once["duplicates"] == [duplicate]
+    assert with_duplicates(once, [duplicate]) is once
+    assert with_duplicates(metadata, [dict(metadata)]) is metadata
@@ -0,0 +1,47 @@
+# Tests of the profanity matcher against better_profanity, which it replaced
+import pytest
+from better_profanity import profanity
+
+from app.utils.moderation_util import (
+    DEFAULT_PROFANITY_WORDLIST_PATH, build_profanity_matcher, normalize_for_profanity
+)
+
+# Texts on which the matcher gives the same verdict as better_profanity with its default wordlist
+CORPUS = [
+    "Hell's Kitchen",
+    "Dick's Sporting Goods",
+    "bastard's",
+    "bitch's",
+    "Don't forget the quarterly report, it's due Friday.",
+    "The class assignment was about the Scunthorpe problem.",
+    "Hello world",
+    "What is the leave policy for 2024?",
+    "Go to hell",
+    "what the h3ll",
+    "Shit!",
+    "sh1t",
+    "$hit",
+    "he11",
+    "bu11sh1t",
+    "b1tch",
+    "D1ck",
+    "f*ck",
+    "v1agra",
+]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    with open(DEFAULT_PROFANITY_WORDLIST_PATH, encoding="utf-8") as wordlist_file:
+        return build_profanity_matcher(line.strip() for line in wordlist_file if line.strip())
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_verdicts_match_better_profanity(matcher, text):
+    assert matcher.contains_any(normalize_for_profanity(text)) == profanity.contains_profanity(text)
+
+
+def test_quoted_words_are_checked(matcher):
+    # better_profanity keeps quotes in words, so it misses these
+    assert matcher.contains_any(normalize_for_profanity("'shit'"))
+    assert matcher.contains_any(normalize_for_profanity('"shit"'))
@@ -0,0 +1,41 @@
+# Tests of the removal of replaced documents from the near-duplicate records
+from app.db.near_duplicate_index import without_source, with_duplicates, filterable_metadata
+
+
+def _chunk(source, uploaded_by, chunk_index=0):
+    return {
+        "source": source, "uploaded_by": uploaded_by, "uploaded_on": "2026-10-01", "tags": [],
+        "uploaded_at": "2026-10-01T00:00:00+00:00", "chunk_index": chunk_index,
+    }
+
+
+def test_chunks_of_other_documents_are_unchanged():
+    metadata = _chunk("a.txt", "alice")
+
+    assert without_source(metadata, "b.txt") is metadata
+
+
+def test_near_duplicates_from_the_removed_document_are_dropped():
+    metadata = with_duplicates(_chunk("a.txt", "alice"), [filterable_metadata(_chunk("b.txt", "bob"))])
+
+    assert without_source(metadata, "b.txt") == {**_chunk("a.txt", "alice"), "duplicates": [], "duplicate_sources": []}
+
+
+def test_chunks_standing_only_for_the_removed_document_are_deleted():
+    assert without_source(_chunk("a.txt", "alice"), "a.txt") is None
+
+
+def test_the_first_near_duplicate_takes_the_place_of_a_removed_chunk():
+    metadata = with_duplicates(
+        _chunk("a.txt", "alice", chunk_index=3),
+        [filterable_metadata(_chunk("b.txt", "bob")), filterable_metadata(_chunk("c.txt", "carol"))]
+    )
+
+    promoted = without_source(metadata, "a.txt")
+
+    assert promoted["source"] == "b.txt"
+    assert promoted["uploaded_by"] == "bob"
+    assert "uploaded_at" not in promoted
+    assert promoted["chunk_index"] == 3
+    assert promoted["duplicate_sources"] == ["c.txt"]
+    assert promoted["duplicates"] == [filterable_metadata(_chunk("c.txt", "carol"))]
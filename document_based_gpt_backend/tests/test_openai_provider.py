@@ -0,0 +1,180 @@
+# Tests of the resilient transport of the OpenAI clients
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.core import config
+from app.core import openai_provider
+from app.core.openai_provider import CircuitBreaker, CircuitOpenError, ResilientTransport
+
+URL = "https://api.openai.test/v1/embeddings"
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    # No jitter, and the retry delays are recorded instead of slept
+    monkeypatch.setattr(config, "OPENAI_RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr(config, "OPENAI_RETRY_MAX_DELAY", 20.0)
+    slept = []
+    monkeypatch.setattr(openai_provider.time, "sleep", slept.append)
+    return slept
+
+
+def _client(responses, max_retries=3, max_concurrency=4, circuit_breaker=None):
+    """
+    Return a client whose transport answers with the given responses in turn, and the list of requests sent.
+    """
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        response = responses[min(len(sent), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    transport = ResilientTransport(
+        httpx.MockTransport(handler), max_concurrency=max_concurrency, max_retries=max_retries,
+        circuit_breaker=circuit_breaker or CircuitBreaker(failure_threshold=100, reset_seconds=30),
+    )
+    return httpx.Client(transport=transport), sent
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retryable_statuses_are_retried(delays, status):
+    client, sent = _client([httpx.Response(status), httpx.Response(200, json={"ok": True})])
+
+    response = client.post(URL)
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert len(sent) == 2
+    assert len(delays) == 1
+
+
+def test_client_errors_are_not_retried(delays):
+    client, sent = _client([httpx.Response(400), httpx.Response(200)])
+
+    assert client.post(URL).status_code == 400
+    assert len(sent) == 1
+
+
+def test_connection_errors_are_retried(delays):
+    client, sent = _client([httpx.ConnectError("refused"), httpx.Response(200)])
+
+    assert client.post(URL).status_code == 200
+    assert len(sent) == 2
+
+
+def test_the_last_response_is_returned_once_the_retries_are_exhausted(delays):
+    client, sent = _client([httpx.Response(503)], max_retries=2)
+
+    assert client.post(URL).status_code == 503
+    assert len(sent) == 3
+    assert len(delays) == 2
+
+
+@pytest.mark.parametrize("headers, delay", [
+    ({"retry-after": "2"}, 2.0),
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after-ms": "250", "retry-after": "5"}, 0.25),
+])
+def test_retry_after_is_honored(delays, headers, delay):
+    client, _ = _client([httpx.Response(429, headers=headers), httpx.Response(200)])
+
+    assert client.post(URL).status_code == 200
+    assert delays == [delay]
+
+
+def test_retry_after_dates_are_honored(delays):
+    retry_at = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 10))
+    client, _ = _client([httpx.Response(503, headers={"retry-after": retry_at}), httpx.Response(200)])
+
+    assert client.post(URL).status_code == 200
+    assert 8 <= delays[0] <= 10
+
+
+def test_the_response_is_returned_when_the_requested_delay_exceeds_the_limit(delays):
+    client, sent = _client([httpx.Response(429, headers={"retry-after": "60"}), httpx.Response(200)])
+
+    assert client.post(URL).status_code == 429
+    assert len(sent) == 1
+    assert delays == []
+
+
+def test_the_circuit_opens_after_consecutive_failures_and_closes_after_a_successful_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    client, sent = _client(
+        [httpx.Response(500), httpx.Response(500), httpx.Response(200)], max_retries=0, circuit_breaker=breaker
+    )
+
+    assert client.post(URL).status_code == 500
+    assert breaker.allow_request()
+    assert client.post(URL).status_code == 500
+    # Open: requests fail without being sent
+    with pytest.raises(CircuitOpenError):
+        client.post(URL)
+    assert len(sent) == 2
+
+    time.sleep(0.06)
+    # Half-open: a single trial request is let through, and closes the circuit as it succeeds
+    assert client.post(URL).status_code == 200
+    assert len(sent) == 3
+    assert breaker.allow_request()
+
+
+def test_the_half_open_circuit_lets_a_single_trial_through_and_reopens_if_it_fails():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    # The trial is in flight: other requests are still refused
+    assert not breaker.allow_request()
+
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+
+
+def test_concurrent_requests_share_the_concurrency_limit():
+    lock = threading.Lock()
+    in_flight, peak = [0], [0]
+
+    def handler(request):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return httpx.Response(200)
+
+    transport = ResilientTransport(
+        httpx.MockTransport(handler), max_concurrency=2, max_retries=0,
+        circuit_breaker=CircuitBreaker(failure_threshold=100, reset_seconds=30),
+    )
+    clients = [httpx.Client(transport=transport) for _ in range(2)]
+    threads = [threading.Thread(target=clients[i % 2].post, args=(URL,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+
+
+def test_waiting_for_a_concurrency_slot_times_out():
+    transport = ResilientTransport(
+        httpx.MockTransport(lambda request: httpx.Response(200)), max_concurrency=1, max_retries=0,
+        circuit_breaker=CircuitBreaker(failure_threshold=100, reset_seconds=30),
+    )
+    transport._pool_timeout = 0.01
+    transport._slots.acquire()
+
+    with pytest.raises(httpx.PoolTimeout):
+        httpx.Client(transport=transport).post(URL)
@@ -0,0 +1,102 @@
+# Tests of the assembly of the document context of prompts
+import random
+
+import pytest
+from langchain.schema import Document
+
+from app.core import config
+from app.utils.prompt_util import (
+    _trim_overlap, assemble_prompt_documents, count_tokens, deduplicate_chunks, merge_adjacent_chunks,
+    pack_to_token_budget
+)
+
+
+@pytest.fixture(autouse=True)
+def chunk_overlap(monkeypatch):
+    monkeypatch.setattr(config, "CHUNK_OVERLAP", 50)
+
+
+def _text(seed, length=300):
+    rng = random.Random(seed)
+    return " ".join(f"w{rng.randrange(10000)}" for _ in range(length))[:length]
+
+
+def _chunks(source, text, count, size=200, overlap=50):
+    """
+    Split a text the way the splitter does: chunks of `size` characters repeating the last `overlap` characters of
+    the previous one.
+    """
+    step = size - overlap
+    return [
+        Document(page_content=text[i * step:i * step + size], metadata={"source": source, "chunk_index": i})
+        for i in range(count)
+    ]
+
+
+def test_the_overlap_of_consecutive_chunks_is_trimmed():
+    previous, following = _chunks("a.txt", _text(0, 400), 2)
+
+    assert _trim_overlap(previous.page_content, following.page_content) == following.page_content[50:]
+
+
+def test_text_without_overlap_is_unchanged():
+    assert _trim_overlap(_text(0), _text(1)) == _text(1)
+
+
+def test_identical_chunks_are_kept_once():
+    first, second = _chunks("a.txt", _text(0, 400), 2)
+    copy = Document(page_content="  ".join(first.page_content.split(" ")), metadata={"source": "b.txt"})
+
+    assert deduplicate_chunks([first, second, copy, first]) == [first, second]
+
+
+def test_adjacent_chunks_are_merged_without_repeating_their_overlap():
+    text = _text(0, 500)
+    chunks = _chunks("a.txt", text, 3)
+
+    # Retrieved out of order, with a chunk of another source ranked in between
+    other = Document(page_content=_text(1), metadata={"source": "b.txt", "chunk_index": 0})
+    passages = merge_adjacent_chunks([chunks[1], other, chunks[2], chunks[0]])
+
+    assert [passage.metadata for passage in passages] == [
+        {"source": "a.txt", "chunk_indices": [0, 1, 2]},
+        {"source": "b.txt", "chunk_indices": [0]},
+    ]
+    assert passages[0].page_content == text[:500]
+
+
+def test_non_adjacent_chunks_of_a_source_stay_separate_passages():
+    chunks = _chunks("a.txt", _text(0, 1000), 6)
+
+    passages = merge_adjacent_chunks([chunks[4], chunks[0], chunks[1]])
+
+    assert [passage.metadata["chunk_indices"] for passage in passages] == [[4], [0, 1]]
+    assert passages[0].page_content == chunks[4].page_content
+
+
+def test_passages_are_packed_best_first_within_the_budget():
+    passages = [Document(page_content=_text(seed, length), metadata={}) for seed, length in
+                [(0, 400), (1, 800), (2, 100)]]
+    budget = count_tokens(passages[0].page_content) + count_tokens(passages[2].page_content)
+
+    assert pack_to_token_budget(passages, budget) == [passages[0], passages[2]]
+
+
+def test_a_passage_exceeding_the_budget_is_truncated_when_it_is_the_best():
+    passage = Document(page_content=_text(0, 2000), metadata={"source": "a.txt"})
+
+    packed = pack_to_token_budget([passage], 50)
+
+    assert len(packed) == 1
+    assert count_tokens(packed[0].page_content) <= 50
+    assert passage.page_content.startswith(packed[0].page_content)
+    assert packed[0].metadata == {"source": "a.txt"}
+
+
+def test_assembly_reports_the_tokens_saved():
+    chunks = _chunks("a.txt", _text(0, 500), 3)
+
+    passages, stats = assemble_prompt_documents([*chunks, chunks[0]], token_budget=10000)
+
+    assert len(passages) == 1
+    assert stats["tokens_after"] < stats["tokens_before"]
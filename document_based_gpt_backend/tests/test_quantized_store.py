@@ -0,0 +1,41 @@
+# Tests of the quantized vector storage
+import numpy as np
+
+from app.db.quantized_store import create_faiss_store, add_embeddings, search_index
+
+
+def _add(vectorstore, vectors):
+    texts = [f"chunk {i}" for i in range(len(vectors))]
+    add_embeddings(vectorstore, texts, vectors, [{} for _ in texts])
+
+
+def _recall(vectorstore, vectors, queries, k=5):
+    exact = np.argsort(((queries[:, None, :] - vectors[None, :, :]) ** 2).sum(axis=2), axis=1)[:, :k]
+    _, ids = search_index(vectorstore, queries, k, rescore_factor=4)
+    return np.mean([len(set(row) & set(truth)) / k for row, truth in zip(ids, exact)])
+
+
+def test_int8_quantizer_is_retrained_when_a_store_created_with_few_vectors_grows():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2001, 64)).astype(np.float32)
+    queries = rng.standard_normal((50, 64)).astype(np.float32)
+
+    vectorstore = create_faiss_store(None, 64, "int8")
+    _add(vectorstore, vectors[:1])
+    _add(vectorstore, vectors[1:])
+
+    assert vectorstore.index.ntotal == len(vectors)
+    assert _recall(vectorstore, vectors, queries) >= 0.95
+
+
+def test_int8_quantizer_keeps_its_ranges_for_vectors_that_fit_them():
+    rng = np.random.default_rng(1)
+    vectors = rng.uniform(-1, 1, (1000, 16)).astype(np.float32)
+
+    vectorstore = create_faiss_store(None, 16, "int8")
+    _add(vectorstore, vectors)
+    index = vectorstore.index
+    _add(vectorstore, rng.uniform(-0.9, 0.9, (10, 16)).astype(np.float32))
+
+    assert vectorstore.index is index
+    assert vectorstore.index.ntotal == 1010
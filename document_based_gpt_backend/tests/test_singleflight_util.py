@@ -0,0 +1,54 @@
+# Tests of request coalescing
+import asyncio
+
+from app.utils.singleflight_util import SingleFlight
+from app.utils.trace_util import start_trace, stage
+
+
+def test_every_caller_gets_the_stage_timings_of_the_shared_computation():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        with stage("llm"):
+            await asyncio.sleep(0.05)
+        return value
+
+    async def ask():
+        trace = start_trace("/v1/query/ask/", {})
+        result = await flight.do("key", compute, 42)
+        return result, trace
+
+    async def main():
+        leader = asyncio.ensure_future(ask())
+        await asyncio.sleep(0.01)
+        return await asyncio.gather(leader, ask())
+
+    (leader_result, leader_trace), (follower_result, follower_trace) = asyncio.run(main())
+
+    assert calls == [42] and leader_result == follower_result == 42
+    assert not leader_trace.coalesced and follower_trace.coalesced
+    for trace in (leader_trace, follower_trace):
+        assert trace.timings["llm"] >= 40
+        assert [span["stage"] for span in trace.spans] == ["llm"]
+    # The follower started after the shared computation
+    assert follower_trace.spans[0]["start_ms"] < 0 <= leader_trace.spans[0]["start_ms"]
+
+
+def test_a_failed_computation_still_reports_its_stages():
+    flight = SingleFlight("test")
+
+    async def compute():
+        with stage("llm"):
+            raise TimeoutError()
+
+    async def main():
+        trace = start_trace("/v1/query/ask/", {})
+        try:
+            await flight.do("key", compute)
+        except TimeoutError:
+            return trace
+
+    trace = asyncio.run(main())
+    assert "llm" in trace.timings and not trace.coalesced
@@ -0,0 +1,33 @@
+# Tests of request tracing
+import time
+
+from app.utils.trace_util import RequestTrace, SlowRequestLog, covered_ms, _MAX_SPANS
+
+
+def _span(start_ms, duration_ms):
+    return {"stage": "llm", "start_ms": start_ms, "duration_ms": duration_ms, "thread": "MainThread"}
+
+
+def test_overlapping_spans_are_covered_once():
+    # Three queries of a batch answered concurrently, then a gap, then a span running past the end
+    spans = [_span(10, 100), _span(20, 50), _span(60, 80), _span(200, 50), _span(280, 40)]
+    assert covered_ms(spans, 300) == 130 + 50 + 20
+
+
+def test_spans_starting_before_the_request_only_count_from_its_start():
+    # A coalesced request joined a shared computation started 30 ms earlier
+    assert covered_ms([_span(-30, 50), _span(10, 5)], 100) == 20
+
+
+def test_slow_request_reports_unaccounted_time_and_dropped_spans():
+    trace = RequestTrace("/v1/query/ask/batch", {})
+    for _ in range(_MAX_SPANS + 3):
+        with trace.stage("llm"):
+            pass
+    time.sleep(0.02)
+    log = SlowRequestLog(threshold_ms=0, capacity=1)
+    assert log.record(trace, "ok")
+
+    record = log.list()[0]
+    assert len(record["spans"]) == _MAX_SPANS and record["dropped_spans"] == 3
+    assert record["unaccounted_ms"] >= 20
@@ -137,6 +137,24 @@ function Login({ onLogin }) {
   );
 }
 
+// Chunk requests in flight, by chunk id: sources citing the same chunk share one request. The chunk texts are
+// cached by the browser, which revalidates its copy (If-None-Match) on every request, since chunk ids are kept
+// when the index is rebuilt and their text may have changed.
+const pendingChunks = new Map();
+
+const fetchChunk = (chunkId, token) => {
+  if (!pendingChunks.has(chunkId)) {
+    const request = axios
+      .get(`http://localhost:8000/v1/document/chunk/${chunkId}`, {
+        headers: { Authorization: `Bearer ${token}`, "Cache-Control": "no-cache" },
+      })
+      .then((result) => result.data)
+      .finally(() => pendingChunks.delete(chunkId));
+    pendingChunks.set(chunkId, request);
+  }
+  return pendingChunks.get(chunkId);
+};
+
 function ChatBox({ token }) {
   const [query, setQuery] = useState("");
   const [response, setResponse] = useState(null);
@@ -150,7 +168,7 @@ function ChatBox({ token }) {
     try {
       const result = await axios.post(
         "http://localhost:8000/v1/query/ask/",
-        { query },
+        { query, compact_sources: true },
         {
           headers: {
             "Content-Type": "application/json",
@@ -158,7 +176,10 @@ function ChatBox({ token }) {
           },
         }
       );
-      setResponse(result.data);
+      const sources = await Promise.all(
+        result.data.sources.map((source) => fetchChunk(source.chunk_id, token))
+      );
+      setResponse({ ...result.data, sources });
     } catch (error) {
       console.error(error.response.data); // Log error for debugging
     }
@@ -177,7 +198,7 @@ function ChatBox({ token }) {
                 <ul>
                   {response.sources.map((source, index) => (
                     <li key={index} className="source-item">
-                      <p><strong>File Path:</strong> {source.file_path}</p>
+                      <p><strong>File Path:</strong> {source.source}</p>
                       <p><strong>Chunk Index:</strong> {source.chunk_index}</p>
                       <p><strong>Text:</strong> {source.text}</p>
                     </li>